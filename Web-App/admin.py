@@ -0,0 +1,151 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from auth import require_role
+from database import get_pool_metrics
+from response_cache import cache_metrics
+from query_log import query_log
+from replicas import replica_set
+from capacity import counter_reconciler
+from recommendations import recommendation_refresher
+from ratelimit import limiter
+from profiling import (
+    PROFILE_MAX_SECONDS, profile_process, start_tracemalloc, stop_tracemalloc, top_allocations
+)
+from models import User
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/db/pool")
+async def read_pool_metrics(admin: User = Depends(require_role("admin"))):
+    """Состояние пулов соединений (только для админа)"""
+    return {"pools": get_pool_metrics()}
+
+
+@router.get("/db/replicas")
+async def read_replica_status(admin: User = Depends(require_role("admin"))):
+    """Доступность реплик и распределение чтения (только для админа)"""
+    return replica_set.status()
+
+
+@router.get("/db/queries")
+async def read_query_stats(
+        sort: str = Query("total", pattern="^(total|max|count|avg|slow)$"),
+        limit: int = Query(20, ge=1, le=500),
+        admin: User = Depends(require_role("admin"))
+):
+    """SQL-выражения по отпечаткам, отсортированные по стоимости"""
+    return {**query_log.summary(), "queries": query_log.top(sort, limit)}
+
+
+@router.get("/db/slow-queries")
+async def read_slow_queries(
+        limit: int = Query(50, ge=1, le=1000),
+        admin: User = Depends(require_role("admin"))
+):
+    """Последние медленные запросы (с планом, если включён SLOW_QUERY_EXPLAIN)"""
+    return {**query_log.summary(), "slow_queries": query_log.recent_slow(limit)}
+
+
+@router.delete("/db/queries")
+async def reset_query_stats(admin: User = Depends(require_role("admin"))):
+    """Сбросить статистику запросов и журнал медленных запросов"""
+    query_log.reset()
+    return query_log.summary()
+
+
+@router.get("/chat/connections")
+async def read_chat_connections(admin: User = Depends(require_role("admin"))):
+    """WebSocket-соединения этого воркера и вытесненные медленные клиенты"""
+    from messages import active_connections, chat_broker, chat_ingest, trip_waiters
+    return {
+        **active_connections.stats(),
+        "broker": chat_broker.stats(),
+        "ingest": chat_ingest.stats(),
+        "long_poll": trip_waiters.stats(),
+    }
+
+
+@router.get("/trips/counters")
+async def read_counter_reconciliation(admin: User = Depends(require_role("admin"))):
+    """Статистика фоновой сверки счётчиков участников"""
+    return counter_reconciler.stats()
+
+
+@router.post("/trips/counters/reconcile")
+async def reconcile_trip_counters(admin: User = Depends(require_role("admin"))):
+    """Немедленно пересчитать счётчики участников и заявок"""
+    repaired = await counter_reconciler.run_once(force=True)
+    if repaired is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Trip counters are being reconciled by another worker"
+        )
+    return {**counter_reconciler.stats(), "repaired_trips": repaired}
+
+
+@router.get("/recommendations")
+async def read_recommendation_stats(admin: User = Depends(require_role("admin"))):
+    """Состояние фонового пересчёта рекомендаций"""
+    return recommendation_refresher.stats()
+
+
+@router.post("/recommendations/refresh")
+async def refresh_recommendations(admin: User = Depends(require_role("admin"))):
+    """Немедленно пересчитать рекомендации всех пользователей"""
+    stored = await recommendation_refresher.refresh_all()
+    if stored is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Recommendations are being refreshed by another worker"
+        )
+    return {**recommendation_refresher.stats(), "stored_rows": stored}
+
+
+@router.get("/ratelimit")
+async def read_rate_limits(admin: User = Depends(require_role("admin"))):
+    """Лимиты, отказы по ним и сброс нагрузки"""
+    return limiter.stats()
+
+
+@router.get("/cache/responses")
+async def read_response_cache_metrics(admin: User = Depends(require_role("admin"))):
+    """Доля попаданий и задержка ответов из кэша публичных GET-эндпоинтов"""
+    return cache_metrics()
+
+
+@router.post("/profile/process", response_class=PlainTextResponse)
+async def capture_process_profile(
+        seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+        sort: str = "cumulative",
+        admin: User = Depends(require_role("admin"))
+):
+    """Профиль потока event loop за seconds секунд (cProfile)"""
+    return await profile_process(seconds, sort)
+
+
+@router.post("/memory/tracemalloc/start")
+async def start_memory_tracing(
+        frames: int = Query(10, ge=1, le=100),
+        admin: User = Depends(require_role("admin"))
+):
+    """Включить tracemalloc (замедляет аллокации, не держать включённым постоянно)"""
+    return start_tracemalloc(frames)
+
+
+@router.post("/memory/tracemalloc/stop")
+async def stop_memory_tracing(admin: User = Depends(require_role("admin"))):
+    """Выключить tracemalloc"""
+    return stop_tracemalloc()
+
+
+@router.get("/memory/top")
+async def read_top_allocations(
+        limit: int = Query(20, ge=1, le=200),
+        group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+        compare: bool = False,
+        admin: User = Depends(require_role("admin"))
+):
+    """Топ аллокаций; compare=true - прирост с предыдущего снимка"""
+    return top_allocations(limit, group_by, compare)
@@ -1,32 +1,32 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
 import os
 
-from database import get_session
+from database import get_async_session
 from models import User
+from cache import build_cache
+from hashing import pwd_context, get_password_hash, verify_password, hash_password_async, verify_password_async
 
 # Настройки
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 30))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
 
 # Инициализация
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
+user_cache = build_cache("users", maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
 
-
-# Хеширование пароля
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-
-# Проверка пароля
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Поля пользователя, которые кэшируются (хеш пароля в кэш не попадает)
+CACHED_USER_FIELDS = [
+    column.key for column in User.__table__.columns if column.key != "hashed_password"
+]
 
 
 # Создание токена
@@ -42,10 +42,54 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return encoded_jwt
 
 
+# ID пользователя из токена (None, если токен недействителен)
+def decode_user_id(token: str):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
+        return None
+
+
+# ID пользователя из заголовка Authorization: Bearer <token> без обращения к БД
+def user_id_from_authorization(authorization: str):
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return decode_user_id(token)
+
+
+# Загрузка пользователя по ID с кэшем
+async def load_user(db: AsyncSession, user_id: int):
+    if USER_CACHE_TTL > 0:
+        cached = await user_cache.get(user_id)
+        if cached is not None:
+            # Восстанавливаем объект в сессии запроса без обращения к БД.
+            # Загружены только колонки CACHED_USER_FIELDS: hashed_password и
+            # связи (поездки, заявки, сообщения) не загружены, а обращение к ним
+            # в async-сессии падает с MissingGreenlet. Коду, которому нужно
+            # больше, пользователя надо перечитать: await db.refresh(user)
+            # (db.get вернёт этот же объект из identity map, не обращаясь к БД)
+            user = User(**cached)
+            make_transient_to_detached(user)
+            return await db.merge(user, load=False)
+
+    result = await db.execute(select(User).filter(User.id == user_id))
+    user = result.scalars().first()
+    if user is not None and USER_CACHE_TTL > 0:
+        await user_cache.set(user_id, {field: getattr(user, field) for field in CACHED_USER_FIELDS})
+    return user
+
+
+# Сброс кэша после изменения пользователя
+async def invalidate_user(user_id: int):
+    await user_cache.delete(user_id)
+
+
 # Получение текущего пользователя
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -53,15 +97,11 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
+    user_id = decode_user_id(token)
+    if user_id is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await load_user(db, user_id)
     if user is None:
         raise credentials_exception
     
@@ -81,17 +121,12 @@ def require_role(required_role: str):
 
 
 # WebSocket версия получения пользователя
-async def get_current_user_ws(token: str, db: Session):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            return None
-    except JWTError:
+async def get_current_user_ws(token: str, db: AsyncSession):
+    user_id = decode_user_id(token)
+    if user_id is None:
         return None
     
-    user = db.query(User).filter(User.id == user_id).first()
-    return user
+    return await load_user(db, user_id)
 
 
 # Роутер для аутентификации
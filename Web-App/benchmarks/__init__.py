@@ -0,0 +1,4 @@
+"""Бенчмарки и нагрузочные сценарии Travel Buddies API.
+
+Запуск из каталога Web-App, например: python -m benchmarks.async_vs_sync
+"""
@@ -0,0 +1,96 @@
+"""Сравнение задержек асинхронных роутеров с прежним синхронным путём.
+
+Синхронное приложение ниже повторяет обработчики до перехода на AsyncSession
+(db.query через database.get_session в пуле потоков). Оба приложения
+обслуживают одну и ту же базу, нагрузка подаётся через httpx в процессе.
+
+    python -m benchmarks.async_vs_sync --requests 2000 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+from typing import List, Optional
+
+from benchmarks.common import use_temp_database, seed, run_load, print_table
+
+use_temp_database("async_vs_sync")
+# Кэш ответов отдал бы асинхронному приложению готовые ответы вместо запросов к БД
+os.environ.setdefault("RESPONSE_CACHE_TTL", "0")
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy.orm import Session
+
+from database import Base, engine, SessionLocal, get_session
+from models import Trip, User
+import main
+import schemas
+
+
+def build_sync_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/v1/trips/", response_model=List[schemas.TripResponse])
+    def list_trips(skip: int = 0, limit: int = 100, destination: Optional[str] = None,
+                   db: Session = Depends(get_session)):
+        query = db.query(Trip)
+        if destination:
+            query = query.filter(Trip.destination.ilike(f"%{destination}%"))
+        return query.order_by(Trip.start_date).offset(skip).limit(limit).all()
+
+    @app.get("/api/v1/trips/{trip_id}", response_model=schemas.TripWithParticipants)
+    def get_trip(trip_id: int, db: Session = Depends(get_session)):
+        trip = db.query(Trip).filter(Trip.id == trip_id).first()
+        if not trip:
+            raise HTTPException(status_code=404)
+        return trip
+
+    @app.get("/api/v1/users/{user_id}", response_model=schemas.UserResponse)
+    def read_user(user_id: int, db: Session = Depends(get_session)):
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise HTTPException(status_code=404)
+        return user
+
+    return app
+
+
+async def bench(app: FastAPI, label: str, requests: int, concurrency: int, trips: int, users: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        return [
+            await run_load(client, f"{label} GET /trips/?limit=50",
+                           lambda n: client.get("/api/v1/trips/", params={"limit": 50}),
+                           requests, concurrency),
+            await run_load(client, f"{label} GET /trips/{{id}}",
+                           lambda n: client.get(f"/api/v1/trips/{n % trips + 1}"),
+                           requests, concurrency),
+            await run_load(client, f"{label} GET /users/{{id}}",
+                           lambda n: client.get(f"/api/v1/users/{n % users + 1}"),
+                           requests, concurrency),
+        ]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--trips", type=int, default=500)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        if db.query(Trip).count() == 0:
+            seed(db, users=args.users, trips=args.trips)
+
+    async def run():
+        rows = await bench(build_sync_app(), "sync ", args.requests, args.concurrency, args.trips, args.users)
+        rows += await bench(main.app, "async", args.requests, args.concurrency, args.trips, args.users)
+        return rows
+
+    print_table(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main_cli()
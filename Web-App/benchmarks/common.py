@@ -0,0 +1,137 @@
+"""Общие помощники бенчмарков: временная БД, наполнение данными, нагрузка"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+
+def use_temp_database(name: str = "bench") -> str:
+    """Направляет приложение во временную SQLite-базу.
+
+    Вызывать до первого импорта database/main: движки создаются при импорте.
+    """
+    # Нагрузка идёт от одного клиента: лимиты частоты исказили бы замеры
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    if "DATABASE_URL" not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(prefix="travel-"), f"{name}.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    return os.environ["DATABASE_URL"]
+
+
+def seed(db, users: int = 200, trips: int = 500, participants: int = 4, messages: int = 20) -> Dict[str, int]:
+    """Наполняет базу синтетическими данными через синхронную сессию"""
+    from models import User, UserRole, Trip, TripStatus, TripMessage, trip_participants, trip_search_fields
+    from sqlalchemy import text
+
+    rnd = random.Random(42)
+    destinations = ["Paris", "Rome", "Tbilisi", "Kazan", "Baikal", "Altai", "Sochi", "Istanbul"]
+    now = datetime.now()
+
+    db.bulk_insert_mappings(User, [
+        {
+            "id": i,
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "hashed_password": "x",
+            "role": UserRole.ORGANIZER if i % 10 == 1 else UserRole.TRAVELER,
+            "rating": round(rnd.uniform(0, 5), 2),
+        }
+        for i in range(1, users + 1)
+    ])
+    trip_rows = []
+    for i in range(1, trips + 1):
+        row = {
+            "id": i,
+            "title": f"Trip #{i}",
+            "description": "Synthetic trip generated for benchmarks",
+            "destination": rnd.choice(destinations),
+            "start_date": now + timedelta(days=rnd.randint(1, 365)),
+            "end_date": now + timedelta(days=rnd.randint(366, 400)),
+            "max_participants": participants + 2,
+            "cost_per_person": rnd.uniform(100, 3000),
+            "status": rnd.choice([TripStatus.RECRUITING, TripStatus.PLANNING, TripStatus.CONFIRMED]),
+            "organizer_id": rnd.randint(1, users),
+            "participant_count": min(participants, users),
+        }
+        row.update(trip_search_fields(row["title"], row["description"], row["destination"]))
+        trip_rows.append(row)
+    db.bulk_insert_mappings(Trip, trip_rows)
+    members = []
+    for trip_id in range(1, trips + 1):
+        for user_id in rnd.sample(range(1, users + 1), min(participants, users)):
+            members.append({"trip_id": trip_id, "user_id": user_id})
+    db.execute(trip_participants.insert(), members)
+    db.bulk_insert_mappings(TripMessage, [
+        {
+            "trip_id": trip_id,
+            "author_id": members[(trip_id - 1) * participants + n % participants]["user_id"],
+            "content": f"message {n}",
+            "created_at": now + timedelta(seconds=n),
+        }
+        for trip_id in range(1, trips + 1)
+        for n in range(messages)
+    ])
+    if db.bind.dialect.name == "postgresql":
+        # Явные id не двигают последовательности: новые строки получили бы занятые ключи
+        for table in ("users", "trips"):
+            db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"))
+    db.commit()
+    return {"users": users, "trips": trips, "messages": trips * messages}
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(name: str, latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, float]:
+    return {
+        "name": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def print_table(rows: List[Dict[str, float]]) -> None:
+    print(f"{'scenario':<40} {'reqs':>6} {'err':>4} {'rps':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for row in rows:
+        print(
+            f"{row['name']:<40} {row['requests']:>6} {row['errors']:>4} "
+            f"{row['rps']:>9.1f} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+        )
+
+
+async def run_load(
+    client,
+    name: str,
+    make_request: Callable[[int], "asyncio.Future"],
+    requests: int = 500,
+    concurrency: int = 50,
+    expected: Optional[int] = 200,
+) -> Dict[str, float]:
+    """Прогоняет requests запросов с заданной конкурентностью и возвращает сводку"""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for n in counter:
+            started = time.perf_counter()
+            response = await make_request(n)
+            latencies.append(time.perf_counter() - started)
+            if expected is not None and response.status_code != expected:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, latencies, time.perf_counter() - started, errors)
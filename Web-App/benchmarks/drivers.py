@@ -0,0 +1,170 @@
+"""Способы подключения к приложению для нагрузочных сценариев.
+
+- InProcessDriver - main.app в том же процессе: HTTP через httpx.ASGITransport,
+  WebSocket через минимальный ASGI-клиент. Без сети и сериализации в сокет.
+- UvicornDriver - настоящий uvicorn в дочернем процессе: HTTP через httpx,
+  WebSocket через пакет websockets.
+
+Оба драйвера дают одинаковый интерфейс: client (httpx.AsyncClient) и
+websocket(path) - асинхронный контекст с send_text/receive_text.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+WEB_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ASGIWebSocket:
+    """WebSocket-клиент, вызывающий ASGI-приложение напрямую"""
+
+    def __init__(self, app, path: str):
+        url = urlsplit(path)
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": url.path,
+            "raw_path": url.path.encode(),
+            "query_string": url.query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 0),
+            "server": ("bench", 80),
+            "subprotocols": [],
+        }
+        self.app = app
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._from_app: asyncio.Queue = asyncio.Queue()
+        self._task = None
+
+    async def connect(self):
+        self._task = asyncio.create_task(self.app(self.scope, self._to_app.get, self._from_app.put))
+        await self._to_app.put({"type": "websocket.connect"})
+        message = await self._from_app.get()
+        if message["type"] != "websocket.accept":
+            raise ConnectionError(f"WebSocket rejected: {message}")
+
+    async def send_text(self, text: str):
+        await self._to_app.put({"type": "websocket.receive", "text": text})
+
+    async def receive_text(self) -> str:
+        message = await self._from_app.get()
+        if message["type"] == "websocket.close":
+            raise ConnectionError(f"WebSocket closed: {message.get('code')}")
+        return message["text"]
+
+    async def close(self):
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        try:
+            await asyncio.wait_for(self._task, 5)
+        except (asyncio.TimeoutError, Exception):
+            self._task.cancel()
+
+
+class InProcessDriver:
+    name = "inprocess"
+
+    def __init__(self, headers: dict = None):
+        import main
+        self.app = main.app
+        self.headers = headers or {}
+        self.client = None
+        self._lifespan = None
+
+    async def __aenter__(self):
+        from main import lifespan
+        self._lifespan = lifespan(self.app)
+        await self._lifespan.__aenter__()
+        transport = httpx.ASGITransport(app=self.app)
+        self.client = httpx.AsyncClient(transport=transport, base_url="http://bench", headers=self.headers)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        await self._lifespan.__aexit__(*exc)
+
+    @asynccontextmanager
+    async def websocket(self, path: str):
+        ws = ASGIWebSocket(self.app, path)
+        await ws.connect()
+        try:
+            yield ws
+        finally:
+            await ws.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class UvicornDriver:
+    name = "uvicorn"
+
+    def __init__(self, headers: dict = None, workers: int = 1, startup_timeout: float = 30):
+        self.headers = headers or {}
+        self.workers = workers
+        self.startup_timeout = startup_timeout
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.client = None
+        self._process = None
+
+    async def __aenter__(self):
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=WEB_APP_DIR, env=dict(os.environ)
+        )
+        self.client = httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=30)
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            try:
+                await self.client.get("/health")
+                break
+            except httpx.TransportError:
+                if self._process.poll() is not None or time.monotonic() > deadline:
+                    self._process.kill()
+                    raise RuntimeError("uvicorn did not start")
+                await asyncio.sleep(0.2)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        self._process.terminate()
+        try:
+            self._process.wait(10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+
+    @asynccontextmanager
+    async def websocket(self, path: str):
+        try:
+            import websockets
+        except ImportError as e:
+            raise RuntimeError("WebSocket scenarios over uvicorn require the 'websockets' package") from e
+        async with websockets.connect(f"ws://127.0.0.1:{self.port}{path}") as ws:
+            yield _WebsocketsAdapter(ws)
+
+
+class _WebsocketsAdapter:
+    def __init__(self, ws):
+        self.ws = ws
+
+    async def send_text(self, text: str):
+        await self.ws.send(text)
+
+    async def receive_text(self) -> str:
+        return await self.ws.recv()
+
+
+DRIVERS = {"inprocess": InProcessDriver, "uvicorn": UvicornDriver}
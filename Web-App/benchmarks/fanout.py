@@ -0,0 +1,122 @@
+"""Задержка рассылки события в комнату из 1000 WebSocket-соединений.
+
+Соединения имитируются объектами с send_text: у большинства небольшая
+задержка отправки, часть клиентов медленные, часть - мёртвые. Замеряется
+время от broadcast до получения события последним здоровым клиентом
+для прежней последовательной рассылки и для очередей connections.py.
+
+    python -m benchmarks.fanout --sockets 1000 --messages 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks.common import percentile
+
+from connections import ConnectionManager
+
+
+class FakeSocket:
+    def __init__(self, kind: str, rnd: random.Random):
+        self.kind = kind
+        self.delay = {"fast": rnd.uniform(0.0001, 0.001), "slow": 0.5, "dead": 0}[kind]
+        self.received = {}
+
+    async def send_text(self, text: str):
+        if self.kind == "dead":
+            raise RuntimeError("connection reset")
+        await asyncio.sleep(self.delay)
+        self.received[json.loads(text)["seq"]] = time.perf_counter()
+
+    async def send_json(self, message: dict):
+        await self.send_text(json.dumps(message))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def delivered(fast: list, messages: int) -> float:
+    """Доля событий, дошедших до здоровых клиентов"""
+    return sum(len(s.received) for s in fast) / (len(fast) * messages) if fast else 0.0
+
+
+def make_sockets(count: int, slow: float, dead: float) -> list:
+    rnd = random.Random(7)
+    sockets = []
+    for _ in range(count):
+        roll = rnd.random()
+        kind = "dead" if roll < dead else "slow" if roll < dead + slow else "fast"
+        sockets.append(FakeSocket(kind, rnd))
+    return sockets
+
+
+async def sequential(sockets: list, messages: int, interval: float) -> list:
+    """Прежняя рассылка: await send_json по очереди, исключение прерывает цикл"""
+    latencies = []
+    fast = [s for s in sockets if s.kind == "fast"]
+    for seq in range(messages):
+        started = time.perf_counter()
+        try:
+            for socket in sockets:
+                await socket.send_json({"seq": seq})
+        except RuntimeError:
+            pass
+        healthy = [s.received[seq] for s in fast if seq in s.received]
+        latencies.append((max(healthy) if healthy else time.perf_counter()) - started)
+        await asyncio.sleep(interval)
+    return latencies, delivered(fast, messages)
+
+
+async def queued(sockets: list, messages: int, interval: float, policy: str) -> tuple:
+    manager = ConnectionManager(queue_size=16, send_timeout=1.0, policy=policy)
+    for socket in sockets:
+        manager.add(1, socket)
+    fast = [s for s in sockets if s.kind == "fast"]
+    latencies = []
+    for seq in range(messages):
+        started = time.perf_counter()
+        manager.broadcast(1, {"seq": seq})
+        while any(seq not in s.received for s in fast):
+            await asyncio.sleep(0.0005)
+        latencies.append(max(s.received[seq] for s in fast) - started)
+        await asyncio.sleep(interval)
+    stats = manager.stats()
+    for room in list(manager.rooms.values()):
+        for connection in list(room):
+            await manager.remove(connection)
+    return latencies, delivered(fast, messages), stats
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sockets", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--slow", type=float, default=0.01, help="доля медленных клиентов")
+    parser.add_argument("--dead", type=float, default=0.005, help="доля мёртвых клиентов")
+    parser.add_argument("--interval", type=float, default=0.01)
+    parser.add_argument("--policy", default="disconnect")
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    async def run():
+        rows = []
+        if not args.skip_sequential:
+            latencies, ratio = await sequential(
+                make_sockets(args.sockets, args.slow, args.dead), args.messages, args.interval)
+            rows.append(("sequential send_json", latencies, ratio, None))
+        latencies, ratio, stats = await queued(
+            make_sockets(args.sockets, args.slow, args.dead), args.messages, args.interval, args.policy)
+        rows.append((f"queued ({args.policy})", latencies, ratio, stats))
+        return rows
+
+    print(f"{args.sockets} sockets, {args.messages} messages, slow={args.slow}, dead={args.dead}")
+    print(f"{'mode':<28} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'delivered':>10}  stats")
+    for name, latencies, ratio, stats in asyncio.run(run()):
+        print(f"{name:<28} {percentile(latencies, 50) * 1000:>9.2f} {percentile(latencies, 99) * 1000:>9.2f} "
+              f"{max(latencies) * 1000:>9.2f} {ratio:>10.1%}  {stats or ''}")
+
+
+if __name__ == "__main__":
+    main_cli()
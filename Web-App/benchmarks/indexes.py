@@ -0,0 +1,104 @@
+"""Планы и время запросов до и после миграции v001_composite_indexes.
+
+Наполняет базу синтетическими данными, откатывает миграцию индексов,
+снимает EXPLAIN и время основных запросов, затем применяет миграцию
+и повторяет замеры.
+
+    python -m benchmarks.indexes --trips 50000 --messages 20
+    DATABASE_URL=postgresql://... python -m benchmarks.indexes
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import use_temp_database, seed
+
+use_temp_database("indexes")
+
+from sqlalchemy import select, exists, and_
+
+from database import Base, engine, SessionLocal
+from models import Trip, TripMessage, trip_participants
+from migrations import v001_composite_indexes as migration
+
+
+def query_shapes(trip_id: int, user_id: int):
+    now = datetime.now()
+    return [
+        ("chat history page", select(TripMessage.id, TripMessage.content, TripMessage.created_at)
+         .where(TripMessage.trip_id == trip_id)
+         .order_by(TripMessage.created_at, TripMessage.id).limit(100)),
+        ("trips by status and dates", select(Trip.id, Trip.title)
+         .where(and_(Trip.status == "RECRUITING",
+                     Trip.start_date >= now + timedelta(days=30),
+                     Trip.start_date <= now + timedelta(days=60)))
+         .order_by(Trip.start_date, Trip.id).limit(100)),
+        ("trips first page", select(Trip.id, Trip.title).order_by(Trip.start_date, Trip.id).limit(100)),
+        ("membership check", select(exists().where(and_(
+            trip_participants.c.trip_id == trip_id, trip_participants.c.user_id == user_id)))),
+        ("trips of a user", select(trip_participants.c.trip_id).where(trip_participants.c.user_id == user_id)),
+    ]
+
+
+def explain(connection, statement) -> list:
+    compiled = statement.compile(dialect=connection.dialect)
+    params = compiled.params
+    if compiled.positiontup:
+        params = tuple(params[name] for name in compiled.positiontup)
+    if connection.dialect.name == "sqlite":
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params).fetchall()
+        return [row[-1] for row in rows]
+    rows = connection.exec_driver_sql("EXPLAIN ANALYZE " + str(compiled), params).fetchall()
+    return [row[0] for row in rows]
+
+
+def measure(connection, statement, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        connection.execute(statement).fetchall()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def report(label: str, repeat: int, trip_id: int, user_id: int) -> dict:
+    print(f"\n===== {label} =====")
+    timings = {}
+    with engine.connect() as connection:
+        for name, statement in query_shapes(trip_id, user_id):
+            timings[name] = measure(connection, statement, repeat)
+            print(f"\n-- {name}: {timings[name]:.3f} ms")
+            for line in explain(connection, statement):
+                print("   ", line)
+    return timings
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--trips", type=int, default=50000)
+    parser.add_argument("--participants", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        if db.query(Trip).count() == 0:
+            print(seed(db, users=args.users, trips=args.trips,
+                       participants=args.participants, messages=args.messages))
+        member = db.execute(select(trip_participants).limit(1)).first()
+
+    with engine.begin() as connection:
+        migration.downgrade(connection)
+    before = report("before (no composite indexes)", args.repeat, member.trip_id, member.user_id)
+
+    with engine.begin() as connection:
+        migration.upgrade(connection)
+    after = report("after v001_composite_indexes", args.repeat, member.trip_id, member.user_id)
+
+    print(f"\n{'query':<30} {'before ms':>10} {'after ms':>10}")
+    for name in before:
+        print(f"{name:<30} {before[name]:>10.3f} {after[name]:>10.3f}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,104 @@
+"""Задержка страницы в зависимости от глубины: OFFSET против курсора.
+
+Для каждой глубины запрашивается страница из 100 строк сначала через
+skip, затем через курсор, указывающий на ту же позицию. При keyset-
+пагинации задержка не должна расти с глубиной.
+
+    python -m benchmarks.pagination --trips 50000 --messages 50000
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+
+from benchmarks.common import use_temp_database, seed, run_load, print_table
+
+use_temp_database("pagination")
+
+import httpx
+from sqlalchemy import select
+
+from auth import create_access_token
+from database import Base, engine, SessionLocal
+from models import Trip, TripMessage, User
+from pagination import encode_cursor
+import main
+
+PAGE = 100
+
+
+def add_long_chat(db, trip_id: int, author_id: int, count: int):
+    started = datetime.now()
+    db.bulk_insert_mappings(TripMessage, [
+        {
+            "trip_id": trip_id,
+            "author_id": author_id,
+            "content": f"history {n}",
+            "created_at": started + timedelta(milliseconds=n),
+        }
+        for n in range(count)
+    ])
+    db.commit()
+
+
+def cursor_at(db, query, key, depth: int) -> str:
+    row = db.execute(query.offset(depth - 1).limit(1)).scalars().first()
+    return encode_cursor(*key(row))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trips", type=int, default=20000)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        seed(db, users=args.users, trips=args.trips, participants=2, messages=0)
+        trip = db.get(Trip, 1)
+        add_long_chat(db, trip.id, trip.organizer_id, args.messages)
+        token = create_access_token({"sub": str(trip.organizer_id)})
+
+        targets = []
+        for name, path, total, query, key in [
+            ("trips", "/api/v1/trips/", args.trips,
+             select(Trip).order_by(Trip.start_date, Trip.id),
+             lambda row: (row.start_date, row.id)),
+            ("users", "/api/v1/users/", args.users,
+             select(User).order_by(User.id),
+             lambda row: (row.id,)),
+            ("messages", f"/api/v1/messages/trip/{trip.id}", args.messages,
+             select(TripMessage).filter(TripMessage.trip_id == trip.id)
+             .order_by(TripMessage.created_at, TripMessage.id),
+             lambda row: (row.created_at, row.id)),
+        ]:
+            for depth in (0, total // 100, total // 10, total // 2, total - PAGE):
+                cursor = cursor_at(db, query, key, depth) if depth > 0 else None
+                targets.append((name, path, depth, cursor))
+
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def run():
+        rows = []
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+            for name, path, depth, cursor in targets:
+                rows.append(await run_load(
+                    client, f"{name} offset depth={depth}",
+                    lambda n: client.get(path, params={"skip": depth, "limit": PAGE}),
+                    args.repeat, 1
+                ))
+                cursor_params = {"limit": PAGE, **({"cursor": cursor} if cursor else {})}
+                rows.append(await run_load(
+                    client, f"{name} cursor depth={depth}",
+                    lambda n: client.get(path, params=cursor_params),
+                    args.repeat, 1
+                ))
+        return rows
+
+    print_table(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,98 @@
+"""Проверка бюджета SQL-запросов на эндпоинт.
+
+Считает выражения, которые движок отправляет в БД за один HTTP-запрос,
+и завершается с кодом 1, если какой-либо эндпоинт превысил бюджет.
+Ловит N+1: число запросов не должно зависеть от размера страницы.
+Те же бюджеты проверяет tests/test_query_budget.py (python -m pytest).
+
+    python -m benchmarks.query_budget
+"""
+import argparse
+import asyncio
+import sys
+from contextlib import contextmanager
+
+from benchmarks.common import use_temp_database, seed
+
+use_temp_database("query_budget")
+
+import httpx
+from sqlalchemy import event
+
+from auth import create_access_token
+from database import Base, engine, async_engine, SessionLocal
+from models import Trip
+import main
+
+# Метод, путь, нужен ли токен, допустимое число SQL-выражений
+BUDGETS = [
+    ("GET", "/api/v1/trips/?limit=100", False, 1),
+    ("GET", "/api/v1/trips/1", False, 2),
+    ("GET", "/api/v1/trips/1/participants", False, 2),
+    ("GET", "/api/v1/users/?limit=100", False, 1),
+    ("GET", "/api/v1/users/1", False, 1),
+    ("GET", "/api/v1/users/me", True, 1),
+    ("GET", "/api/v1/messages/trip/1?limit=100", True, 3),
+]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(target_engine=None):
+    """Считает SQL-выражения, выполненные движком внутри блока"""
+    sync_engine = (target_engine or async_engine).sync_engine
+    counter = QueryCounter()
+    event.listen(sync_engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", counter)
+
+
+async def check_budgets(verbose: bool) -> int:
+    with SessionLocal() as db:
+        organizer_id = db.get(Trip, 1).organizer_id
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(organizer_id)})}"}
+
+    failures = 0
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for method, path, needs_auth, budget in BUDGETS:
+            with count_queries() as counter:
+                response = await client.request(method, path, headers=headers if needs_auth else None)
+            over = counter.count > budget
+            failures += over or response.status_code != 200
+            print(f"{'FAIL' if over else 'ok  '} {method} {path:<40} {response.status_code} "
+                  f"{counter.count:>3} / {budget}")
+            if verbose or over:
+                for statement in counter.statements:
+                    print("       ", " ".join(statement.split())[:150])
+    return failures
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="печатать выполненные выражения")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        seed(db, users=50, trips=20, participants=5, messages=100)
+
+    failures = asyncio.run(check_budgets(args.verbose))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,125 @@
+"""Нагрузочные сценарии suite: поиск, карточка поездки, история и отправка в чат, рассылка по WebSocket.
+
+Каждый сценарий - async-функция (driver, context, requests, concurrency) -> сводка
+summarize(): число запросов, ошибки, rps, p50 и p99.
+"""
+import asyncio
+import json
+import random
+import time
+from contextlib import AsyncExitStack
+from typing import Dict, List
+
+from sqlalchemy import select
+
+from benchmarks.common import run_load, summarize
+
+
+class BenchContext:
+    """Поездки набора данных и токены их организаторов"""
+
+    def __init__(self, trips: List[tuple], words: List[str], seed: int = 42):
+        self.trips = trips
+        self.words = words
+        self.rnd = random.Random(seed)
+        self._tokens: Dict[int, str] = {}
+
+    @classmethod
+    def load(cls, db, limit: int = 1000) -> "BenchContext":
+        from models import Trip
+        trips = db.execute(select(Trip.id, Trip.organizer_id).order_by(Trip.id).limit(limit)).all()
+        words = db.execute(select(Trip.destination).distinct()).scalars().all()
+        return cls([tuple(row) for row in trips], [word.lower() for word in words if word])
+
+    def trip(self) -> tuple:
+        return self.rnd.choice(self.trips)
+
+    def auth(self, user_id: int) -> dict:
+        from auth import create_access_token
+        if user_id not in self._tokens:
+            self._tokens[user_id] = create_access_token({"sub": str(user_id)})
+        return {"Authorization": f"Bearer {self._tokens[user_id]}"}
+
+
+async def trip_search(driver, context: BenchContext, requests: int, concurrency: int) -> dict:
+    def request(n: int):
+        params = {"q": context.words[n % len(context.words)], "limit": 20, "skip": (n // len(context.words)) % 5 * 20}
+        return driver.client.get("/api/v1/trips/", params=params)
+    return await run_load(driver.client, "trip search", request, requests, concurrency)
+
+
+async def trip_detail(driver, context: BenchContext, requests: int, concurrency: int) -> dict:
+    def request(n: int):
+        trip_id, _ = context.trip()
+        return driver.client.get(f"/api/v1/trips/{trip_id}")
+    return await run_load(driver.client, "trip detail", request, requests, concurrency)
+
+
+async def chat_history(driver, context: BenchContext, requests: int, concurrency: int) -> dict:
+    def request(n: int):
+        trip_id, organizer_id = context.trip()
+        return driver.client.get(
+            f"/api/v1/messages/trip/{trip_id}", params={"limit": 50}, headers=context.auth(organizer_id)
+        )
+    return await run_load(driver.client, "chat history", request, requests, concurrency)
+
+
+async def chat_send(driver, context: BenchContext, requests: int, concurrency: int) -> dict:
+    def request(n: int):
+        trip_id, organizer_id = context.trip()
+        return driver.client.post(
+            f"/api/v1/messages/trip/{trip_id}", json={"content": f"bench message {n}"},
+            headers=context.auth(organizer_id)
+        )
+    return await run_load(driver.client, "chat send", request, requests, concurrency)
+
+
+async def ws_fanout(driver, context: BenchContext, requests: int, concurrency: int) -> dict:
+    """concurrency сокетов в одной комнате; requests сообщений от первого сокета.
+
+    Задержка сообщения - время до его получения последним сокетом.
+    """
+    trip_id, organizer_id = context.trips[0]
+    token = context.auth(organizer_id)["Authorization"].split()[1]
+    path = f"/api/v1/messages/ws/trip/{trip_id}?token={token}"
+    pending: Dict[str, list] = {}
+
+    async def listen(ws):
+        while True:
+            event = json.loads(await ws.receive_text())
+            waiter = pending.get(event.get("content"))
+            if waiter is not None:
+                waiter[0] -= 1
+                if waiter[0] == 0:
+                    waiter[1].set()
+
+    async with AsyncExitStack() as stack:
+        sockets = [await stack.enter_async_context(driver.websocket(path)) for _ in range(concurrency)]
+        listeners = [asyncio.create_task(listen(ws)) for ws in sockets]
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for n in range(requests):
+            content = f"fanout {time.time_ns()} {n}"
+            done = asyncio.Event()
+            pending[content] = [len(sockets), done]
+            sent = time.perf_counter()
+            await sockets[0].send_text(json.dumps({"content": content}))
+            try:
+                await asyncio.wait_for(done.wait(), 10)
+                latencies.append(time.perf_counter() - sent)
+            except asyncio.TimeoutError:
+                errors += 1
+            del pending[content]
+        elapsed = time.perf_counter() - started
+        for listener in listeners:
+            listener.cancel()
+    return summarize(f"ws fanout x{concurrency}", latencies, elapsed, errors)
+
+
+SCENARIOS = {
+    "search": trip_search,
+    "detail": trip_detail,
+    "history": chat_history,
+    "send": chat_send,
+    "fanout": ws_fanout,
+}
@@ -0,0 +1,96 @@
+"""Стоимость сериализации одной страницы: обычный путь FastAPI против быстрого.
+
+Обычный путь - ORM-объекты, валидация через response_model и JSONResponse.
+Быстрый (FAST_SERIALIZATION=1) - строки из выборки колонок, RowSerializer
+и orjson. Сравнивается только сериализация уже загруженной страницы;
+результаты обоих путей сверяются.
+
+    python -m benchmarks.serialization --page 100 --repeat 200
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+from benchmarks.common import use_temp_database, seed
+
+use_temp_database("serialization")
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import select
+
+from database import Base, engine, SessionLocal
+from loaders import loader_options
+from models import Trip, TripMessage, User
+from serialization import RowSerializer, schema_columns, orjson
+import schemas
+
+
+def pages(db, size: int) -> list:
+    """(название, схема, ORM-объекты, строки колонок) для трёх списков"""
+    message_columns = (
+        *schema_columns(schemas.TripMessageWithAuthor, TripMessage),
+        *schema_columns(schemas.UserResponse, User, prefix="author__"),
+    )
+    return [
+        ("trips", schemas.TripResponse,
+         db.execute(select(Trip).order_by(Trip.id).limit(size)).scalars().all(),
+         db.execute(select(*schema_columns(schemas.TripResponse, Trip)).order_by(Trip.id).limit(size)).all()),
+        ("users", schemas.UserResponse,
+         db.execute(select(User).order_by(User.id).limit(size)).scalars().all(),
+         db.execute(select(*schema_columns(schemas.UserResponse, User)).order_by(User.id).limit(size)).all()),
+        ("messages", schemas.TripMessageWithAuthor,
+         db.execute(select(TripMessage).options(*loader_options(schemas.TripMessageWithAuthor))
+                    .order_by(TripMessage.id).limit(size)).scalars().all(),
+         db.execute(select(*message_columns).join(TripMessage.author)
+                    .order_by(TripMessage.id).limit(size)).all()),
+    ]
+
+
+def default_path(loop, schema):
+    field = create_response_field(name="response", type_=List[schema])
+
+    def render(objects) -> bytes:
+        content = loop.run_until_complete(serialize_response(field=field, response_content=objects))
+        return JSONResponse(content).body
+
+    return render
+
+
+def measure(render, page, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        render(page)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    loop = asyncio.new_event_loop()
+    with SessionLocal() as db:
+        if not db.query(User).first():
+            seed(db, users=args.page * 2, trips=args.page * 2, participants=4, messages=1)
+
+        print(f"page={args.page} repeat={args.repeat} orjson={'yes' if orjson else 'no'}")
+        print(f"{'list':<10} {'default ms':>11} {'fast ms':>9} {'speedup':>8}")
+        for name, schema, objects, rows in pages(db, args.page):
+            default_render = default_path(loop, schema)
+            fast_render = RowSerializer(schema).render
+            if json.loads(default_render(objects)) != json.loads(fast_render(rows)):
+                raise SystemExit(f"{name}: fast path output differs from the default path")
+            default_ms = measure(default_render, objects, args.repeat)
+            fast_ms = measure(fast_render, rows, args.repeat)
+            print(f"{name:<10} {default_ms:>11.3f} {fast_ms:>9.3f} {default_ms / fast_ms:>7.1f}x")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,84 @@
+"""Пропускная способность регистрации с пулом процессов bcrypt и без него.
+
+Режим "threads" повторяет прежнее поведение (хеширование в пуле потоков
+процесса), режим "processes" - отдельный пул процессов hashing.HashingPool.
+Параллельно с регистрациями опрашивается /health: его задержка показывает,
+насколько хеширование мешает остальным запросам воркера.
+
+    BCRYPT_ROUNDS=12 python -m benchmarks.signup --signups 200 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.common import use_temp_database, run_load, print_table, summarize
+
+use_temp_database("signup")
+
+import httpx
+
+from database import Base, engine
+import hashing
+import main
+
+
+async def probe_health(client, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/health")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+
+async def bench_mode(mode: str, workers: int, signups: int, concurrency: int):
+    hashing.hashing_pool.shutdown()
+    hashing.hashing_pool = hashing.HashingPool(
+        workers=workers if mode == "processes" else 0,
+        queue_limit=signups
+    )
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        # Прогрев: запуск процессов пула не входит в замер
+        await hashing.hash_password_async("warmup-password")
+
+        stop = asyncio.Event()
+        health = []
+        started = time.perf_counter()
+        prober = asyncio.create_task(probe_health(client, stop, health))
+        row = await run_load(
+            client, f"{mode:<9} POST /users/",
+            lambda n: client.post("/api/v1/users/", json={
+                "username": f"{mode}{n}",
+                "email": f"{mode}{n}@example.com",
+                "password": "benchmark-password",
+            }),
+            signups, concurrency, expected=201
+        )
+        stop.set()
+        await prober
+        elapsed = time.perf_counter() - started
+    hashing.hashing_pool.shutdown()
+    return [row, summarize(f"{mode:<9} GET /health during signups", health, elapsed)]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--signups", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    print(f"bcrypt rounds: {hashing.BCRYPT_ROUNDS}, process workers: {args.workers}")
+
+    async def run():
+        rows = await bench_mode("threads", args.workers, args.signups, args.concurrency)
+        rows += await bench_mode("processes", args.workers, args.signups, args.concurrency)
+        return rows
+
+    print_table(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,153 @@
+"""Нагрузочный прогон API со сравнением с сохранённым baseline.
+
+Наполняет базу синтетическими данными заданного масштаба (SQLite во
+временном каталоге или DATABASE_URL, например локальный Postgres), поднимает
+приложение в процессе или через uvicorn и прогоняет сценарии: поиск поездок,
+карточка поездки, история чата, отправка в чат, рассылка по WebSocket.
+
+    python -m benchmarks.suite --scale small --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --scale small --baseline benchmarks/baseline.json
+    DATABASE_URL=postgresql://... python -m benchmarks.suite --driver uvicorn --scale large
+
+С --baseline код выхода 1, если p50/p99 выросли или rps упал больше
+чем на --tolerance относительно baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+from datetime import datetime
+
+from benchmarks.common import use_temp_database, seed, print_table
+
+use_temp_database("suite")
+# Кэш ответов спрятал бы запросы к БД; включается флагом --with-cache
+os.environ.setdefault("RESPONSE_CACHE_TTL", "0")
+# Сценарий fanout открывает все сокеты от имени одного пользователя
+os.environ.setdefault("CHAT_MAX_CONNECTIONS_PER_USER", "0")
+# Фоновый пересчёт рекомендаций после наполнения базы исказил бы замеры
+os.environ.setdefault("RECOMMENDATIONS_REFRESH_INTERVAL", "0")
+
+SCALES = {
+    "small": {"users": 500, "trips": 2000, "participants": 4, "messages": 20},
+    "medium": {"users": 5000, "trips": 20000, "participants": 5, "messages": 30},
+    "large": {"users": 50000, "trips": 200000, "participants": 6, "messages": 50},
+}
+
+METRICS = {"p50_ms": "lower", "p99_ms": "lower", "rps": "higher"}
+
+
+def prepare_database(scale: dict, reseed: bool):
+    from database import Base, engine, SessionLocal
+    from migrations import upgrade
+    from models import User
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        upgrade(connection)
+    with SessionLocal() as db:
+        if reseed or not db.query(User).first():
+            print(f"seeding {scale}")
+            seed(db, **scale)
+
+        from benchmarks.scenarios import BenchContext
+        return BenchContext.load(db)
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """Строки (сценарий, метрика, baseline, сейчас, изменение, регрессия)"""
+    rows = []
+    for result in results:
+        base = baseline.get("results", {}).get(result["name"])
+        if not base:
+            continue
+        for metric, better in METRICS.items():
+            before, after = base[metric], result[metric]
+            if not before:
+                continue
+            change = (after - before) / before
+            regressed = change > tolerance if better == "lower" else change < -tolerance
+            rows.append((result["name"], metric, before, after, change, regressed))
+    return rows
+
+
+def print_comparison(rows: list):
+    print(f"\n{'scenario':<28} {'metric':<8} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, metric, before, after, change, regressed in rows:
+        print(f"{name:<28} {metric:<8} {before:>10.2f} {after:>10.2f} {change:>+8.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+
+
+def main_cli():
+    from benchmarks.scenarios import SCENARIOS
+    from benchmarks.drivers import DRIVERS
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--reseed", action="store_true", help="наполнить базу, даже если она не пуста")
+    parser.add_argument("--driver", choices=DRIVERS, default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="воркеры uvicorn")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=50, help="неучитываемых запросов перед сценарием")
+    parser.add_argument("--sockets", type=int, default=100, help="соединений в сценарии fanout")
+    parser.add_argument("--fanout-messages", type=int, default=50)
+    parser.add_argument("--with-cache", action="store_true", help="не отключать кэш ответов")
+    parser.add_argument("--baseline", help="файл baseline для сравнения")
+    parser.add_argument("--save-baseline", help="сохранить результаты как baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.with_cache:
+        os.environ.pop("RESPONSE_CACHE_TTL", None)
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    context = prepare_database(SCALES[args.scale], args.reseed)
+    driver_class = DRIVERS[args.driver]
+    driver = driver_class(workers=args.workers) if args.driver == "uvicorn" else driver_class()
+
+    async def run():
+        results = []
+        async with driver:
+            for name in names:
+                if name == "fanout":
+                    results.append(await SCENARIOS[name](driver, context, args.fanout_messages, args.sockets))
+                else:
+                    if args.warmup:
+                        await SCENARIOS[name](driver, context, args.warmup, args.concurrency)
+                    results.append(await SCENARIOS[name](driver, context, args.requests, args.concurrency))
+        return results
+
+    results = asyncio.run(run())
+    print(f"\ndriver={args.driver} scale={args.scale} database={os.environ['DATABASE_URL'].split('://')[0]}")
+    print_table(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump({
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "driver": args.driver,
+                "scale": args.scale,
+                "python": platform.python_version(),
+                "results": {result["name"]: result for result in results},
+            }, file, indent=2)
+        print(f"\nbaseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if (baseline.get("driver"), baseline.get("scale")) != (args.driver, args.scale):
+            print(f"\nwarning: baseline was recorded with driver={baseline.get('driver')} scale={baseline.get('scale')}")
+        rows = compare(results, baseline, args.tolerance)
+        print_comparison(rows)
+        if any(row[-1] for row in rows):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
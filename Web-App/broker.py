@@ -0,0 +1,221 @@
+"""Брокер событий чата между воркерами.
+
+Сообщение публикуется в брокер, а каждый воркер получает его из брокера
+и рассылает своим WebSocket-соединениям. Так клиенты, подключённые к разным
+процессам uvicorn/gunicorn, получают все сообщения поездки.
+
+Бэкенд выбирается по CHAT_BROKER_URL:
+- не задан или "memory" - в памяти процесса (один воркер, тесты);
+- redis://...           - Redis pub/sub (нужен пакет redis);
+- postgresql://...      - LISTEN/NOTIFY в Postgres (нужен asyncpg).
+
+Подписка удалённых брокеров переживает обрыв связи: ошибка пишется в лог,
+и после паузы (от CHAT_BROKER_RETRY_MIN до CHAT_BROKER_RETRY_MAX секунд,
+удваивается с каждой неудачей) воркер подключается и подписывается заново.
+События, опубликованные во время обрыва, этот воркер не получит: клиенты
+догружают их по after_id.
+"""
+from typing import Awaitable, Callable
+import asyncio
+import contextlib
+import json
+import logging
+import os
+
+CHAT_BROKER_URL = os.getenv("CHAT_BROKER_URL", "memory")
+CHAT_BROKER_RETRY_MIN = float(os.getenv("CHAT_BROKER_RETRY_MIN", 0.5))
+CHAT_BROKER_RETRY_MAX = float(os.getenv("CHAT_BROKER_RETRY_MAX", 30))
+# Как часто Postgres-брокер проверяет соединение, на котором висит LISTEN
+CHAT_BROKER_HEALTHCHECK_INTERVAL = float(os.getenv("CHAT_BROKER_HEALTHCHECK_INTERVAL", 5))
+CHANNEL = "trip_chat"
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[int, dict], Awaitable[None]]
+
+
+class MemoryBroker:
+    """Доставка внутри процесса: publish сразу вызывает обработчик"""
+
+    def __init__(self, handler: Handler):
+        self.handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, trip_id: int, message: dict):
+        await self.handler(trip_id, message)
+
+    def stats(self) -> dict:
+        return {"backend": "memory"}
+
+
+class _RemoteBroker:
+    """Общая часть брокеров, доставляющих события через внешний сервер"""
+
+    def __init__(self, handler: Handler):
+        self.handler = handler
+        self.reconnects = 0
+        self._retry_delay = CHAT_BROKER_RETRY_MIN
+
+    async def _backoff(self):
+        """Вызывается из обработчика исключения: лог, пауза, следующая пауза длиннее"""
+        logger.exception("Chat broker subscription lost, reconnecting in %.1f s", self._retry_delay)
+        self.reconnects += 1
+        await asyncio.sleep(self._retry_delay)
+        self._retry_delay = min(self._retry_delay * 2, CHAT_BROKER_RETRY_MAX)
+
+    def _recovered(self):
+        self._retry_delay = CHAT_BROKER_RETRY_MIN
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__, "reconnects": self.reconnects}
+
+    @staticmethod
+    def _encode(trip_id: int, message: dict) -> str:
+        return json.dumps({"trip_id": trip_id, "message": message}, default=str)
+
+    async def _dispatch(self, payload):
+        try:
+            event = json.loads(payload)
+            await self.handler(int(event["trip_id"]), event["message"])
+        except Exception:
+            logger.exception("Failed to deliver chat event")
+
+
+class RedisBroker(_RemoteBroker):
+    def __init__(self, handler: Handler, url: str):
+        super().__init__(handler)
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("Redis chat broker requires the 'redis' package: pip install redis") from e
+        self._client = redis.from_url(url)
+        self._pubsub = None
+        self._task = None
+
+    async def _subscribe(self):
+        self._pubsub = self._client.pubsub()
+        await self._pubsub.subscribe(CHANNEL)
+
+    async def start(self):
+        await self._subscribe()
+        self._task = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                if self._pubsub is None:
+                    await self._subscribe()
+                async for item in self._pubsub.listen():
+                    self._recovered()
+                    if item["type"] == "message":
+                        await self._dispatch(item["data"])
+                raise ConnectionError("Redis pub/sub stream ended")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pubsub, self._pubsub = self._pubsub, None
+                if pubsub is not None:
+                    with contextlib.suppress(Exception):
+                        await pubsub.close()
+                await self._backoff()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        if self._pubsub:
+            await self._pubsub.unsubscribe(CHANNEL)
+            await self._pubsub.close()
+        await self._client.close()
+
+    async def publish(self, trip_id: int, message: dict):
+        await self._client.publish(CHANNEL, self._encode(trip_id, message))
+
+
+class PostgresBroker(_RemoteBroker):
+    """LISTEN/NOTIFY: полезная нагрузка NOTIFY ограничена 8000 байт"""
+
+    def __init__(self, handler: Handler, url: str):
+        super().__init__(handler)
+        try:
+            import asyncpg
+        except ImportError as e:
+            raise RuntimeError("Postgres chat broker requires the 'asyncpg' package") from e
+        self._asyncpg = asyncpg
+        self._dsn = url.replace("+asyncpg", "").replace("+psycopg2", "")
+        self._connection = None
+        self._listening = False
+        self._lock = asyncio.Lock()
+        self._watcher = None
+        # Доставки уведомлений в работе: без ссылки задачу может собрать GC
+        self._tasks = set()
+
+    async def _connect(self):
+        # После обрыва соединения подписка восстанавливается вместе с ним
+        if self._connection is None or self._connection.is_closed():
+            self._connection = await self._asyncpg.connect(self._dsn)
+            if self._listening:
+                await self._connection.add_listener(CHANNEL, self._on_notify)
+        return self._connection
+
+    def _on_notify(self, connection, pid, channel, payload):
+        task = asyncio.get_running_loop().create_task(self._dispatch(payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def start(self):
+        async with self._lock:
+            self._listening = True
+            self._connection = None
+            await self._connect()
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        # Уведомления приходят без запросов с нашей стороны: воркер, который
+        # только слушает, узнаёт об обрыве только из этой проверки
+        delay = CHAT_BROKER_HEALTHCHECK_INTERVAL
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                async with self._lock:
+                    connection = await self._connect()
+                    await connection.execute("SELECT 1")
+                self._recovered()
+                delay = CHAT_BROKER_HEALTHCHECK_INTERVAL
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                connection, self._connection = self._connection, None
+                if connection is not None:
+                    connection.terminate()
+                await self._backoff()
+                delay = 0
+
+    async def stop(self):
+        self._listening = False
+        if self._watcher is not None:
+            self._watcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._watcher
+            self._watcher = None
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.close()
+
+    async def publish(self, trip_id: int, message: dict):
+        async with self._lock:
+            connection = await self._connect()
+            await connection.execute("SELECT pg_notify($1, $2)", CHANNEL, self._encode(trip_id, message))
+
+
+def build_broker(handler: Handler, url: str = CHAT_BROKER_URL):
+    if url.startswith("redis"):
+        return RedisBroker(handler, url)
+    if url.startswith("postgres"):
+        return PostgresBroker(handler, url)
+    return MemoryBroker(handler)
@@ -0,0 +1,110 @@
+"""Кэши процесса с необязательным общим бэкендом.
+
+По умолчанию используется LRU-кэш в памяти процесса с TTL. Если задан
+CACHE_URL (redis://...), кэши создаются поверх Redis и становятся общими
+для всех воркеров. Пакет redis нужен только в этом случае.
+"""
+from collections import OrderedDict
+import os
+import pickle
+import time
+from typing import Any, Optional
+
+CACHE_URL = os.getenv("CACHE_URL")
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": round(self.hit_ratio, 4)}
+
+
+class MemoryCache:
+    """LRU-кэш с ограничением по размеру и времени жизни записей"""
+
+    def __init__(self, namespace: str, maxsize: int = 1024, ttl: float = 60.0):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    async def get(self, key) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.stats.misses += 1
+            return None
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.stats.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    async def set(self, key, value, ttl: Optional[float] = None):
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+    async def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisCache:
+    """Общий кэш в Redis: значения сериализуются pickle, TTL - средствами Redis"""
+
+    def __init__(self, namespace: str, url: str, ttl: float = 60.0):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_URL requires the 'redis' package: pip install redis") from e
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._client = redis.from_url(url)
+
+    def _key(self, key) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key) -> Optional[Any]:
+        raw = await self._client.get(self._key(key))
+        if raw is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return pickle.loads(raw)
+
+    async def set(self, key, value, ttl: Optional[float] = None):
+        expire_ms = int((self.ttl if ttl is None else ttl) * 1000)
+        await self._client.set(self._key(key), pickle.dumps(value), px=max(expire_ms, 1))
+
+    async def delete(self, key):
+        await self._client.delete(self._key(key))
+
+    async def clear(self):
+        async for key in self._client.scan_iter(match=f"{self.namespace}:*"):
+            await self._client.delete(key)
+
+
+def build_cache(namespace: str, maxsize: int = 1024, ttl: float = 60.0):
+    """Создаёт кэш: общий, если задан CACHE_URL, иначе в памяти процесса"""
+    if CACHE_URL:
+        return RedisCache(namespace, CACHE_URL, ttl=ttl)
+    return MemoryCache(namespace, maxsize=maxsize, ttl=ttl)
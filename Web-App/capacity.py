@@ -0,0 +1,214 @@
+"""Счётчики участников и заявок поездки.
+
+trips.participant_count и trips.pending_application_count меняются только
+здесь и в той же транзакции, что и trip_participants / trip_applications,
+поэтому списки показывают заполненность без загрузки Trip.participants.
+Вступление - условный UPDATE:
+
+    UPDATE trips SET participant_count = participant_count + :n
+    WHERE id = :trip_id AND participant_count + :n <= max_participants
+
+Строка поездки блокируется до конца транзакции, а условие проверяется
+уже после блокировки, поэтому параллельные одобрения не переполнят
+поездку: опоздавший получает 0 изменённых строк (TripFull).
+
+Расхождения (каскадное удаление пользователя, ручные правки в базе)
+исправляет reconcile_counters; CounterReconciler вызывает её каждые
+TRIP_COUNTERS_RECONCILE_INTERVAL секунд (0 - отключено) в одном воркере -
+взявшем аренду "trip-counters" (leases.py). Пересчёт сначала блокирует
+строки поездок (SELECT ... FOR UPDATE) и только потом считает участников:
+UPDATE с подзапросами, дождавшийся блокировки, взял бы счётчики из снимка
+до чужого вступления и записал бы заниженное значение.
+"""
+from sqlalchemy import select, update, delete, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Iterable, List, Optional
+import asyncio
+import logging
+import os
+import time
+
+from database import AsyncSessionLocal
+from leases import Lease
+from models import Trip, TripApplication, ApplicationStatus, trip_participants
+
+TRIP_COUNTERS_RECONCILE_INTERVAL = float(os.getenv("TRIP_COUNTERS_RECONCILE_INTERVAL", 600))
+
+logger = logging.getLogger(__name__)
+
+
+class TripFull(Exception):
+    """Свободных мест меньше, чем нужно"""
+
+
+async def _adjust(db: AsyncSession, trip_id: int, *criteria, **deltas) -> bool:
+    result = await db.execute(
+        update(Trip)
+        .where(Trip.id == trip_id, *criteria)
+        .values({name: getattr(Trip, name) + delta for name, delta in deltas.items()})
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+async def add_participants(db: AsyncSession, trip_id: int, user_ids: Iterable[int]):
+    """Занимает места и добавляет участников; без свободных мест - TripFull"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    places = len(user_ids)
+    reserved = await _adjust(
+        db, trip_id,
+        Trip.participant_count + places <= func.coalesce(Trip.max_participants, 0),
+        participant_count=places
+    )
+    if not reserved:
+        raise TripFull(trip_id)
+    await db.execute(trip_participants.insert(), [
+        {"trip_id": trip_id, "user_id": user_id} for user_id in user_ids
+    ])
+
+
+async def remove_participant(db: AsyncSession, trip_id: int, user_id: int) -> bool:
+    """Удаляет участника и освобождает место; False, если он не участвовал"""
+    result = await db.execute(
+        delete(trip_participants).where(
+            trip_participants.c.trip_id == trip_id,
+            trip_participants.c.user_id == user_id
+        )
+    )
+    if result.rowcount == 0:
+        return False
+    await _adjust(db, trip_id, Trip.participant_count > 0, participant_count=-1)
+    return True
+
+
+async def application_submitted(db: AsyncSession, trip_id: int):
+    await _adjust(db, trip_id, pending_application_count=1)
+
+
+async def applications_decided(db: AsyncSession, trip_id: int, count: int):
+    """count заявок вышли из статуса pending"""
+    if count:
+        await _adjust(db, trip_id, Trip.pending_application_count >= count, pending_application_count=-count)
+
+
+_RECONCILE_BATCH_SIZE = 500
+
+
+def _actual_counts():
+    participants = (
+        select(func.count())
+        .select_from(trip_participants)
+        .where(trip_participants.c.trip_id == Trip.id)
+        .scalar_subquery()
+    )
+    pending = (
+        select(func.count())
+        .select_from(TripApplication)
+        .where(TripApplication.trip_id == Trip.id, TripApplication.status == ApplicationStatus.PENDING)
+        .scalar_subquery()
+    )
+    return participants, pending
+
+
+def reconcile_statement(trip_ids: Optional[List[int]] = None):
+    """UPDATE, пересчитывающий счётчики разошедшихся поездок; возвращает их id"""
+    participants, pending = _actual_counts()
+    statement = (
+        update(Trip)
+        .where(or_(Trip.participant_count != participants, Trip.pending_application_count != pending))
+        .values(participant_count=participants, pending_application_count=pending)
+        .returning(Trip.id)
+        .execution_options(synchronize_session=False)
+    )
+    if trip_ids is not None:
+        statement = statement.where(Trip.id.in_(trip_ids))
+    return statement
+
+
+async def reconcile_counters(db: AsyncSession, trip_ids: Optional[List[int]] = None) -> List[int]:
+    """Исправляет счётчики и сбрасывает кэш затронутых поездок"""
+    from response_cache import invalidate_trip
+
+    participants, pending = _actual_counts()
+    query = select(Trip.id).where(
+        or_(Trip.participant_count != participants, Trip.pending_application_count != pending)
+    ).order_by(Trip.id)
+    if trip_ids is not None:
+        query = query.where(Trip.id.in_(trip_ids))
+    drifted = list((await db.execute(query)).scalars().all())
+    await db.commit()
+
+    repaired = []
+    for start in range(0, len(drifted), _RECONCILE_BATCH_SIZE):
+        batch = drifted[start:start + _RECONCILE_BATCH_SIZE]
+        # Блокировка до пересчёта: следующий запрос видит всё, что успели закоммитить вступившие
+        await db.execute(select(Trip.id).where(Trip.id.in_(batch)).order_by(Trip.id).with_for_update())
+        result = await db.execute(reconcile_statement(batch))
+        repaired.extend(result.scalars().all())
+        await db.commit()
+    if repaired:
+        logger.warning("Repaired participant counters of %d trips", len(repaired))
+        await invalidate_trip()
+        for trip_id in repaired:
+            await invalidate_trip(trip_id)
+    return repaired
+
+
+class CounterReconciler:
+    """Периодическая сверка счётчиков в фоне"""
+
+    def __init__(self, session_factory, interval: float = TRIP_COUNTERS_RECONCILE_INTERVAL):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.runs = 0
+        self.repaired = 0
+        self.last_run: Optional[float] = None
+        self.lease = Lease("trip-counters", session_factory)
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self, force: bool = False) -> Optional[List[int]]:
+        """Сверка, если интервал истёк для всех воркеров (force - сразу); None - аренду держит другой воркер"""
+        async with self.lease.hold() as lease:
+            if lease is None:
+                return None
+            if not force and not lease.due(self.interval):
+                return []
+            async with self.session_factory() as db:
+                repaired = await reconcile_counters(db)
+            lease.complete()
+        self.runs += 1
+        self.repaired += len(repaired)
+        self.last_run = time.time()
+        return repaired
+
+    async def _run(self):
+        # Опрос чаще интервала: срок отсчитывается от прохода любого воркера
+        while True:
+            await asyncio.sleep(min(self.interval, 60))
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Trip counters reconciliation failed")
+
+    async def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "repaired": self.repaired,
+            "last_run": self.last_run,
+            "lease": self.lease.stats(),
+        }
+
+
+counter_reconciler = CounterReconciler(AsyncSessionLocal)
@@ -0,0 +1,170 @@
+"""Пакетная запись сообщений чата.
+
+Входящие сообщения всех соединений попадают в одну очередь. Фоновая
+задача собирает их в пакеты (до CHAT_BATCH_SIZE сообщений или не дольше
+CHAT_BATCH_DELAY_MS миллисекунд), записывает пакет одним INSERT и одним
+COMMIT и только после этого рассылает сообщения. Очередь обрабатывается
+строго по порядку, поэтому порядок сообщений каждого сокета сохраняется.
+
+Если пакет не записался, его сообщения записываются по одному: ошибку
+получает только future некорректной строки, а не соседи по пакету.
+"""
+from sqlalchemy import insert
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional
+import asyncio
+import logging
+import os
+
+from models import TripMessage
+
+CHAT_BATCH_SIZE = int(os.getenv("CHAT_BATCH_SIZE", 200))
+CHAT_BATCH_DELAY_MS = float(os.getenv("CHAT_BATCH_DELAY_MS", 5))
+CHAT_INGEST_QUEUE_SIZE = int(os.getenv("CHAT_INGEST_QUEUE_SIZE", 10000))
+
+logger = logging.getLogger(__name__)
+
+
+class PendingMessage:
+    __slots__ = ("row", "author", "future")
+
+    def __init__(self, row: dict, author: str, future: asyncio.Future):
+        self.row = row
+        self.author = author
+        self.future = future
+
+
+class ChatIngest:
+    def __init__(
+        self,
+        session_factory,
+        on_committed: Callable[[TripMessage, str], Awaitable[None]],
+        batch_size: int = CHAT_BATCH_SIZE,
+        batch_delay: float = CHAT_BATCH_DELAY_MS / 1000,
+        queue_size: int = CHAT_INGEST_QUEUE_SIZE
+    ):
+        self.session_factory = session_factory
+        self.on_committed = on_committed
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.queue_size = queue_size
+        self.batches = 0
+        self.messages = 0
+        self.split_batches = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._queue = self._queue or asyncio.Queue(maxsize=self.queue_size)
+            self._task = asyncio.create_task(self._run())
+
+    async def start(self):
+        self._ensure_running()
+
+    async def stop(self):
+        """Дописывает накопленные сообщения и останавливает задачу"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        self._task = None
+        # Очередь пуста и привязана к текущему циклу событий: следующий start создаст новую
+        self._queue = None
+
+    async def submit(self, trip_id: int, author_id: int, author: str, content: str,
+                     is_system: bool = False) -> asyncio.Future:
+        """Ставит сообщение в очередь; при заполненной очереди ждёт (обратное давление).
+
+        Возвращает future с сохранённым TripMessage.
+        """
+        self._ensure_running()
+        future = asyncio.get_running_loop().create_future()
+        row = {
+            "trip_id": trip_id,
+            "author_id": author_id,
+            "content": content,
+            "is_system": is_system,
+            "created_at": datetime.now(timezone.utc),
+        }
+        await self._queue.put(PendingMessage(row, author, future))
+        return future
+
+    async def _collect(self) -> List[PendingMessage]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self._store(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _store(self, batch: List[PendingMessage]):
+        try:
+            await self._write(batch)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                self._fail(batch[0], e)
+                return
+            logger.warning("Chat batch of %d messages failed, storing one by one", len(batch), exc_info=True)
+        # Пакет откатан целиком: повторяем по одному в том же порядке
+        self.split_batches += 1
+        for pending in batch:
+            try:
+                await self._write([pending])
+            except Exception as e:
+                self._fail(pending, e)
+
+    def _fail(self, pending: PendingMessage, error: Exception):
+        logger.error("Failed to store chat message for trip %s", pending.row["trip_id"], exc_info=error)
+        self.failed += 1
+        if not pending.future.done():
+            pending.future.set_exception(error)
+
+    async def _write(self, batch: List[PendingMessage]):
+        rows = [pending.row for pending in batch]
+        async with self.session_factory() as db:
+            result = await db.execute(
+                insert(TripMessage).returning(TripMessage.id, sort_by_parameter_order=True),
+                rows
+            )
+            ids = result.scalars().all()
+            await db.commit()
+
+        self.batches += 1
+        self.messages += len(batch)
+
+        # Рассылка только после фиксации, в порядке поступления
+        for pending, message_id in zip(batch, ids):
+            message = TripMessage(id=message_id, **pending.row)
+            if not pending.future.done():
+                pending.future.set_result(message)
+            try:
+                await self.on_committed(message, pending.author)
+            except Exception:
+                logger.exception("Failed to broadcast chat message %s", message_id)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "messages": self.messages,
+            "avg_batch": round(self.messages / self.batches, 2) if self.batches else 0.0,
+            "split_batches": self.split_batches,
+            "failed": self.failed,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
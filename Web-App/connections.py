@@ -0,0 +1,265 @@
+"""WebSocket-соединения чата с очередью отправки на каждое соединение.
+
+Рассылка не ждёт клиентов: событие один раз сериализуется и кладётся
+в ограниченную очередь каждого соединения, а отдельная задача-писатель
+отправляет его в сокет. Медленный клиент не задерживает остальных.
+Когда очередь переполнена, срабатывает политика CHAT_SLOW_CONSUMER_POLICY:
+- disconnect   - закрыть соединение (клиент переподключится и догрузит историю);
+- drop_oldest  - выбросить самое старое неотправленное событие;
+- drop_newest  - не ставить новое событие в очередь.
+Соединения, на которых отправка упала или не уложилась в CHAT_SEND_TIMEOUT,
+удаляются из комнаты.
+
+Соединение, восстанавливающее пропущенное (hold=True), придерживает живые
+события, пока resume() не отправит историю, и затем отбрасывает повторы.
+TripWaiters будит long-poll запросы той же локальной доставкой, что и сокеты.
+"""
+from fastapi import WebSocket, status
+from typing import Dict, List, Optional, Set
+import asyncio
+import contextlib
+import json
+import os
+
+CHAT_SEND_QUEUE_SIZE = int(os.getenv("CHAT_SEND_QUEUE_SIZE", 100))
+CHAT_SEND_TIMEOUT = float(os.getenv("CHAT_SEND_TIMEOUT", 5))
+CHAT_SLOW_CONSUMER_POLICY = os.getenv("CHAT_SLOW_CONSUMER_POLICY", "disconnect")
+# Лимиты соединений на воркер (0 - без лимита)
+CHAT_MAX_CONNECTIONS_PER_TRIP = int(os.getenv("CHAT_MAX_CONNECTIONS_PER_TRIP", 500))
+CHAT_MAX_CONNECTIONS_PER_USER = int(os.getenv("CHAT_MAX_CONNECTIONS_PER_USER", 5))
+
+
+class ChatConnection:
+    def __init__(self, manager: "ConnectionManager", trip_id: int, websocket: WebSocket, user_id: int = None,
+                 hold: bool = False):
+        self.manager = manager
+        self.trip_id = trip_id
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=manager.queue_size)
+        self.dropped = 0
+        self.closed = False
+        # (текст, id сообщения) живых событий, пришедших до отправки истории
+        self.held: Optional[list] = [] if hold else None
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def _write_loop(self):
+        try:
+            # Отмена, пришедшая вместе с завершением отправки, теряется в wait_for
+            # (Python < 3.12): закрытое соединение проверяется после каждой отправки
+            while not self.closed:
+                text = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(text), self.manager.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Сокет мёртв или клиент не принимает данные
+            self.manager.evicted += 1
+            await self.close(status.WS_1011_INTERNAL_ERROR)
+
+    def offer(self, text: str, message_id: int = None):
+        """Ставит событие в очередь без ожидания"""
+        if self.closed:
+            return
+        if self.held is not None:
+            self.held.append((text, message_id))
+            return
+        try:
+            self.queue.put_nowait(text)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        self.dropped += 1
+        self.manager.dropped += 1
+        policy = self.manager.policy
+        if policy == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.put_nowait(text)
+        elif policy == "disconnect":
+            self.manager.evicted += 1
+            self.manager.spawn(self.close(status.WS_1013_TRY_AGAIN_LATER))
+
+    async def resume(self, events: List[dict], complete: bool):
+        """Отправляет пропущенные события, затем придержанные живые без повторов"""
+        last_id = events[-1]["id"] if events else None
+        texts = [json.dumps(event, ensure_ascii=False, default=str) for event in events]
+        texts.append(json.dumps({"type": "resumed", "count": len(events), "complete": complete}))
+        try:
+            for text in texts:
+                # История может быть длиннее очереди: ждём писателя, а не применяем политику
+                await asyncio.wait_for(self.queue.put(text), self.manager.send_timeout)
+        except asyncio.TimeoutError:
+            self.manager.evicted += 1
+            await self.close(status.WS_1013_TRY_AGAIN_LATER)
+            return
+        held, self.held = self.held or [], None
+        for text, message_id in held:
+            if message_id is None or last_id is None or message_id > last_id:
+                self.offer(text, message_id)
+
+    async def _stop_writer(self):
+        # Писатель, закрывающий соединение сам, не ждёт себя
+        if asyncio.current_task() is self._writer:
+            return
+        self._writer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._writer
+
+    async def close(self, code: int = status.WS_1000_NORMAL_CLOSURE):
+        if self.closed:
+            return
+        self.closed = True
+        self.manager.discard(self)
+        await self._stop_writer()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
+class ConnectionManager:
+    """Комнаты поездок: trip_id -> соединения этого воркера"""
+
+    def __init__(
+        self,
+        queue_size: int = CHAT_SEND_QUEUE_SIZE,
+        send_timeout: float = CHAT_SEND_TIMEOUT,
+        policy: str = CHAT_SLOW_CONSUMER_POLICY,
+        max_per_trip: int = CHAT_MAX_CONNECTIONS_PER_TRIP,
+        max_per_user: int = CHAT_MAX_CONNECTIONS_PER_USER
+    ):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.policy = policy
+        self.max_per_trip = max_per_trip
+        self.max_per_user = max_per_user
+        self.rooms: Dict[int, Set[ChatConnection]] = {}
+        # Занятые места, включая допущенные, но ещё не добавленные соединения
+        self.trip_connections: Dict[int, int] = {}
+        self.user_connections: Dict[int, int] = {}
+        self.dropped = 0
+        self.evicted = 0
+        self.refused = 0
+        # Ссылки на фоновые закрытия: цикл событий держит задачи только слабо
+        self._tasks: Set[asyncio.Task] = set()
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def admit(self, trip_id: int, user_id: int) -> Optional[str]:
+        """Причина отказа в новом соединении или None.
+
+        Место занимается сразу, до accept(): параллельные рукопожатия не
+        проходят лимит вместе. Его освобождает discard() добавленного
+        соединения или release(), если соединение так и не добавлено.
+        """
+        if self.max_per_trip and self.trip_connections.get(trip_id, 0) >= self.max_per_trip:
+            reason = "Too many connections to this trip"
+        elif self.max_per_user and self.user_connections.get(user_id, 0) >= self.max_per_user:
+            reason = "Too many connections for this user"
+        else:
+            self.trip_connections[trip_id] = self.trip_connections.get(trip_id, 0) + 1
+            self.user_connections[user_id] = self.user_connections.get(user_id, 0) + 1
+            return None
+        self.refused += 1
+        return reason
+
+    def release(self, trip_id: int, user_id: int):
+        """Возвращает место, занятое admit()"""
+        for counts, key in ((self.trip_connections, trip_id), (self.user_connections, user_id)):
+            remaining = counts.get(key, 1) - 1
+            if remaining > 0:
+                counts[key] = remaining
+            else:
+                counts.pop(key, None)
+
+    def add(self, trip_id: int, websocket: WebSocket, user_id: int = None, hold: bool = False) -> ChatConnection:
+        """Занимает место, выданное admit()"""
+        connection = ChatConnection(self, trip_id, websocket, user_id, hold)
+        self.rooms.setdefault(trip_id, set()).add(connection)
+        return connection
+
+    def discard(self, connection: ChatConnection):
+        room = self.rooms.get(connection.trip_id)
+        if room is None or connection not in room:
+            return
+        room.discard(connection)
+        if not room:
+            del self.rooms[connection.trip_id]
+        self.release(connection.trip_id, connection.user_id)
+
+    async def remove(self, connection: ChatConnection):
+        """Клиент отключился: останавливаем писателя"""
+        connection.closed = True
+        self.discard(connection)
+        await connection._stop_writer()
+
+    def broadcast(self, trip_id: int, message: dict) -> int:
+        """Раздаёт событие в очереди соединений комнаты; возвращает число адресатов"""
+        room = self.rooms.get(trip_id)
+        if not room:
+            return 0
+        text = json.dumps(message, ensure_ascii=False, default=str)
+        message_id = message.get("id")
+        for connection in list(room):
+            connection.offer(text, message_id)
+        return len(room)
+
+    def __contains__(self, trip_id: int) -> bool:
+        return trip_id in self.rooms
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self.rooms),
+            "connections": sum(len(room) for room in self.rooms.values()),
+            "dropped": self.dropped,
+            "evicted": self.evicted,
+            "refused": self.refused,
+        }
+
+
+class TripWaiters:
+    """Long-poll запросы этого воркера, ждущие новых сообщений поездки"""
+
+    def __init__(self):
+        self.waiters: Dict[int, Set[asyncio.Event]] = {}
+        self.woken = 0
+        self.timeouts = 0
+
+    def register(self, trip_id: int) -> asyncio.Event:
+        event = asyncio.Event()
+        self.waiters.setdefault(trip_id, set()).add(event)
+        return event
+
+    def discard(self, trip_id: int, event: asyncio.Event):
+        waiters = self.waiters.get(trip_id)
+        if waiters is not None:
+            waiters.discard(event)
+            if not waiters:
+                del self.waiters[trip_id]
+
+    def notify(self, trip_id: int) -> int:
+        waiters = self.waiters.get(trip_id, ())
+        for event in waiters:
+            event.set()
+        return len(waiters)
+
+    async def wait(self, event: asyncio.Event, timeout: float) -> bool:
+        """True, если событие пришло до истечения timeout"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return False
+        self.woken += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "waiting": sum(len(waiters) for waiters in self.waiters.values()),
+            "woken": self.woken,
+            "timeouts": self.timeouts,
+        }
@@ -1,23 +1,178 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import StaticPool, QueuePool, AsyncAdaptedQueuePool
 import os
+import time
 
 SQLALCHEMY_DATABASE_URL = os.getenv(
     "DATABASE_URL",
     "sqlite:///./travel.db"
 )
 
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL,
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool
-    )
-else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+# Настройки пула соединений
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 20)
+DB_POOL_TIMEOUT = _env_int("DB_POOL_TIMEOUT", 30)
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 1800)
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+SQLITE_BUSY_TIMEOUT_MS = _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+
+
+def make_async_url(url: str) -> str:
+    """Подставляет асинхронный драйвер в URL базы данных"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    for prefix in ("postgresql+psycopg2:", "postgresql:", "postgres:"):
+        if url.startswith(prefix):
+            return url.replace(prefix, "postgresql+asyncpg:", 1)
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    make_async_url(SQLALCHEMY_DATABASE_URL)
+)
+
+
+class PoolWaitStats:
+    """Время ожидания соединения из пула"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, waited: float):
+        self.checkouts += 1
+        self.total_wait += waited
+        if waited > self.max_wait:
+            self.max_wait = waited
+
+    def as_dict(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+        }
+
+
+class _TimedPoolMixin:
+    wait_stats: PoolWaitStats
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            self.wait_stats.timeouts += 1
+            raise
+        finally:
+            self.wait_stats.record(time.perf_counter() - started)
+
+
+def _timed_pool(pool_class, stats: PoolWaitStats):
+    return type(f"Timed{pool_class.__name__}", (_TimedPoolMixin, pool_class), {"wait_stats": stats})
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or "mode=memory" in url or url.rstrip("/").endswith(":"))
+
+
+def _enable_sqlite_wal(sync_engine):
+    """WAL позволяет читателям работать параллельно с единственным писателем"""
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+
+pool_wait_stats = {}
+
+
+def create_pooled_engine(url: str, name: str, is_async: bool = False):
+    """Создаёт движок с настройками пула из окружения и учётом ожидания"""
+    factory = create_async_engine if is_async else create_engine
+
+    if _is_sqlite_memory(url):
+        kwargs = {"poolclass": StaticPool}
+        if not is_async:
+            kwargs["connect_args"] = {"check_same_thread": False}
+        return factory(url, **kwargs)
+
+    stats = pool_wait_stats.setdefault(name, PoolWaitStats())
+    kwargs = {
+        "poolclass": _timed_pool(AsyncAdaptedQueuePool if is_async else QueuePool, stats),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if url.startswith("sqlite"):
+        if not is_async:
+            kwargs["connect_args"] = {"check_same_thread": False}
+        new_engine = factory(url, **kwargs)
+        _enable_sqlite_wal(new_engine.sync_engine if is_async else new_engine)
+        return new_engine
+    return factory(url, **kwargs)
+
+
+def pool_status(name: str, target_engine) -> dict:
+    """Текущее состояние пула движка"""
+    pool = target_engine.pool
+    status = {"engine": name, "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "timeout": DB_POOL_TIMEOUT,
+        })
+    if name in pool_wait_stats:
+        status["wait"] = pool_wait_stats[name].as_dict()
+    return status
+
+
+# Синхронный движок: скрипты, миграции и сравнительные бенчмарки
+engine = create_pooled_engine(SQLALCHEMY_DATABASE_URL, "sync")
+
+# Асинхронный движок: все роутеры приложения
+async_engine = create_pooled_engine(ASYNC_DATABASE_URL, "async", is_async=True)
+
+# Реплики только для чтения (через запятую); маршрутизация - в replicas.py
+DATABASE_REPLICA_URLS = [
+    url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+replica_engines = [
+    create_pooled_engine(make_async_url(url), f"replica{number}", is_async=True)
+    for number, url in enumerate(DATABASE_REPLICA_URLS, 1)
+]
 
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 Base = declarative_base()
 
 def get_session():
@@ -25,4 +180,19 @@ def get_session():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_session():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_pool_metrics() -> list:
+    return [
+        pool_status("async", async_engine.sync_engine),
+        pool_status("sync", engine),
+    ] + [
+        pool_status(f"replica{number}", replica.sync_engine)
+        for number, replica in enumerate(replica_engines, 1)
+    ]
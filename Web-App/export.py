@@ -0,0 +1,99 @@
+"""Потоковая выгрузка больших наборов строк в NDJSON или CSV.
+
+Запрос выполняется курсором на стороне сервера (yield_per / stream_results),
+строки выбираются пачками по EXPORT_BATCH_SIZE, каждая пачка сразу
+кодируется и отправляется, поэтому память не зависит от размера выгрузки.
+Выбираются только колонки, без ORM-объектов и identity map.
+
+Каждая строка несёт поле cursor - курсор keyset-пагинации (pagination.py)
+по её ключу сортировки. После обрыва выгрузку продолжают с ?cursor=<cursor
+последней полученной строки>.
+
+Поток читает в собственной сессии (replicas.read_session): зависимости
+эндпоинта могут завершиться до отправки тела.
+"""
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Optional
+import csv
+import io
+import logging
+import os
+
+from pagination import encode_cursor
+from replicas import read_session
+from serialization import dumps
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+EXPORT_FORMAT_PATTERN = "^(" + "|".join(EXPORT_MEDIA_TYPES) + ")$"
+
+CURSOR_FIELD = "cursor"
+
+logger = logging.getLogger(__name__)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def _ndjson_chunk(rows: list, key: Callable) -> bytes:
+    lines = []
+    for row in rows:
+        record = row._asdict()
+        record[CURSOR_FIELD] = encode_cursor(*key(row))
+        lines.append(dumps(record))
+    return b"\n".join(lines) + b"\n"
+
+
+def _csv_chunk(rows: list, key: Callable, header: Optional[list]) -> bytes:
+    output = io.StringIO()
+    writer = csv.writer(output)
+    if header is not None:
+        writer.writerow(header + [CURSOR_FIELD])
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row] + [encode_cursor(*key(row))])
+    return output.getvalue().encode()
+
+
+def export_response(query, key: Callable, export_format: str, filename: str,
+                    user_id: Optional[int] = None) -> StreamingResponse:
+    """StreamingResponse с результатом query; key(row) - значения ключа сортировки"""
+    async def body():
+        async with read_session(user_id) as db:
+            result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            header = list(result.keys())
+            try:
+                async for rows in result.partitions():
+                    if export_format == "csv":
+                        yield _csv_chunk(rows, key, header)
+                        header = None
+                    else:
+                        yield _ndjson_chunk(rows, key)
+                if header is not None and export_format == "csv":
+                    yield _csv_chunk([], key, header)
+            except Exception:
+                # Статус уже отправлен: обрыв соединения - сигнал клиенту продолжить по курсору
+                logger.exception("Export %s failed", filename)
+                raise
+            finally:
+                await result.close()
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
@@ -0,0 +1,83 @@
+"""Хеширование паролей в отдельном пуле процессов.
+
+bcrypt занимает 100-300 мс CPU и держит GIL, поэтому в обработчиках
+запросов хеширование выполняется в ограниченном пуле процессов. Если
+очередь пула заполнена, запрос получает 503 с заголовком Retry-After.
+Модуль не импортирует БД и приложение: его загружают процессы пула.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+import asyncio
+import multiprocessing
+import os
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", min(os.cpu_count() or 1, 4)))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", max(HASH_WORKERS, 1) * 16))
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", 1))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+# Хеширование пароля
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+
+# Проверка пароля
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class HashingPool:
+    """Пул процессов с ограничением числа ожидающих задач.
+
+    workers=0 - выполнение в пуле потоков event loop (без отдельных процессов).
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.rejected = 0
+        self._executor = None
+
+    def _get_executor(self):
+        if self.workers > 0 and self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def run(self, func, *args):
+        if self.pending >= self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Password hashing is overloaded, try again later",
+                headers={"Retry-After": str(HASH_RETRY_AFTER)}
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool()
+
+
+async def hash_password_async(password: str) -> str:
+    return await hashing_pool.run(get_password_hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hashing_pool.run(verify_password, plain_password, hashed_password)
@@ -0,0 +1,115 @@
+"""Аренда периодических задач между воркерами.
+
+Фоновые задачи (capacity.CounterReconciler, recommendations.RecommendationRefresher)
+запускаются в каждом воркере, но проход выполняет только взявший аренду -
+строку job_leases с именем задачи. Аренда берётся условным UPDATE (свободна,
+истекла или уже наша), поэтому работает одинаково на PostgreSQL и SQLite.
+Длинный проход продлевает её через extend(); аренда упавшего воркера
+освобождается сама через JOB_LEASE_TTL секунд.
+
+finished_at - время последнего завершённого прохода (complete()): интервал
+задачи отсчитывается от него, общий для всех воркеров.
+"""
+from sqlalchemy import select, update, insert, or_
+from sqlalchemy.exc import IntegrityError
+from contextlib import asynccontextmanager
+from typing import Optional
+import os
+import socket
+import time
+import uuid
+
+from database import AsyncSessionLocal
+from models import JobLease
+
+JOB_LEASE_TTL = float(os.getenv("JOB_LEASE_TTL", 300))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseLost(Exception):
+    """Аренда истекла и перешла к другому воркеру"""
+
+
+class Lease:
+    def __init__(self, name: str, session_factory=AsyncSessionLocal, ttl: float = JOB_LEASE_TTL):
+        self.name = name
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.finished_at: Optional[float] = None
+        self.acquired = 0
+        self.busy = 0
+        self._completed = False
+
+    async def acquire(self) -> bool:
+        now = time.time()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(JobLease)
+                .where(JobLease.name == self.name, or_(JobLease.expires_at < now, JobLease.holder == WORKER_ID))
+                .values(holder=WORKER_ID, expires_at=now + self.ttl)
+            )
+            if result.rowcount == 0:
+                # Строки ещё нет или аренда занята: вставка различает эти случаи
+                try:
+                    await db.execute(insert(JobLease).values(name=self.name, holder=WORKER_ID, expires_at=now + self.ttl))
+                except IntegrityError:
+                    await db.rollback()
+                    self.busy += 1
+                    return False
+            self.finished_at = await db.scalar(select(JobLease.finished_at).where(JobLease.name == self.name))
+            await db.commit()
+        self.acquired += 1
+        self._completed = False
+        return True
+
+    def due(self, interval: float) -> bool:
+        """Прошло ли interval секунд с последнего завершённого прохода любого воркера"""
+        return self.finished_at is None or time.time() - self.finished_at >= interval
+
+    def complete(self):
+        """Проход завершён: release() запишет finished_at"""
+        self._completed = True
+
+    async def extend(self):
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(JobLease)
+                .where(JobLease.name == self.name, JobLease.holder == WORKER_ID)
+                .values(expires_at=time.time() + self.ttl)
+            )
+            await db.commit()
+        if result.rowcount == 0:
+            raise LeaseLost(self.name)
+
+    async def release(self):
+        values = {"expires_at": 0.0}
+        if self._completed:
+            values["finished_at"] = self.finished_at = time.time()
+        async with self.session_factory() as db:
+            await db.execute(
+                update(JobLease)
+                .where(JobLease.name == self.name, JobLease.holder == WORKER_ID)
+                .values(**values)
+            )
+            await db.commit()
+
+    @asynccontextmanager
+    async def hold(self):
+        """Аренда на время блока; None - её держит другой воркер"""
+        if not await self.acquire():
+            yield None
+            return
+        try:
+            yield self
+        finally:
+            await self.release()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "worker": WORKER_ID,
+            "acquired": self.acquired,
+            "busy": self.busy,
+            "last_finished": self.finished_at,
+        }
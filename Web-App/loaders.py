@@ -0,0 +1,31 @@
+"""Стратегии загрузки связей для схем ответов.
+
+Схема с вложенными объектами обязана получить их одним-двумя запросами,
+а не отдельным запросом на каждую строку. Связь "к одному" подтягивается
+JOIN-ом, коллекции - отдельным SELECT ... IN.
+"""
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import Trip, TripMessage, TripApplication
+import schemas
+
+RESPONSE_LOADERS = {
+    schemas.TripWithParticipants: (
+        joinedload(Trip.organizer),
+        selectinload(Trip.participants),
+    ),
+    schemas.TripMessageWithAuthor: (
+        joinedload(TripMessage.author),
+    ),
+    schemas.TripApplicationWithUser: (
+        joinedload(TripApplication.applicant),
+    ),
+    schemas.TripApplicationWithTrip: (
+        joinedload(TripApplication.trip),
+    ),
+}
+
+
+def loader_options(schema) -> tuple:
+    """Опции загрузки для схемы ответа (пусто, если связей нет)"""
+    return RESPONSE_LOADERS.get(schema, ())
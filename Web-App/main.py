@@ -4,28 +4,53 @@ from contextlib import asynccontextmanager
 import uvicorn
 import os
 
-from database import Base, engine
+from database import Base, async_engine
+from hashing import hashing_pool
+from pagination import NEXT_CURSOR_HEADER
+from migrations import upgrade as upgrade_schema
 from users import router as users_router
 from trips import router as trips_router
-from messages import router as messages_router
+from messages import router as messages_router, chat_broker, chat_ingest
 from auth import router as auth_router
+from admin import router as admin_router
+from metrics import MetricsMiddleware, router as metrics_router
+from profiling import ProfilingMiddleware
+from replicas import ReplicaStickinessMiddleware
+from capacity import counter_reconciler
+from recommendations import recommendation_refresher
+from ratelimit import AdmissionMiddleware
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
     # Пытаемся создать таблицы, игнорируем ошибку если они уже существуют
     try:
-        Base.metadata.create_all(bind=engine)
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            applied = await conn.run_sync(upgrade_schema)
         print("✅ Database tables created")
+        if applied:
+            print(f"✅ Migrations applied: {', '.join(applied)}")
     except Exception as e:
         if "already exists" in str(e):
             print("✅ Database tables already exist")
         else:
             print(f"⚠️ Database error: {e}")
+
+    await chat_broker.start()
+    await chat_ingest.start()
+    await counter_reconciler.start()
+    await recommendation_refresher.start()
     
     yield
     
     # Очистка при завершении
+    await recommendation_refresher.stop()
+    await counter_reconciler.stop()
+    await chat_ingest.stop()
+    await chat_broker.stop()
+    hashing_pool.shutdown()
+    await async_engine.dispose()
     print("Application shutting down")
 
 app = FastAPI(
@@ -38,6 +63,14 @@ app = FastAPI(
     openapi_url="/api/openapi.json"
 )
 
+# ?profile=1 для админа: отчёт профилировщика вместо тела ответа.
+# Регистрируется первым и оказывается внутри сброса нагрузки и лимитов:
+# проверка роли (кэш load_user, при промахе - запрос в БД) не обходит их
+app.add_middleware(ProfilingMiddleware)
+
+# Сброс нагрузки и общий лимит на клиента; внутри CORS, чтобы 429/503 были видны браузеру
+app.add_middleware(AdmissionMiddleware)
+
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
@@ -45,13 +78,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+# Метрики запросов: время, SQL, размер ответа (GET /metrics)
+app.add_middleware(MetricsMiddleware)
+
+# Read-your-writes: после изменений пользователь читает с основной базы, а не с реплики
+app.add_middleware(ReplicaStickinessMiddleware)
+
 # Подключение роутеров
 app.include_router(auth_router, prefix="/api/v1")
 app.include_router(users_router, prefix="/api/v1")
 app.include_router(trips_router, prefix="/api/v1")
 app.include_router(messages_router, prefix="/api/v1")
+app.include_router(admin_router, prefix="/api/v1")
+app.include_router(metrics_router)
 
 @app.get("/")
 async def root():
@@ -63,7 +105,8 @@ async def root():
             "auth": "/api/v1/auth",
             "users": "/api/v1/users",
             "trips": "/api/v1/trips",
-            "messages": "/api/v1/messages"
+            "messages": "/api/v1/messages",
+            "admin": "/api/v1/admin"
         }
     }
 
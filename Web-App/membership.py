@@ -0,0 +1,48 @@
+"""Проверка участия пользователя в поездке.
+
+Ответ даёт один EXISTS-запрос по первичному ключу trip_participants
+вместо загрузки всей коллекции Trip.participants. Результат кратко
+кэшируется; при вступлении или выходе из поездки запись нужно сбросить
+через invalidate_membership.
+"""
+from sqlalchemy import select, exists, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+import os
+
+from models import Trip, trip_participants
+from cache import build_cache
+
+MEMBERSHIP_CACHE_TTL = float(os.getenv("MEMBERSHIP_CACHE_TTL", 10))
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", 50000))
+
+membership_cache = build_cache("membership", maxsize=MEMBERSHIP_CACHE_SIZE, ttl=MEMBERSHIP_CACHE_TTL)
+
+
+def _key(trip_id: int, user_id: int) -> str:
+    return f"{trip_id}:{user_id}"
+
+
+async def is_participant(db: AsyncSession, trip_id: int, user_id: int) -> bool:
+    """Состоит ли пользователь в trip_participants поездки"""
+    if MEMBERSHIP_CACHE_TTL > 0:
+        cached = await membership_cache.get(_key(trip_id, user_id))
+        if cached is not None:
+            return cached
+
+    result = await db.execute(select(exists().where(and_(
+        trip_participants.c.trip_id == trip_id,
+        trip_participants.c.user_id == user_id
+    ))))
+    member = bool(result.scalar())
+    if MEMBERSHIP_CACHE_TTL > 0:
+        await membership_cache.set(_key(trip_id, user_id), member)
+    return member
+
+
+async def is_member(db: AsyncSession, trip: Trip, user_id: int) -> bool:
+    """Участник или организатор поездки"""
+    return trip.organizer_id == user_id or await is_participant(db, trip.id, user_id)
+
+
+async def invalidate_membership(trip_id: int, user_id: int):
+    await membership_cache.delete(_key(trip_id, user_id))
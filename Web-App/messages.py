@@ -1,77 +1,235 @@
-from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, Response, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+from typing import List, Optional
+from datetime import datetime
+import contextlib
 import json
+import logging
+import os
 
-from database import get_session
+from database import get_async_session, AsyncSessionLocal
+from replicas import get_read_session, mark_write
 from auth import get_current_user
-from models import Trip, TripMessage
+from loaders import loader_options
+from pagination import after_cursor, set_next_cursor
+from serialization import FAST_SERIALIZATION, RowSerializer, schema_columns, fetch_page
+from export import EXPORT_FORMAT_PATTERN, export_response
+from membership import is_member
+from ratelimit import CHAT_LIMIT, EXPORT_LIMIT, rate_limit, limiter, not_in_flight
+from broker import build_broker
+from connections import ConnectionManager, TripWaiters
+from chat_ingest import ChatIngest
+from models import Trip, TripMessage, User
 import schemas
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
-active_connections = {}
+# Восстановление после переподключения и long-poll отдают не больше CHAT_RESUME_LIMIT сообщений
+CHAT_RESUME_LIMIT = int(os.getenv("CHAT_RESUME_LIMIT", 500))
+LONG_POLL_MAX_SECONDS = float(os.getenv("LONG_POLL_MAX_SECONDS", 30))
+
+logger = logging.getLogger(__name__)
+
+active_connections = ConnectionManager()
+trip_waiters = TripWaiters()
+
+message_rows = RowSerializer(schemas.TripMessageWithAuthor)
+
+
+def history_query(trip_id: int):
+    """Сообщения поездки с автором: колонки на быстром пути, ORM-объекты иначе"""
+    if FAST_SERIALIZATION:
+        query = select(
+            *schema_columns(schemas.TripMessageWithAuthor, TripMessage),
+            *schema_columns(schemas.UserResponse, User, prefix="author__")
+        ).join(TripMessage.author)
+    else:
+        query = select(TripMessage).options(*loader_options(schemas.TripMessageWithAuthor))
+    return query.filter(TripMessage.trip_id == trip_id)
 
 
 @router.get("/trip/{trip_id}", response_model=List[schemas.TripMessageWithAuthor])
-def get_trip_messages(
+async def get_trip_messages(
         trip_id: int,
+        response: Response,
         skip: int = 0,
         limit: int = 100,
-        db: Session = Depends(get_session),
+        cursor: Optional[str] = None,
+        db: AsyncSession = Depends(get_read_session),
         current_user=Depends(get_current_user)
 ):
     """Получить сообщения поездки"""
-    trip = db.query(Trip).filter(Trip.id == trip_id).first()
+    result = await db.execute(select(Trip).filter(Trip.id == trip_id))
+    trip = result.scalars().first()
     if not trip:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Trip not found"
         )
 
-    if current_user not in trip.participants and current_user.id != trip.organizer_id:
+    if not await is_member(db, trip, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not a participant of this trip"
         )
 
-    messages = db.query(TripMessage).filter(
-        TripMessage.trip_id == trip_id
-    ).order_by(TripMessage.created_at).offset(skip).limit(limit).all()
+    query = history_query(trip_id)
+    if cursor:
+        query = query.filter(
+            after_cursor((TripMessage.created_at, TripMessage.id), cursor, (datetime, int))
+        )
+    else:
+        query = query.offset(skip)
 
+    result = await db.execute(query.order_by(TripMessage.created_at, TripMessage.id).limit(limit))
+    messages = fetch_page(result)
+    set_next_cursor(response, messages, limit, lambda message: (message.created_at, message.id))
+    if FAST_SERIALIZATION:
+        return message_rows.response(messages, headers=response.headers)
     return messages
 
 
-@router.post("/trip/{trip_id}", response_model=schemas.TripMessageResponse)
+@router.get("/trip/{trip_id}/since", response_model=List[schemas.TripMessageWithAuthor])
+async def get_trip_messages_since(
+        trip_id: int,
+        response: Response,
+        after_id: Optional[int] = Query(None, ge=0),
+        since: Optional[datetime] = None,
+        limit: int = Query(100, ge=1, le=CHAT_RESUME_LIMIT),
+        wait: float = Query(0, ge=0, le=LONG_POLL_MAX_SECONDS),
+        db: AsyncSession = Depends(get_read_session),
+        current_user=Depends(get_current_user)
+):
+    """Сообщения после after_id (по id) или после since (по времени); wait - long-poll до wait секунд"""
+    if after_id is None and since is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Either after_id or since is required"
+        )
+
+    result = await db.execute(select(Trip).filter(Trip.id == trip_id))
+    trip = result.scalars().first()
+    if not trip:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trip not found"
+        )
+
+    if not await is_member(db, trip, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not a participant of this trip"
+        )
+
+    query = history_query(trip_id)
+    if after_id is not None:
+        query = query.filter(TripMessage.id > after_id).order_by(TripMessage.id)
+    else:
+        query = query.filter(TripMessage.created_at > since).order_by(TripMessage.created_at, TripMessage.id)
+    query = query.limit(limit)
+
+    # Ожидание регистрируется до запроса: сообщение между запросом и ожиданием не потеряется
+    waiter = trip_waiters.register(trip_id) if wait else None
+    try:
+        messages = fetch_page(await db.execute(query))
+        if not messages and waiter is not None:
+            # Соединение не держится во время ожидания
+            await db.close()
+            async with not_in_flight():
+                woken = await trip_waiters.wait(waiter, wait)
+            if woken:
+                # Реплика могла ещё не получить сообщение: читаем с основной базы
+                async with AsyncSessionLocal() as primary:
+                    messages = fetch_page(await primary.execute(query))
+    finally:
+        if waiter is not None:
+            trip_waiters.discard(trip_id, waiter)
+
+    if FAST_SERIALIZATION:
+        return message_rows.response(messages, headers=response.headers)
+    return messages
+
+
+@router.get("/trip/{trip_id}/export", dependencies=[Depends(rate_limit(EXPORT_LIMIT))])
+async def export_trip_messages(
+        trip_id: int,
+        export_format: str = Query("ndjson", alias="format", pattern=EXPORT_FORMAT_PATTERN),
+        cursor: Optional[str] = None,
+        limit: Optional[int] = Query(None, ge=1),
+        db: AsyncSession = Depends(get_read_session),
+        current_user=Depends(get_current_user)
+):
+    """Потоковая выгрузка истории чата (NDJSON или CSV); cursor - продолжение после обрыва"""
+    result = await db.execute(select(Trip).filter(Trip.id == trip_id))
+    trip = result.scalars().first()
+    if not trip:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trip not found"
+        )
+
+    if not await is_member(db, trip, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not a participant of this trip"
+        )
+    # Поток читает в своей сессии, соединение проверки возвращается в пул
+    await db.close()
+
+    query = (
+        select(*schema_columns(schemas.TripMessageResponse, TripMessage), User.username.label("author_username"))
+        .join(TripMessage.author)
+        .filter(TripMessage.trip_id == trip_id)
+    )
+    if cursor:
+        query = query.filter(
+            after_cursor((TripMessage.created_at, TripMessage.id), cursor, (datetime, int))
+        )
+    query = query.order_by(TripMessage.created_at, TripMessage.id)
+    if limit:
+        query = query.limit(limit)
+
+    return export_response(
+        query, lambda row: (row.created_at, row.id), export_format, f"trip-{trip_id}-messages",
+        user_id=current_user.id
+    )
+
+
+@router.post(
+    "/trip/{trip_id}",
+    response_model=schemas.TripMessageResponse,
+    dependencies=[Depends(rate_limit(CHAT_LIMIT))]
+)
 async def send_trip_message(
         trip_id: int,
         message: schemas.TripMessageCreate,
-        db: Session = Depends(get_session),
+        db: AsyncSession = Depends(get_async_session),
         current_user=Depends(get_current_user)
 ):
     """Отправить сообщение в чат поездки"""
-    trip = db.query(Trip).filter(Trip.id == trip_id).first()
+    result = await db.execute(select(Trip).filter(Trip.id == trip_id))
+    trip = result.scalars().first()
     if not trip:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Trip not found"
         )
 
-    if current_user not in trip.participants and current_user.id != trip.organizer_id:
+    if not await is_member(db, trip, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not a participant of this trip"
         )
 
-    db_message = TripMessage(
-        content=message.content,
-        trip_id=trip_id,
-        author_id=current_user.id
-    )
+    # Соединение возвращается в пул до ожидания записи: иначе при нагрузке
+    # запросы занимают весь пул и пакетной записи не достаётся соединения
+    await db.close()
 
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    # Запись пакетом вместе с сообщениями из WebSocket; рассылка - после фиксации
+    pending = await chat_ingest.submit(trip_id, current_user.id, current_user.username, message.content)
+    db_message = await pending
 
     # Отправка уведомления через WebSocket
     await notify_trip_participants(trip_id, db_message, db)
@@ -84,64 +242,131 @@ async def websocket_trip_chat(
         websocket: WebSocket,
         trip_id: int,
         token: str,
-        db: Session = Depends(get_session)
+        after_id: Optional[int] = None,
+        db: AsyncSession = Depends(get_async_session)
 ):
-    """WebSocket для чата поездки"""
+    """WebSocket для чата поездки; after_id - сначала прислать пропущенные после него сообщения"""
     # Валидация токена и пользователя
     from auth import get_current_user_ws
 
     try:
         user = await get_current_user_ws(token, db)
-        trip = db.query(Trip).filter(Trip.id == trip_id).first()
+        result = await db.execute(select(Trip).filter(Trip.id == trip_id))
+        trip = result.scalars().first()
 
-        if not trip or user not in trip.participants:
+        if not trip or not user or not await is_member(db, trip, user.id):
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
 
-        await websocket.accept()
+        user_id, username = user.id, user.username
+        refused = active_connections.admit(trip_id, user_id)
+        if refused:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=refused)
+            return
+
+        try:
+            await websocket.accept()
+        except BaseException:
+            active_connections.release(trip_id, user_id)
+            raise
+
+        # Добавление соединения в активные; при восстановлении живые события
+        # придерживаются, пока не отправлены пропущенные
+        connection = active_connections.add(trip_id, websocket, user_id, hold=after_id is not None)
+        if after_id is not None:
+            result = await db.execute(
+                select(TripMessage, User.username)
+                .join(TripMessage.author)
+                .filter(TripMessage.trip_id == trip_id, TripMessage.id > after_id)
+                .order_by(TripMessage.id)
+                .limit(CHAT_RESUME_LIMIT + 1)
+            )
+            missed = result.all()
 
-        # Добавление соединения в активные
-        if trip_id not in active_connections:
-            active_connections[trip_id] = []
-        active_connections[trip_id].append(websocket)
+        # Сессия больше не нужна: соединение с БД не держится всё время жизни сокета
+        await db.close()
+        if after_id is not None:
+            await connection.resume(
+                [message_event(message, author) for message, author in missed[:CHAT_RESUME_LIMIT]],
+                complete=len(missed) <= CHAT_RESUME_LIMIT
+            )
 
         try:
             while True:
                 data = await websocket.receive_text()
-                message_data = json.loads(data)
-
-                # Сохранение сообщения в БД
-                db_message = TripMessage(
-                    content=message_data["content"],
-                    trip_id=trip_id,
-                    author_id=user.id
-                )
-                db.add(db_message)
-                db.commit()
-
-                # Рассылка сообщения всем участникам
-                await broadcast_message(trip_id, {
-                    "type": "message",
-                    "content": message_data["content"],
-                    "author": user.username,
-                    "timestamp": db_message.created_at.isoformat()
-                })
+
+                # Тот же лимит, что у POST /messages/trip/{trip_id}
+                if await limiter.check(CHAT_LIMIT, f"user:{user_id}"):
+                    connection.offer(json.dumps({"type": "error", "detail": "Too many messages"}))
+                    continue
+
+                # Та же проверка, что у POST: в общий пакет записи попадают только корректные сообщения
+                try:
+                    message_data = schemas.TripMessageCreate.model_validate_json(data)
+                except ValidationError as e:
+                    detail = e.errors(include_url=False, include_input=False)
+                    connection.offer(json.dumps({"type": "error", "detail": detail}, default=str))
+                    continue
+
+                # Сохранение пакетом и рассылка всем участникам после фиксации.
+                # Результат не ждём: очередь сохраняет порядок сообщений сокета
+                pending = await chat_ingest.submit(trip_id, user_id, username, message_data.content)
+                pending.add_done_callback(lambda future: report_failed_message(connection, future))
+                await mark_write(user_id)
 
         except WebSocketDisconnect:
-            active_connections[trip_id].remove(websocket)
+            pass
+        finally:
+            await active_connections.remove(connection)
+
+    except Exception:
+        logger.exception("Trip chat WebSocket failed")
+        # Сокет мог уже закрыть писатель или вытеснение медленного клиента
+        with contextlib.suppress(Exception):
+            await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+
+
+def message_event(message: TripMessage, author: str) -> dict:
+    """Событие чата в формате WebSocket"""
+    return {
+        "type": "message",
+        "id": message.id,
+        "content": message.content,
+        "author": author,
+        "author_id": message.author_id,
+        "timestamp": message.created_at.isoformat()
+    }
+
 
-    except Exception as e:
-        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+async def deliver_local(trip_id: int, message: dict):
+    """Отправка события соединениям и long-poll запросам этого воркера"""
+    active_connections.broadcast(trip_id, message)
+    trip_waiters.notify(trip_id)
+
+
+chat_broker = build_broker(deliver_local)
 
 
 async def broadcast_message(trip_id: int, message: dict):
-    """Отправка сообщения всем участникам поездки"""
-    if trip_id in active_connections:
-        for connection in active_connections[trip_id]:
-            await connection.send_json(message)
+    """Отправка сообщения всем участникам поездки через брокер"""
+    await chat_broker.publish(trip_id, message)
+
+
+async def publish_committed(message: TripMessage, author: str):
+    await broadcast_message(message.trip_id, message_event(message, author))
+
+
+def report_failed_message(connection, future):
+    """Сообщает отправителю, что сообщение не удалось сохранить"""
+    if future.cancelled() or future.exception() is None:
+        return
+    connection.offer(json.dumps({"type": "error", "detail": "Message was not saved"}))
+
+
+chat_ingest = ChatIngest(AsyncSessionLocal, publish_committed)
 
 
-async def notify_trip_participants(trip_id: int, message: TripMessage, db: Session):
+async def notify_trip_participants(trip_id: int, message: TripMessage, db: AsyncSession):
     """Уведомление участников о новом сообщении"""
     # Здесь можно добавить отправку email/push уведомлений
     pass
@@ -0,0 +1,220 @@
+"""Метрики запросов в формате Prometheus.
+
+MetricsMiddleware замеряет для каждого HTTP-запроса время, размер ответа,
+число SQL-выражений и время в БД (через события движков SQLAlchemy) и
+складывает их в гистограммы по шаблону маршрута и роутеру (тегу).
+Счётчик SQL привязан к запросу через contextvar, поэтому параллельные
+запросы не смешиваются. GET /metrics отдаёт всё в текстовом формате
+Prometheus. В режиме отладки (DEBUG=1 или ENV=development) в ответ
+добавляется заголовок Server-Timing.
+"""
+from fastapi import APIRouter, Response
+from sqlalchemy import event
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+import os
+import time
+
+from database import engine, async_engine, replica_engines, get_pool_metrics
+
+DEBUG = os.getenv("DEBUG", "").lower() in ("1", "true", "yes") or os.getenv("ENV") == "development"
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+class RequestStats:
+    __slots__ = ("sql_count", "sql_time")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series: Dict[tuple, list] = {}
+
+    def observe(self, label_values: tuple, value: float):
+        # [счётчики корзин..., сумма, количество]
+        series = self.series.setdefault(label_values, [0] * len(self.buckets) + [0.0, 0])
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self.series.items()):
+            labels = _labels(self.labels, label_values)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.series: Dict[tuple, float] = {}
+
+    def inc(self, label_values: tuple, amount: float = 1):
+        self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{{{_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+ROUTE_LABELS = ("method", "route", "router")
+
+requests_total = Counter("http_requests_total", "HTTP requests by status", ROUTE_LABELS + ("status",))
+request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ROUTE_LABELS, LATENCY_BUCKETS)
+request_sql_statements = Histogram(
+    "http_request_sql_statements", "SQL statements executed per request", ROUTE_LABELS, SQL_COUNT_BUCKETS)
+request_sql_duration = Histogram(
+    "http_request_sql_duration_seconds", "Time spent in SQL per request", ROUTE_LABELS, LATENCY_BUCKETS)
+response_size = Histogram(
+    "http_response_size_bytes", "HTTP response body size", ROUTE_LABELS, SIZE_BUCKETS)
+
+in_flight = 0
+
+
+# ========== SQL ==========
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    stats = current_request.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_time += time.perf_counter() - started
+
+
+def instrument_engine(sync_engine):
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+for replica in replica_engines:
+    instrument_engine(replica.sync_engine)
+
+
+# ========== MIDDLEWARE ==========
+def route_labels(scope) -> tuple:
+    route = scope.get("route")
+    if route is None:
+        return scope["method"], "unmatched", ""
+    tags = getattr(route, "tags", None)
+    return scope["method"], route.path, tags[0] if tags else ""
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: без BaseHTTPMiddleware, чтобы не менять задачу и контекст запроса"""
+
+    def __init__(self, app, server_timing: bool = DEBUG):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        global in_flight
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status_code, size = 500, 0
+        in_flight += 1
+
+        async def send_with_metrics(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    elapsed = (time.perf_counter() - started) * 1000
+                    timing = (
+                        f'app;dur={elapsed:.2f}, '
+                        f'db;dur={stats.sql_time * 1000:.2f};desc="{stats.sql_count} queries"'
+                    )
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            in_flight -= 1
+            current_request.reset(token)
+            labels = route_labels(scope)
+            requests_total.inc(labels + (status_code,))
+            request_duration.observe(labels, time.perf_counter() - started)
+            request_sql_statements.observe(labels, stats.sql_count)
+            request_sql_duration.observe(labels, stats.sql_time)
+            response_size.observe(labels, size)
+
+
+# ========== /metrics ==========
+def render_metrics() -> str:
+    lines = [
+        "# HELP http_requests_in_flight HTTP requests being processed",
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {in_flight}",
+    ]
+    for metric in (requests_total, request_duration, request_sql_statements, request_sql_duration, response_size):
+        lines.extend(metric.expose())
+
+    pools = get_pool_metrics()
+    lines.append("# HELP db_pool_connections Database pool connections by state")
+    lines.append("# TYPE db_pool_connections gauge")
+    for pool in pools:
+        for state in ("checked_out", "checked_in", "overflow"):
+            if state in pool:
+                lines.append(f'db_pool_connections{{{_labels(("engine", "state"), (pool["engine"], state))}}} {pool[state]}')
+    lines.append("# HELP db_pool_checkout_timeouts_total Pool checkouts that timed out")
+    lines.append("# TYPE db_pool_checkout_timeouts_total counter")
+    for pool in pools:
+        if "wait" in pool:
+            lines.append(f'db_pool_checkout_timeouts_total{{engine="{pool["engine"]}"}} {pool["wait"]["timeouts"]}')
+    return "\n".join(lines) + "\n"
+
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
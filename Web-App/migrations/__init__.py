@@ -0,0 +1,42 @@
+"""Версионные миграции схемы.
+
+Новые базы получают актуальную схему через Base.metadata.create_all, а
+существующие доводятся до неё миграциями. Каждая миграция - модуль vNNN_*.py
+с функцией upgrade(connection); применённые версии хранятся в таблице
+schema_migrations. Миграции должны быть идемпотентны: на свежей базе они
+выполняются поверх уже созданной схемы.
+
+Запуск вручную: python -m migrations (миграции также выполняются при старте приложения).
+"""
+from sqlalchemy import MetaData, Table, Column, String, DateTime, select, func
+import importlib
+import pkgutil
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", String(100), primary_key=True),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now())
+)
+
+
+def discover() -> list:
+    return sorted(name for _, name, _ in pkgutil.iter_modules(__path__) if name.startswith("v"))
+
+
+def upgrade(connection) -> list:
+    """Применяет недостающие миграции в рамках транзакции connection"""
+    schema_migrations.create(connection, checkfirst=True)
+    applied = set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+    done = []
+    for name in discover():
+        if name in applied:
+            continue
+        module = importlib.import_module(f"{__name__}.{name}")
+        module.upgrade(connection)
+        connection.execute(schema_migrations.insert().values(version=name))
+        done.append(name)
+    return done
@@ -0,0 +1,8 @@
+from database import Base, engine
+from migrations import upgrade
+
+if __name__ == "__main__":
+    with engine.begin() as connection:
+        Base.metadata.create_all(bind=connection)
+        applied = upgrade(connection)
+    print(f"Applied migrations: {', '.join(applied) if applied else 'none'}")
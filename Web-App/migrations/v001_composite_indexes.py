@@ -0,0 +1,57 @@
+"""Составные индексы под реальные запросы и первичный ключ trip_participants"""
+from sqlalchemy import MetaData, Table, Column, Integer, ForeignKey, Index, inspect, select, and_
+
+INDEXES = [
+    ("trips", "ix_trips_status_start_date", ("status", "start_date", "id")),
+    ("trips", "ix_trips_start_date_id", ("start_date", "id")),
+    ("trips", "ix_trips_organizer_id", ("organizer_id",)),
+    ("trip_messages", "ix_trip_messages_trip_created", ("trip_id", "created_at", "id")),
+    ("trip_participants", "ix_trip_participants_user_id", ("user_id",)),
+]
+
+
+def _rebuild_participants(connection, primary_key: bool):
+    """Пересоздаёт trip_participants с ключом (trip_id, user_id) или без него.
+
+    ALTER TABLE ... ADD PRIMARY KEY недоступен в SQLite, поэтому таблица
+    переименовывается и копируется - одинаково для SQLite и Postgres.
+    Дубликаты строк при добавлении ключа отбрасываются.
+    """
+    connection.exec_driver_sql("ALTER TABLE trip_participants RENAME TO trip_participants_old")
+
+    metadata = MetaData()
+    Table("trips", metadata, Column("id", Integer, primary_key=True))
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    old = Table("trip_participants_old", metadata, autoload_with=connection)
+    new = Table(
+        "trip_participants",
+        metadata,
+        Column("trip_id", Integer, ForeignKey("trips.id", ondelete="CASCADE"), primary_key=primary_key),
+        Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=primary_key)
+    )
+    new.create(connection)
+    rows = select(old.c.trip_id, old.c.user_id)
+    if primary_key:
+        rows = rows.where(and_(old.c.trip_id.isnot(None), old.c.user_id.isnot(None))).distinct()
+    connection.execute(new.insert().from_select(["trip_id", "user_id"], rows))
+    old.drop(connection)
+
+
+def upgrade(connection):
+    inspector = inspect(connection)
+    if not inspector.get_pk_constraint("trip_participants").get("constrained_columns"):
+        _rebuild_participants(connection, primary_key=True)
+
+    metadata = MetaData()
+    tables = {}
+    for table_name, index_name, columns in INDEXES:
+        if table_name not in tables:
+            tables[table_name] = Table(table_name, metadata, autoload_with=connection)
+        table = tables[table_name]
+        Index(index_name, *(table.c[column] for column in columns)).create(connection, checkfirst=True)
+
+
+def downgrade(connection):
+    for _, index_name, _ in INDEXES:
+        connection.exec_driver_sql(f"DROP INDEX IF EXISTS {index_name}")
+    _rebuild_participants(connection, primary_key=False)
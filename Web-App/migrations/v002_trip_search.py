@@ -0,0 +1,77 @@
+"""Поиск поездок: нормализованные колонки и поисковые индексы.
+
+Postgres - pg_trgm по destination_normalized (подстрока с ведущим %)
+и полнотекстовый GIN по search_text. SQLite - внешняя таблица FTS5
+trips_fts, синхронизируемая триггерами.
+"""
+from sqlalchemy import MetaData, Table, inspect, select, update, bindparam
+
+from models import trip_search_fields
+
+BATCH_SIZE = 1000
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS trips_fts USING fts5(
+        destination_normalized, search_text,
+        content='trips', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS trips_fts_insert AFTER INSERT ON trips BEGIN
+        INSERT INTO trips_fts(rowid, destination_normalized, search_text)
+        VALUES (new.id, new.destination_normalized, new.search_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trips_fts_delete AFTER DELETE ON trips BEGIN
+        INSERT INTO trips_fts(trips_fts, rowid, destination_normalized, search_text)
+        VALUES ('delete', old.id, old.destination_normalized, old.search_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trips_fts_update
+        AFTER UPDATE OF destination_normalized, search_text ON trips BEGIN
+        INSERT INTO trips_fts(trips_fts, rowid, destination_normalized, search_text)
+        VALUES ('delete', old.id, old.destination_normalized, old.search_text);
+        INSERT INTO trips_fts(rowid, destination_normalized, search_text)
+        VALUES (new.id, new.destination_normalized, new.search_text);
+    END""",
+    "INSERT INTO trips_fts(trips_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """CREATE INDEX IF NOT EXISTS ix_trips_destination_trgm
+        ON trips USING gin (destination_normalized gin_trgm_ops)""",
+    """CREATE INDEX IF NOT EXISTS ix_trips_search_fts
+        ON trips USING gin (to_tsvector('simple', coalesce(search_text, '')))""",
+]
+
+
+def _backfill(connection):
+    trips = Table("trips", MetaData(), autoload_with=connection)
+    rows = connection.execute(
+        select(trips.c.id, trips.c.title, trips.c.description, trips.c.destination)
+        .where(trips.c.search_text.is_(None))
+    ).fetchall()
+    statement = (
+        update(trips)
+        .where(trips.c.id == bindparam("trip_id"))
+        .values(destination_normalized=bindparam("dest"), search_text=bindparam("text"))
+    )
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = []
+        for row in rows[start:start + BATCH_SIZE]:
+            fields = trip_search_fields(row.title, row.description, row.destination)
+            batch.append({"trip_id": row.id, "dest": fields["destination_normalized"], "text": fields["search_text"]})
+        connection.execute(statement, batch)
+
+
+def upgrade(connection):
+    existing = {column["name"] for column in inspect(connection).get_columns("trips")}
+    if "destination_normalized" not in existing:
+        connection.exec_driver_sql("ALTER TABLE trips ADD COLUMN destination_normalized VARCHAR(200)")
+    if "search_text" not in existing:
+        connection.exec_driver_sql("ALTER TABLE trips ADD COLUMN search_text TEXT")
+    _backfill(connection)
+
+    if connection.dialect.name == "sqlite":
+        for statement in SQLITE_DDL:
+            connection.exec_driver_sql(statement)
+    elif connection.dialect.name == "postgresql":
+        for statement in POSTGRES_DDL:
+            connection.exec_driver_sql(statement)
@@ -0,0 +1,18 @@
+"""Денормализованные счётчики поездки: participant_count и pending_application_count.
+
+Колонки добавляются с нулём по умолчанию и заполняются тем же пересчётом,
+которым capacity.reconcile_counters исправляет расхождения.
+"""
+from sqlalchemy import inspect
+
+from capacity import reconcile_statement
+
+COLUMNS = ("participant_count", "pending_application_count")
+
+
+def upgrade(connection):
+    existing = {column["name"] for column in inspect(connection).get_columns("trips")}
+    for name in COLUMNS:
+        if name not in existing:
+            connection.exec_driver_sql(f"ALTER TABLE trips ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0")
+    connection.execute(reconcile_statement())
@@ -0,0 +1,10 @@
+"""Таблица предвычисленных рекомендаций trip_recommendations.
+
+Заполняется фоновым пересчётом (recommendations.RecommendationRefresher)
+при первом старте приложения с пустой таблицей.
+"""
+from models import TripRecommendation
+
+
+def upgrade(connection):
+    TripRecommendation.__table__.create(connection, checkfirst=True)
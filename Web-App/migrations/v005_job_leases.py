@@ -0,0 +1,6 @@
+"""Таблица job_leases: аренда периодических задач одним воркером (leases.py)"""
+from models import JobLease
+
+
+def upgrade(connection):
+    JobLease.__table__.create(connection, checkfirst=True)
@@ -1,16 +1,21 @@
 from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, ForeignKey, Enum, Table
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, Index
+from sqlalchemy import event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
+import unicodedata
+from datetime import datetime, timezone
 from database import Base
 
 # Таблица связей многие-ко-многим для участников поездки
 trip_participants = Table(
     'trip_participants',
     Base.metadata,
-    Column('trip_id', Integer, ForeignKey('trips.id', ondelete='CASCADE')),
-    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'))
+    Column('trip_id', Integer, ForeignKey('trips.id', ondelete='CASCADE'), primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+    # Первичный ключ (trip_id, user_id) покрывает проверку участия, этот - поездки пользователя
+    Index('ix_trip_participants_user_id', 'user_id')
 )
 
 
@@ -65,12 +70,50 @@ class Trip(Base):
     organizer_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Нормализованные копии для поиска (см. normalize_text), заполняются автоматически
+    destination_normalized = Column(String(200))
+    search_text = Column(Text)
+
+    # Денормализованные счётчики (см. capacity.py): участники и заявки в ожидании
+    participant_count = Column(Integer, nullable=False, default=0, server_default="0")
+    pending_application_count = Column(Integer, nullable=False, default=0, server_default="0")
+
     # Связи
     organizer = relationship("User", back_populates="organized_trips", foreign_keys=[organizer_id])
     participants = relationship("User", secondary=trip_participants, back_populates="participated_trips")
     messages = relationship("TripMessage", back_populates="trip", cascade="all, delete-orphan")
     applications = relationship("TripApplication", back_populates="trip", cascade="all, delete-orphan")
 
+    # Индексы под list_trips: фильтр по статусу и диапазону дат, сортировка (start_date, id)
+    __table_args__ = (
+        Index("ix_trips_status_start_date", "status", "start_date", "id"),
+        Index("ix_trips_start_date_id", "start_date", "id"),
+        Index("ix_trips_organizer_id", "organizer_id"),
+    )
+
+
+def normalize_text(value):
+    """Приводит текст к виду для поиска: нижний регистр, без диакритики"""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def trip_search_fields(title, description, destination) -> dict:
+    """Значения поисковых колонок поездки; для массовых вставок мимо ORM"""
+    return {
+        "destination_normalized": normalize_text(destination),
+        "search_text": " ".join(normalize_text(part) for part in (title, description, destination) if part),
+    }
+
+
+@event.listens_for(Trip, "before_insert")
+@event.listens_for(Trip, "before_update")
+def _fill_trip_search_fields(mapper, connection, trip):
+    for key, value in trip_search_fields(trip.title, trip.description, trip.destination).items():
+        setattr(trip, key, value)
+
 
 class TripMessage(Base):
     __tablename__ = "trip_messages"
@@ -80,12 +123,23 @@ class TripMessage(Base):
     trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False)
     author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     is_system = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Ключ сортировки и курсора чата: нужна точность до микросекунд,
+    # поэтому время проставляется приложением (CURRENT_TIMESTAMP в SQLite - до секунды)
+    created_at = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now()
+    )
 
     # Связи
     trip = relationship("Trip", back_populates="messages")
     author = relationship("User", back_populates="trip_messages")
 
+    # История чата всегда читается по поездке в порядке (created_at, id)
+    __table_args__ = (
+        Index("ix_trip_messages_trip_created", "trip_id", "created_at", "id"),
+    )
+
 
 class ApplicationStatus(str, enum.Enum):
     PENDING = "pending"
@@ -111,3 +165,30 @@ class TripApplication(Base):
     # Уникальный ключ, чтобы пользователь не мог подать две заявки на одну поездку
 
     __table_args__ = (UniqueConstraint('trip_id', 'applicant_id', name='_trip_applicant_uc'),)
+
+
+class TripRecommendation(Base):
+    """Предвычисленный top-K поездок пользователя (recommendations.py)"""
+    __tablename__ = "trip_recommendations"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Выдача - top-K пользователя по убыванию оценки; trip_id - для пересчёта поездки
+    __table_args__ = (
+        Index("ix_trip_recommendations_user_score", "user_id", "score"),
+        Index("ix_trip_recommendations_trip_id", "trip_id"),
+    )
+
+
+class JobLease(Base):
+    """Аренда фоновой задачи одним воркером (leases.py)"""
+    __tablename__ = "job_leases"
+
+    name = Column(String(100), primary_key=True)
+    holder = Column(String(200))
+    # Время в секундах epoch: сравнивается с time.time() воркеров
+    expires_at = Column(Float, nullable=False, default=0.0)
+    finished_at = Column(Float)
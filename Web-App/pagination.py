@@ -0,0 +1,60 @@
+"""Keyset-пагинация по непрозрачному курсору.
+
+Курсор кодирует значения ключа сортировки последней строки страницы.
+Следующая страница выбирается условием (k1, k2) > (v1, v2) по индексу,
+без пропуска OFFSET строк. Курсор следующей страницы возвращается
+в заголовке X-Next-Cursor, тело ответа остаётся списком.
+"""
+from fastapi import HTTPException, Response, status
+from sqlalchemy import tuple_
+from datetime import datetime
+import base64
+import json
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(value, value_type):
+    if value_type is datetime:
+        return datetime.fromisoformat(value)
+    return value_type(value)
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([_encode_value(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: tuple) -> list:
+    """Разбирает курсор; types - типы значений ключа по порядку"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError(cursor)
+        return [_decode_value(value, value_type) for value, value_type in zip(values, types)]
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def after_cursor(columns: tuple, cursor: str, types: tuple):
+    """Условие "строго после курсора" для ключа сортировки columns"""
+    values = decode_cursor(cursor, types)
+    if len(columns) == 1:
+        return columns[0] > values[0]
+    return tuple_(*columns) > tuple_(*values)
+
+
+def set_next_cursor(response: Response, rows: list, limit: int, key):
+    """Выставляет курсор следующей страницы, если страница заполнена целиком"""
+    if rows and len(rows) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
@@ -0,0 +1,204 @@
+"""Профилирование работающего воркера (только для админа).
+
+- ?profile=1 у любого HTTP-запроса: запрос выполняется под профилировщиком,
+  вместо тела ответа возвращается отчёт (исходный статус - в X-Profiled-Status).
+  Если установлен pyinstrument, отчёт - дерево вызовов с учётом async,
+  иначе - статистика cProfile, отсортированная по cumulative.
+- profile_process(seconds) - cProfile потока event loop в течение заданного
+  времени: попадают все запросы, обработанные за это время.
+- tracemalloc: запуск, топ аллокаций и разница с предыдущим снимком.
+
+Одновременно работает только один профилировщик. Профиль одного запроса
+в async-приложении включает и корутины других запросов, выполнявшиеся
+в то же время; на нагруженном воркере это нужно учитывать.
+"""
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+from urllib.parse import parse_qs
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+
+from database import AsyncSessionLocal
+
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", 60))
+SORT_KEYS = ("cumulative", "tottime", "calls", "ncalls")
+
+try:
+    import pyinstrument
+except ImportError:  # без pyinstrument отчёт строится по cProfile
+    pyinstrument = None
+
+profiler_lock = asyncio.Lock()
+_last_snapshot = None
+
+
+def stats_report(profiler: cProfile.Profile, sort: str = "cumulative", top: int = PROFILE_TOP) -> str:
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.strip_dirs().sort_stats(sort if sort in SORT_KEYS else "cumulative").print_stats(top)
+    return output.getvalue()
+
+
+class _Profiler:
+    """pyinstrument, если установлен, иначе cProfile - с одинаковым интерфейсом"""
+
+    def __init__(self, sort: str = "cumulative"):
+        self.sort = sort
+        if pyinstrument is not None:
+            self._profiler = pyinstrument.Profiler(async_mode="enabled")
+        else:
+            self._profiler = cProfile.Profile()
+
+    def start(self):
+        if pyinstrument is not None:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if pyinstrument is not None:
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def report(self) -> str:
+        if pyinstrument is not None:
+            return self._profiler.output_text(unicode=True, color=False)
+        return stats_report(self._profiler, self.sort)
+
+
+def _busy():
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Another profiling session is running"
+    )
+
+
+async def _require_admin(scope):
+    """Та же проверка, что у зависимости require_role("admin")"""
+    from auth import get_current_user, require_role
+
+    headers = dict(scope.get("headers") or [])
+    authorization = headers.get(b"authorization", b"").decode()
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    async with AsyncSessionLocal() as db:
+        user = await get_current_user(token, db)
+    require_role("admin")(user)
+
+
+class ProfilingMiddleware:
+    """Обрабатывает ?profile=1; остальные запросы проходят без накладных расходов"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or b"profile=" not in scope.get("query_string", b""):
+            await self.app(scope, receive, send)
+            return
+
+        query = parse_qs(scope["query_string"].decode())
+        if query.get("profile", ["0"])[0] not in ("1", "true"):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await _require_admin(scope)
+            if profiler_lock.locked():
+                _busy()
+        except HTTPException as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code)
+            await response(scope, receive, send)
+            return
+
+        original_status = 500
+
+        async def discard_response(message):
+            nonlocal original_status
+            if message["type"] == "http.response.start":
+                original_status = message["status"]
+
+        async with profiler_lock:
+            profiler = _Profiler(query.get("sort", ["cumulative"])[0])
+            profiler.start()
+            try:
+                await self.app(scope, receive, discard_response)
+            finally:
+                profiler.stop()
+
+        response = PlainTextResponse(profiler.report(), headers={"X-Profiled-Status": str(original_status)})
+        await response(scope, receive, send)
+
+
+async def profile_process(seconds: float, sort: str = "cumulative", top: int = PROFILE_TOP) -> str:
+    """cProfile потока event loop на seconds секунд"""
+    if profiler_lock.locked():
+        _busy()
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    async with profiler_lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+    return f"# whole-process profile, {seconds:.1f}s\n" + stats_report(profiler, sort, top)
+
+
+def start_tracemalloc(frames: int = 10) -> dict:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return tracemalloc_status()
+
+
+def stop_tracemalloc() -> dict:
+    global _last_snapshot
+    tracemalloc.stop()
+    _last_snapshot = None
+    return tracemalloc_status()
+
+
+def tracemalloc_status() -> dict:
+    tracing = tracemalloc.is_tracing()
+    current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    return {
+        "tracing": tracing,
+        "frames": tracemalloc.get_traceback_limit() if tracing else 0,
+        "current_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def top_allocations(limit: int = 20, group_by: str = "lineno", compare: bool = False) -> dict:
+    """Топ аллокаций; compare=True - прирост с предыдущего вызова"""
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="tracemalloc is not running"
+        )
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    if compare and _last_snapshot is not None:
+        stats = snapshot.compare_to(_last_snapshot, group_by)
+        top = [
+            {"location": str(stat.traceback), "size_diff_kb": round(stat.size_diff / 1024, 1),
+             "size_kb": round(stat.size / 1024, 1), "count_diff": stat.count_diff}
+            for stat in stats[:limit]
+        ]
+    else:
+        top = [
+            {"location": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in snapshot.statistics(group_by)[:limit]
+        ]
+    _last_snapshot = snapshot
+    return {**tracemalloc_status(), "group_by": group_by, "compared": compare, "top": top}
@@ -0,0 +1,221 @@
+"""Статистика SQL-запросов по отпечаткам и журнал медленных запросов.
+
+Каждое выражение, выполненное движками, нормализуется в отпечаток:
+литералы и параметры заменяются на ?, списки IN (...) и VALUES
+сворачиваются. По отпечатку копятся число выполнений, суммарное,
+максимальное и среднее время. Выражения дольше SLOW_QUERY_MS попадают
+в кольцевой буфер; с SLOW_QUERY_EXPLAIN=1 для медленного SELECT
+снимается план (EXPLAIN без ANALYZE - запрос повторно не выполняется),
+не чаще раза в SLOW_QUERY_EXPLAIN_INTERVAL секунд на отпечаток.
+"""
+from sqlalchemy import event
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import hashlib
+import logging
+import os
+import re
+import time
+
+from database import engine, async_engine, replica_engines
+
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", 200))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "false").lower() in ("1", "true", "yes")
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", 300))
+QUERY_FINGERPRINTS_MAX = int(os.getenv("QUERY_FINGERPRINTS_MAX", 5000))
+
+STATEMENT_PREVIEW = 2000
+
+logger = logging.getLogger(__name__)
+
+_PATTERNS = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),                      # строковые литералы
+    (re.compile(r"%\(\w+\)s|\$\d+|%s"), "?"),                   # параметры драйверов
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),                    # числа
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(...)"),       # IN (?, ?, ?)
+    (re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+"), "(...)"),  # VALUES (...), (...)
+]
+
+
+def normalize_statement(statement: str) -> str:
+    for pattern, replacement in _PATTERNS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+
+
+class QueryStats:
+    __slots__ = ("statement", "count", "total", "max", "slow", "plan", "plan_at", "last_seen")
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.plan: Optional[list] = None
+        self.plan_at = 0.0
+        self.last_seen = 0.0
+
+    def as_dict(self, key: str) -> dict:
+        return {
+            "fingerprint": key,
+            "statement": self.statement[:STATEMENT_PREVIEW],
+            "count": self.count,
+            "slow": self.slow,
+            "total_ms": round(self.total * 1000, 3),
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "plan": self.plan,
+        }
+
+
+class QueryLog:
+    def __init__(
+        self,
+        slow_ms: float = SLOW_QUERY_MS,
+        size: int = SLOW_QUERY_LOG_SIZE,
+        explain: bool = SLOW_QUERY_EXPLAIN,
+        max_fingerprints: int = QUERY_FINGERPRINTS_MAX
+    ):
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.max_fingerprints = max_fingerprints
+        self.stats: Dict[str, QueryStats] = {}
+        self.slow_queries: deque = deque(maxlen=size)
+        self.untracked = 0
+        self._fingerprints: Dict[str, tuple] = {}
+
+    def _fingerprint(self, statement: str) -> tuple:
+        # Текст выражения повторяется: нормализация кэшируется по исходной строке
+        cached = self._fingerprints.get(statement)
+        if cached is None:
+            normalized = normalize_statement(statement)
+            cached = (fingerprint(normalized), normalized)
+            if len(self._fingerprints) < self.max_fingerprints * 4:
+                self._fingerprints[statement] = cached
+        return cached
+
+    def record(self, conn, cursor, statement: str, parameters, executemany: bool, elapsed: float):
+        key, normalized = self._fingerprint(statement)
+        stats = self.stats.get(key)
+        if stats is None:
+            if len(self.stats) >= self.max_fingerprints:
+                self.untracked += 1
+                return
+            stats = self.stats[key] = QueryStats(normalized)
+        stats.count += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+        stats.last_seen = time.time()
+
+        if elapsed * 1000 < self.slow_ms:
+            return
+        stats.slow += 1
+        entry = {
+            "fingerprint": key,
+            "statement": statement[:STATEMENT_PREVIEW],
+            "duration_ms": round(elapsed * 1000, 3),
+            "executemany": executemany,
+            "at": datetime.now(timezone.utc).isoformat(),
+        }
+        if self.explain and not executemany and normalized.lower().startswith("select") \
+                and time.time() - stats.plan_at > SLOW_QUERY_EXPLAIN_INTERVAL:
+            stats.plan = self._explain(conn, statement, parameters)
+            stats.plan_at = time.time()
+            entry["plan"] = stats.plan
+        self.slow_queries.append(entry)
+        logger.warning("Slow query %.1f ms [%s]: %s", elapsed * 1000, key, normalized[:200])
+
+    @staticmethod
+    def _explain(conn, statement: str, parameters) -> list:
+        """План на той же DBAPI-соединении; события движка при этом не срабатывают.
+
+        Соединение находится внутри транзакции запроса, а в Postgres любая
+        ошибка прерывает её целиком, поэтому EXPLAIN выполняется в точке
+        сохранения и при ошибке откатывается только она. В SQLite ошибка
+        EXPLAIN транзакцию не прерывает.
+        """
+        dialect = conn.dialect.name
+        prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+        savepoint = dialect != "sqlite"
+        try:
+            cursor = conn.connection.dbapi_connection.cursor()
+            try:
+                if savepoint:
+                    cursor.execute("SAVEPOINT query_log_explain")
+                try:
+                    cursor.execute(prefix + statement, parameters)
+                    rows = cursor.fetchall()
+                except Exception:
+                    if savepoint:
+                        cursor.execute("ROLLBACK TO SAVEPOINT query_log_explain")
+                    raise
+                if savepoint:
+                    cursor.execute("RELEASE SAVEPOINT query_log_explain")
+            finally:
+                cursor.close()
+        except Exception as e:
+            return [f"EXPLAIN failed: {e}"]
+        return [str(row[-1] if dialect == "sqlite" else row[0]) for row in rows]
+
+    def top(self, sort: str = "total", limit: int = 20) -> list:
+        keys = {
+            "total": lambda item: item[1].total,
+            "max": lambda item: item[1].max,
+            "count": lambda item: item[1].count,
+            "avg": lambda item: item[1].total / item[1].count if item[1].count else 0,
+            "slow": lambda item: item[1].slow,
+        }
+        ordered = sorted(self.stats.items(), key=keys.get(sort, keys["total"]), reverse=True)
+        return [stats.as_dict(key) for key, stats in ordered[:limit]]
+
+    def recent_slow(self, limit: int = 50) -> list:
+        return list(self.slow_queries)[-limit:][::-1]
+
+    def reset(self):
+        self.stats.clear()
+        self.slow_queries.clear()
+        self.untracked = 0
+
+    def summary(self) -> dict:
+        return {
+            "fingerprints": len(self.stats),
+            "untracked": self.untracked,
+            "slow_ms": self.slow_ms,
+            "explain": self.explain,
+        }
+
+
+query_log = QueryLog()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_log_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_log_started"].pop()
+    try:
+        query_log.record(conn, cursor, statement, parameters, executemany, elapsed)
+    except Exception:
+        logger.exception("Failed to record query statistics")
+
+
+def instrument_engine(sync_engine):
+    if QUERY_LOG_ENABLED and not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+for replica in replica_engines:
+    instrument_engine(replica.sync_engine)
@@ -0,0 +1,254 @@
+"""Ограничение частоты запросов и контроль допуска.
+
+- Лимиты вида "N/секунды" по ключу: пользователь (по токену, без БД) или,
+  для анонимных запросов, IP-адрес. Бэкенд в памяти процесса - token bucket;
+  при RATE_LIMIT_URL (или CACHE_URL) - скользящее окно в Redis, общее для
+  всех воркеров.
+- rate_limit(limit) - зависимость для горячих эндпоинтов (регистрация с
+  bcrypt, отправка в чат, выгрузки); при превышении 429 с Retry-After.
+- AdmissionMiddleware - общий лимит RATE_LIMIT_DEFAULT на клиента и сброс
+  нагрузки: пока в обработке MAX_IN_FLIGHT_REQUESTS запросов, новые сразу
+  получают 503, а не встают в очередь и не раздувают p99 остальных.
+
+Пустое значение или "0" отключает соответствующий лимит. Переменные
+окружения с пояснениями - в .env.example.
+"""
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+import logging
+import math
+import os
+import time
+
+from auth import user_id_from_authorization
+from cache import CACHE_URL
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Пустое значение в .env не отключает CACHE_URL
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL") or CACHE_URL
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100_000))
+# За обратным прокси IP клиента берётся из X-Forwarded-For
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+MAX_IN_FLIGHT_REQUESTS = int(os.getenv("MAX_IN_FLIGHT_REQUESTS", 1000))
+SHED_EXEMPT_PATHS = ("/health", "/metrics")
+
+logger = logging.getLogger(__name__)
+
+
+class Limit:
+    __slots__ = ("name", "count", "period")
+
+    def __init__(self, name: str, count: int, period: float):
+        self.name = name
+        self.count = count
+        self.period = period
+
+    @property
+    def rate(self) -> float:
+        return self.count / self.period
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> Optional["Limit"]:
+        """"30/10" - 30 запросов за 10 секунд; пустая строка или "0" - без лимита"""
+        if not spec or spec == "0":
+            return None
+        count, _, period = spec.partition("/")
+        return cls(name, int(count), float(period or 1))
+
+    def __repr__(self):
+        return f"{self.count}/{self.period:g}s"
+
+
+DEFAULT_LIMIT = Limit.parse("default", os.getenv("RATE_LIMIT_DEFAULT", "1200/60"))
+SIGNUP_LIMIT = Limit.parse("signup", os.getenv("RATE_LIMIT_SIGNUP", "5/60"))
+CHAT_LIMIT = Limit.parse("chat", os.getenv("RATE_LIMIT_CHAT", "30/10"))
+EXPORT_LIMIT = Limit.parse("export", os.getenv("RATE_LIMIT_EXPORT", "10/60"))
+
+
+class MemoryBackend:
+    """Token bucket в памяти процесса; давно не использованные ключи вытесняются"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def hit(self, key: str, limit: Limit) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = float(limit.count)
+        else:
+            tokens = min(float(limit.count), bucket[0] + (now - bucket[1]) * limit.rate)
+            self._buckets.move_to_end(key)
+
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            retry_after = 0.0
+        else:
+            self._buckets[key] = (tokens, now)
+            retry_after = (1 - tokens) / limit.rate
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+class RedisBackend:
+    """Скользящее окно: текущее окно плюс взвешенный остаток предыдущего"""
+
+    def __init__(self, url: str, namespace: str = "ratelimit"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_URL requires the 'redis' package: pip install redis") from e
+        self.namespace = namespace
+        self._client = redis.from_url(url)
+
+    async def hit(self, key: str, limit: Limit) -> float:
+        now = time.time()
+        window, elapsed = divmod(now, limit.period)
+        current_key = f"{self.namespace}:{key}:{int(window)}"
+        previous_key = f"{self.namespace}:{key}:{int(window) - 1}"
+        async with self._client.pipeline(transaction=False) as pipe:
+            pipe.incr(current_key)
+            pipe.expire(current_key, math.ceil(limit.period * 2))
+            pipe.get(previous_key)
+            current, _, previous = await pipe.execute()
+        estimated = int(previous or 0) * (1 - elapsed / limit.period) + int(current)
+        if estimated <= limit.count:
+            return 0.0
+        return limit.period - elapsed
+
+
+class RateLimiter:
+    def __init__(self, backend):
+        self.backend = backend
+        self.rejected: Dict[str, int] = {}
+        self.shed = 0
+
+    async def check(self, limit: Optional[Limit], identity) -> float:
+        """0 - запрос разрешён, иначе через сколько секунд повторить"""
+        if limit is None or not RATE_LIMIT_ENABLED:
+            return 0.0
+        retry_after = await self.backend.hit(f"{limit.name}:{identity}", limit)
+        if retry_after:
+            self.rejected[limit.name] = self.rejected.get(limit.name, 0) + 1
+        return retry_after
+
+    def stats(self) -> dict:
+        limits = (DEFAULT_LIMIT, SIGNUP_LIMIT, CHAT_LIMIT, EXPORT_LIMIT)
+        return {
+            "enabled": RATE_LIMIT_ENABLED,
+            "backend": type(self.backend).__name__,
+            "limits": {limit.name: repr(limit) for limit in limits if limit is not None},
+            "rejected": dict(self.rejected),
+            "in_flight": in_flight,
+            "max_in_flight": MAX_IN_FLIGHT_REQUESTS,
+            "shed": self.shed,
+        }
+
+
+limiter = RateLimiter(RedisBackend(RATE_LIMIT_URL) if RATE_LIMIT_URL else MemoryBackend())
+
+
+_forwarded_warned = False
+
+
+def client_ip(scope) -> str:
+    global _forwarded_warned
+    headers = dict(scope.get("headers") or [])
+    forwarded = headers.get(b"x-forwarded-for")
+    if forwarded and RATE_LIMIT_TRUST_FORWARDED:
+        return forwarded.decode().split(",")[0].strip()
+    if forwarded and not _forwarded_warned:
+        # Запросы идут через прокси: все анонимные клиенты делят его адрес
+        _forwarded_warned = True
+        logger.warning(
+            "X-Forwarded-For received while RATE_LIMIT_TRUST_FORWARDED is disabled: "
+            "per-IP limits (signup) apply to the proxy address and are shared by all clients"
+        )
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def client_identity(scope, per: str = "user") -> str:
+    """user:<id> для запросов с токеном, иначе ip:<адрес>"""
+    if per == "user":
+        headers = dict(scope.get("headers") or [])
+        user_id = user_id_from_authorization(headers.get(b"authorization", b"").decode())
+        if user_id is not None:
+            return f"user:{user_id}"
+    return f"ip:{client_ip(scope)}"
+
+
+def _retry_after_header(retry_after: float) -> dict:
+    return {"Retry-After": str(max(math.ceil(retry_after), 1))}
+
+
+def rate_limit(limit: Optional[Limit], per: str = "user"):
+    """Зависимость: лимит limit по пользователю (per="user") или по IP (per="ip")"""
+    async def check_rate_limit(request: Request):
+        retry_after = await limiter.check(limit, client_identity(request.scope, per))
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers=_retry_after_header(retry_after)
+            )
+    return check_rate_limit
+
+
+in_flight = 0
+
+
+@asynccontextmanager
+async def not_in_flight():
+    """Ожидание внутри запроса (long-poll) не занимает место в MAX_IN_FLIGHT_REQUESTS"""
+    global in_flight
+    in_flight -= 1
+    try:
+        yield
+    finally:
+        in_flight += 1
+
+
+class AdmissionMiddleware:
+    """Сброс нагрузки по числу запросов в обработке и общий лимит на клиента"""
+
+    def __init__(self, app, max_in_flight: int = MAX_IN_FLIGHT_REQUESTS):
+        self.app = app
+        self.max_in_flight = max_in_flight
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in SHED_EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        global in_flight
+        if self.max_in_flight and in_flight >= self.max_in_flight:
+            limiter.shed += 1
+            response = JSONResponse(
+                {"detail": "Server is overloaded, try again later"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"}
+            )
+            await response(scope, receive, send)
+            return
+
+        retry_after = await limiter.check(DEFAULT_LIMIT, client_identity(scope))
+        if retry_after:
+            response = JSONResponse(
+                {"detail": "Too many requests"},
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers=_retry_after_header(retry_after)
+            )
+            await response(scope, receive, send)
+            return
+
+        in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            in_flight -= 1
@@ -0,0 +1,566 @@
+"""Предвычисленные рекомендации поездок для поиска попутчиков.
+
+Вектор поездки - четыре one-hot блока с весами: направление (хеш
+destination_normalized по RECOMMENDATIONS_DESTINATION_BUCKETS корзинам), месяц
+начала, корзина стоимости и корзина длительности. Профиль пользователя -
+нормированная сумма векторов поездок, в которых он участвовал или на которые
+подавал заявку; без истории берётся средний вектор набирающих поездок.
+
+Оценка пары пользователь-поездка:
+
+    cos(профиль, поездка)
+    + RATING_WEIGHT * рейтинг организатора / 5
+    + MATCH_WEIGHT * (1 - |рейтинг пользователя - средний рейтинг участников| / 5)
+
+Кандидаты - набирающие будущие поездки со свободными местами, кроме тех, где
+пользователь уже участвует или подал заявку. Top-K пользователя хранится в
+trip_recommendations, GET /users/me/recommendations читает его по индексу
+(user_id, score) без расчётов.
+
+Оценки считаются пачками по RECOMMENDATIONS_BATCH_SIZE пользователей в
+отдельном потоке: с NumPy - матричным произведением и argpartition, без
+него - тем же расчётом на Python по разреженным векторам.
+
+RecommendationRefresher пересчитывает таблицу в фоне:
+- полностью - при первом запуске и каждые RECOMMENDATIONS_FULL_REFRESH_INTERVAL;
+- инкрементально каждые RECOMMENDATIONS_REFRESH_INTERVAL (0 - отключено):
+  изменившиеся пользователи (регистрация, заявка, вступление, выход)
+  пересчитываются целиком, изменившиеся поездки оцениваются по всем профилям
+  и добавляются тем, у кого попадают в top-K, после чего у этих пользователей
+  снова остаются K лучших строк. Поездки, переставшие быть кандидатами,
+  отсекаются при выдаче и удаляются при пересчёте.
+Пересчёт пишет только воркер, взявший аренду "recommendations" (leases.py):
+остальные копят изменения до следующего прохода. Снимок признаков (Snapshot)
+держится в памяти воркера и перечитывается после чужого полного пересчёта.
+"""
+from sqlalchemy import select, insert, delete, func, and_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import bisect
+import hashlib
+import heapq
+import logging
+import math
+import os
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from database import AsyncSessionLocal
+from leases import Lease
+from models import User, Trip, TripStatus, TripApplication, TripRecommendation, trip_participants
+
+RECOMMENDATIONS_TOP_K = int(os.getenv("RECOMMENDATIONS_TOP_K", 50))
+RECOMMENDATIONS_BATCH_SIZE = int(os.getenv("RECOMMENDATIONS_BATCH_SIZE", 500))
+RECOMMENDATIONS_REFRESH_INTERVAL = float(os.getenv("RECOMMENDATIONS_REFRESH_INTERVAL", 60))
+RECOMMENDATIONS_FULL_REFRESH_INTERVAL = float(os.getenv("RECOMMENDATIONS_FULL_REFRESH_INTERVAL", 6 * 3600))
+RECOMMENDATIONS_DESTINATION_BUCKETS = int(os.getenv("RECOMMENDATIONS_DESTINATION_BUCKETS", 64))
+
+COST_BOUNDS = (100, 300, 700, 1500, 3000)
+DURATION_BOUNDS = (3, 7, 14, 30)
+
+# Блоки признаков (размер, вес); позиция 0 каждого блока - "не указано"
+BLOCKS = (
+    (RECOMMENDATIONS_DESTINATION_BUCKETS, 1.0),
+    (13, 0.6),
+    (len(COST_BOUNDS) + 2, 0.7),
+    (len(DURATION_BOUNDS) + 2, 0.5),
+)
+OFFSETS = tuple(sum(size for size, _ in BLOCKS[:n]) for n in range(len(BLOCKS)))
+DIMENSIONS = sum(size for size, _ in BLOCKS)
+BLOCK_WEIGHTS = tuple(weight for _, weight in BLOCKS)
+TRIP_NORM = math.sqrt(sum(weight * weight for weight in BLOCK_WEIGHTS))
+
+RATING_WEIGHT = 0.15
+MATCH_WEIGHT = 0.1
+MAX_RATING = 5.0
+
+# Вклад поездки в профиль: участие весомее заявки
+PARTICIPATION_WEIGHT = 1.0
+APPLICATION_WEIGHT = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+def _bucket(value, bounds) -> int:
+    if value is None:
+        return 0
+    return bisect.bisect_right(bounds, value) + 1
+
+
+def trip_features(destination_normalized: Optional[str], start_date: Optional[datetime],
+                  end_date: Optional[datetime], cost: Optional[float]) -> Tuple[int, ...]:
+    """Позиции единиц one-hot блоков поездки"""
+    destination = 0
+    if destination_normalized:
+        digest = hashlib.blake2b(destination_normalized.encode(), digest_size=4).digest()
+        destination = int.from_bytes(digest, "little") % (RECOMMENDATIONS_DESTINATION_BUCKETS - 1) + 1
+    month = start_date.month if start_date else 0
+    duration = (end_date - start_date).days if start_date and end_date else None
+    slots = (destination, month, _bucket(cost, COST_BOUNDS), _bucket(duration, DURATION_BOUNDS))
+    return tuple(offset + slot for offset, slot in zip(OFFSETS, slots))
+
+
+def _normalize(weights: Dict[int, float]) -> Dict[int, float]:
+    norm = math.sqrt(sum(value * value for value in weights.values()))
+    if not norm:
+        return {}
+    return {index: value / norm for index, value in weights.items()}
+
+
+def _accumulate(weights: Dict[int, float], features: Tuple[int, ...], weight: float):
+    for index, block_weight in zip(features, BLOCK_WEIGHTS):
+        weights[index] = weights.get(index, 0.0) + weight * block_weight
+
+
+class TripInfo:
+    __slots__ = ("features", "candidate", "organizer_rating", "members_rating")
+
+    def __init__(self, features: Tuple[int, ...], candidate: bool, organizer_rating: float, members_rating: float):
+        self.features = features
+        self.candidate = candidate
+        self.organizer_rating = organizer_rating
+        self.members_rating = members_rating
+
+
+class Profile:
+    __slots__ = ("weights", "rating", "excluded", "threshold")
+
+    def __init__(self, weights: Dict[int, float], rating: float, excluded: Set[int]):
+        # Единичный разреженный вектор; пустой - нет истории
+        self.weights = weights
+        self.rating = rating
+        self.excluded = excluded
+        # Оценка K-й рекомендации: поездки ниже неё в top-K не попадут
+        self.threshold = -math.inf
+
+
+def build_profile(rating: Optional[float], history: Iterable[Tuple[int, float]],
+                  trips: Dict[int, TripInfo]) -> Profile:
+    weights: Dict[int, float] = {}
+    excluded = set()
+    for trip_id, weight in history:
+        excluded.add(trip_id)
+        trip = trips.get(trip_id)
+        if trip is not None:
+            _accumulate(weights, trip.features, weight)
+    return Profile(_normalize(weights), rating or 0.0, excluded)
+
+
+def _score_python(weights: Dict[int, float], rating: float, trips: List[TripInfo]) -> List[float]:
+    return [
+        sum(weights.get(index, 0.0) * block_weight for index, block_weight in zip(trip.features, BLOCK_WEIGHTS))
+        / TRIP_NORM
+        + RATING_WEIGHT * trip.organizer_rating / MAX_RATING
+        + MATCH_WEIGHT * (1 - abs(rating - trip.members_rating) / MAX_RATING)
+        for trip in trips
+    ]
+
+
+class TripMatrix:
+    """Векторы поездок и их рейтинги в массивах NumPy"""
+
+    def __init__(self, trips: List[TripInfo]):
+        self.vectors = np.zeros((len(trips), DIMENSIONS), dtype=np.float32)
+        if trips:
+            features = np.array([trip.features for trip in trips])
+            rows = np.arange(len(trips))
+            for block, weight in enumerate(BLOCK_WEIGHTS):
+                self.vectors[rows, features[:, block]] = weight / TRIP_NORM
+        self.organizer_rating = np.array([trip.organizer_rating for trip in trips], dtype=np.float32)
+        self.members_rating = np.array([trip.members_rating for trip in trips], dtype=np.float32)
+
+    def score(self, profiles: List[Dict[int, float]], ratings: List[float]):
+        """Матрица оценок (пользователи x поездки)"""
+        vectors = np.zeros((len(profiles), DIMENSIONS), dtype=np.float32)
+        for row, weights in enumerate(profiles):
+            if weights:
+                vectors[row, list(weights)] = list(weights.values())
+        scores = vectors @ self.vectors.T
+        scores += RATING_WEIGHT * self.organizer_rating / MAX_RATING
+        gap = np.abs(np.array(ratings, dtype=np.float32)[:, None] - self.members_rating[None, :])
+        scores += MATCH_WEIGHT * (1 - gap / MAX_RATING)
+        return scores
+
+
+class Snapshot:
+    """Признаки поездок и профили пользователей на момент пересчёта"""
+
+    def __init__(self, trips: Dict[int, TripInfo], profiles: Dict[int, Profile]):
+        self.trips = trips
+        self.profiles = profiles
+        self.refresh_candidates()
+
+    def refresh_candidates(self):
+        self.candidates = [trip_id for trip_id, trip in self.trips.items() if trip.candidate]
+        self.positions = {trip_id: position for position, trip_id in enumerate(self.candidates)}
+        weights: Dict[int, float] = {}
+        for trip_id in self.candidates:
+            _accumulate(weights, self.trips[trip_id].features, 1.0)
+        self.cold_start = _normalize(weights)
+        self._matrix = None
+
+    def update_trips(self, trip_ids: Iterable[int], loaded: Dict[int, TripInfo]):
+        for trip_id in trip_ids:
+            if trip_id in loaded:
+                self.trips[trip_id] = loaded[trip_id]
+            else:
+                self.trips.pop(trip_id, None)
+        self.refresh_candidates()
+
+    def _candidate_matrix(self) -> "TripMatrix":
+        if self._matrix is None:
+            self._matrix = TripMatrix([self.trips[trip_id] for trip_id in self.candidates])
+        return self._matrix
+
+    def top_k(self, user_ids: List[int], k: int) -> Dict[int, List[Tuple[int, float]]]:
+        """Лучшие k кандидатов для каждого пользователя: [(trip_id, score)]"""
+        profiles = [self.profiles[user_id] for user_id in user_ids]
+        if not self.candidates:
+            ranked = [[] for _ in profiles]
+        elif np is not None:
+            scores = self._candidate_matrix().score(
+                [profile.weights or self.cold_start for profile in profiles],
+                [profile.rating for profile in profiles]
+            )
+            for row, profile in enumerate(profiles):
+                excluded = [self.positions[trip_id] for trip_id in profile.excluded if trip_id in self.positions]
+                if excluded:
+                    scores[row, excluded] = -np.inf
+            count = min(k, len(self.candidates))
+            top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            ranked = [
+                [(self.candidates[column], score) for column, score in zip(columns, values) if score != -math.inf]
+                for columns, values in zip(top.tolist(), top_scores.tolist())
+            ]
+        else:
+            trips = [self.trips[trip_id] for trip_id in self.candidates]
+            ranked = []
+            for profile in profiles:
+                scores = _score_python(profile.weights or self.cold_start, profile.rating, trips)
+                pairs = (
+                    (score, trip_id) for trip_id, score in zip(self.candidates, scores)
+                    if trip_id not in profile.excluded
+                )
+                ranked.append([(trip_id, score) for score, trip_id in heapq.nlargest(k, pairs)])
+
+        for profile, items in zip(profiles, ranked):
+            profile.threshold = items[-1][1] if len(items) >= k else -math.inf
+        return dict(zip(user_ids, ranked))
+
+    def matches(self, trip_ids: Iterable[int], batch_size: int) -> List[Tuple[int, int, float]]:
+        """(user_id, trip_id, score) для пользователей, в чей top-K попадают поездки trip_ids"""
+        trip_ids = [trip_id for trip_id in trip_ids if trip_id in self.positions]
+        if not trip_ids:
+            return []
+        trips = [self.trips[trip_id] for trip_id in trip_ids]
+        matrix = TripMatrix(trips) if np is not None else None
+        user_ids = list(self.profiles)
+        found = []
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            profiles = [self.profiles[user_id] for user_id in batch]
+            if matrix is not None:
+                rows = matrix.score(
+                    [profile.weights or self.cold_start for profile in profiles],
+                    [profile.rating for profile in profiles]
+                ).tolist()
+            else:
+                rows = [
+                    _score_python(profile.weights or self.cold_start, profile.rating, trips)
+                    for profile in profiles
+                ]
+            for user_id, profile, scores in zip(batch, profiles, rows):
+                for trip_id, score in zip(trip_ids, scores):
+                    if score >= profile.threshold and trip_id not in profile.excluded:
+                        found.append((user_id, trip_id, score))
+        return found
+
+
+async def load_trips(db: AsyncSession, trip_ids: Optional[List[int]] = None) -> Dict[int, TripInfo]:
+    candidate = and_(
+        Trip.status == TripStatus.RECRUITING,
+        Trip.start_date > datetime.now(),
+        Trip.participant_count < Trip.max_participants
+    )
+    query = (
+        select(
+            Trip.id, Trip.destination_normalized, Trip.start_date, Trip.end_date, Trip.cost_per_person,
+            candidate.label("candidate"), User.rating
+        )
+        .join(User, Trip.organizer_id == User.id)
+    )
+    members = (
+        select(trip_participants.c.trip_id, func.avg(User.rating))
+        .join(User, trip_participants.c.user_id == User.id)
+        .group_by(trip_participants.c.trip_id)
+    )
+    if trip_ids is not None:
+        query = query.where(Trip.id.in_(trip_ids))
+        members = members.where(trip_participants.c.trip_id.in_(trip_ids))
+
+    members_rating = dict((await db.execute(members)).all())
+    trips = {}
+    for trip_id, destination, start_date, end_date, cost, is_candidate, organizer_rating in (await db.execute(query)).all():
+        organizer_rating = organizer_rating or 0.0
+        trips[trip_id] = TripInfo(
+            trip_features(destination, start_date, end_date, cost),
+            bool(is_candidate),
+            organizer_rating,
+            members_rating.get(trip_id) or organizer_rating
+        )
+    return trips
+
+
+async def load_profiles(db: AsyncSession, trips: Dict[int, TripInfo],
+                        user_ids: Optional[List[int]] = None) -> Dict[int, Profile]:
+    users = select(User.id, User.rating)
+    participations = select(trip_participants.c.user_id, trip_participants.c.trip_id)
+    applications = select(TripApplication.applicant_id, TripApplication.trip_id)
+    if user_ids is not None:
+        users = users.where(User.id.in_(user_ids))
+        participations = participations.where(trip_participants.c.user_id.in_(user_ids))
+        applications = applications.where(TripApplication.applicant_id.in_(user_ids))
+
+    history = defaultdict(list)
+    for query, weight in ((participations, PARTICIPATION_WEIGHT), (applications, APPLICATION_WEIGHT)):
+        for user_id, trip_id in (await db.execute(query)).all():
+            history[user_id].append((trip_id, weight))
+    return {
+        user_id: build_profile(rating, history.get(user_id, ()), trips)
+        for user_id, rating in (await db.execute(users)).all()
+    }
+
+
+async def load_thresholds(db: AsyncSession, profiles: Dict[int, Profile], k: int,
+                          user_ids: Optional[List[int]] = None):
+    """Пороги top-K по уже сохранённым рекомендациям (снимок собран без пересчёта)"""
+    query = (
+        select(TripRecommendation.user_id, func.min(TripRecommendation.score), func.count())
+        .group_by(TripRecommendation.user_id)
+    )
+    if user_ids is not None:
+        query = query.where(TripRecommendation.user_id.in_(user_ids))
+    for user_id, lowest, count in (await db.execute(query)).all():
+        profile = profiles.get(user_id)
+        if profile is not None:
+            profile.threshold = lowest if count >= k else -math.inf
+
+
+async def store_recommendations(db: AsyncSession, recommendations: Dict[int, List[Tuple[int, float]]]) -> int:
+    """Заменяет рекомендации пользователей пачки; возвращает число строк"""
+    await db.execute(delete(TripRecommendation).where(TripRecommendation.user_id.in_(list(recommendations))))
+    rows = [
+        {"user_id": user_id, "trip_id": trip_id, "score": score}
+        for user_id, items in recommendations.items()
+        for trip_id, score in items
+    ]
+    if rows:
+        await db.execute(insert(TripRecommendation), rows)
+    await db.commit()
+    return len(rows)
+
+
+async def trim_recommendations(db: AsyncSession, user_ids: List[int], k: int):
+    """Оставляет пользователям user_ids по k лучших строк (порядок как при выдаче)"""
+    ranked = select(
+        TripRecommendation.user_id,
+        TripRecommendation.trip_id,
+        func.row_number().over(
+            partition_by=TripRecommendation.user_id,
+            order_by=(TripRecommendation.score.desc(), TripRecommendation.trip_id)
+        ).label("rank")
+    ).where(TripRecommendation.user_id.in_(user_ids)).subquery()
+    overflow = select(ranked.c.user_id, ranked.c.trip_id).where(ranked.c.rank > k)
+    await db.execute(
+        delete(TripRecommendation)
+        .where(tuple_(TripRecommendation.user_id, TripRecommendation.trip_id).in_(overflow))
+    )
+
+
+async def store_trip_matches(db: AsyncSession, trip_ids: List[int], matches: List[Tuple[int, int, float]],
+                             k: int, batch_size: int) -> List[int]:
+    """Заменяет строки поездок trip_ids найденными совпадениями; возвращает пользователей с новыми строками"""
+    await db.execute(delete(TripRecommendation).where(TripRecommendation.trip_id.in_(trip_ids)))
+    if matches:
+        await db.execute(insert(TripRecommendation), [
+            {"user_id": user_id, "trip_id": trip_id, "score": score} for user_id, trip_id, score in matches
+        ])
+    user_ids = sorted({user_id for user_id, _, _ in matches})
+    for start in range(0, len(user_ids), batch_size):
+        await trim_recommendations(db, user_ids[start:start + batch_size], k)
+    await db.commit()
+    return user_ids
+
+
+class RecommendationRefresher:
+    """Фоновый пересчёт trip_recommendations: полный и по изменениям"""
+
+    def __init__(
+        self,
+        session_factory,
+        interval: float = RECOMMENDATIONS_REFRESH_INTERVAL,
+        full_interval: float = RECOMMENDATIONS_FULL_REFRESH_INTERVAL,
+        top_k: int = RECOMMENDATIONS_TOP_K,
+        batch_size: int = RECOMMENDATIONS_BATCH_SIZE
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.full_interval = full_interval
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.snapshot: Optional[Snapshot] = None
+        self.dirty_users: Set[int] = set()
+        self.dirty_trips: Set[int] = set()
+        self.full_runs = 0
+        self.incremental_runs = 0
+        self.stored = 0
+        self.last_run: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.lease = Lease("recommendations", session_factory)
+        self._snapshot_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def user_changed(self, *user_ids: int):
+        self.dirty_users.update(user_ids)
+
+    def trip_changed(self, *trip_ids: int):
+        self.dirty_trips.update(trip_ids)
+
+    async def _load_snapshot(self, db: AsyncSession) -> Snapshot:
+        self._snapshot_at = time.time()
+        trips = await load_trips(db)
+        return Snapshot(trips, await load_profiles(db, trips))
+
+    async def _refresh_users(self, db: AsyncSession, user_ids: List[int]) -> int:
+        stored = 0
+        for start in range(0, len(user_ids), self.batch_size):
+            batch = user_ids[start:start + self.batch_size]
+            recommendations = await asyncio.to_thread(self.snapshot.top_k, batch, self.top_k)
+            stored += await store_recommendations(db, recommendations)
+            await self.lease.extend()
+        return stored
+
+    async def _rebuild(self) -> int:
+        started = time.perf_counter()
+        # Полная загрузка учитывает все изменения, накопленные до неё
+        self.dirty_users.clear()
+        self.dirty_trips.clear()
+        async with self.session_factory() as db:
+            self.snapshot = await self._load_snapshot(db)
+            stored = await self._refresh_users(db, list(self.snapshot.profiles))
+        self.lease.complete()
+        self.full_runs += 1
+        self._finish(started, stored)
+        logger.info("Trip recommendations rebuilt for %d users", len(self.snapshot.profiles))
+        return stored
+
+    async def _apply_changes(self) -> int:
+        started = time.perf_counter()
+        trip_ids, self.dirty_trips = sorted(self.dirty_trips), set()
+        user_ids, self.dirty_users = sorted(self.dirty_users), set()
+        stored = 0
+        try:
+            async with self.session_factory() as db:
+                # Таблицу полностью пересчитал другой воркер: наш снимок устарел
+                if self.snapshot is None or (self.lease.finished_at or 0) > self._snapshot_at:
+                    self.snapshot = await self._load_snapshot(db)
+                    await load_thresholds(db, self.snapshot.profiles, self.top_k)
+                if trip_ids:
+                    self.snapshot.update_trips(trip_ids, await load_trips(db, trip_ids))
+                    matches = await asyncio.to_thread(self.snapshot.matches, trip_ids, self.batch_size)
+                    matched = await store_trip_matches(db, trip_ids, matches, self.top_k, self.batch_size)
+                    await load_thresholds(db, self.snapshot.profiles, self.top_k, matched)
+                    stored += len(matches)
+                    await self.lease.extend()
+                for start in range(0, len(user_ids), self.batch_size):
+                    batch = user_ids[start:start + self.batch_size]
+                    self.snapshot.profiles.update(await load_profiles(db, self.snapshot.trips, batch))
+                    batch = [user_id for user_id in batch if user_id in self.snapshot.profiles]
+                    stored += await self._refresh_users(db, batch)
+        except Exception:
+            # Повторим на следующем проходе
+            self.dirty_trips.update(trip_ids)
+            self.dirty_users.update(user_ids)
+            raise
+        self.incremental_runs += 1
+        self._finish(started, stored)
+        return stored
+
+    async def refresh_all(self) -> Optional[int]:
+        """Полный пересчёт; возвращает число сохранённых строк, None - аренду держит другой воркер"""
+        async with self._lock, self.lease.hold() as lease:
+            if lease is None:
+                return None
+            return await self._rebuild()
+
+    async def refresh_changed(self) -> Optional[int]:
+        """Пересчёт по изменившимся поездкам и пользователям; None - аренду держит другой воркер"""
+        async with self._lock, self.lease.hold() as lease:
+            if lease is None:
+                return None
+            return await self._apply_changes()
+
+    def _finish(self, started: float, stored: int):
+        self.stored += stored
+        self.last_run = time.time()
+        self.last_duration = time.perf_counter() - started
+
+    async def _tick(self):
+        async with self._lock, self.lease.hold() as lease:
+            if lease is None:
+                return
+            # Первый полный пересчёт - при первом запуске любого из воркеров
+            if lease.finished_at is None or (self.full_interval > 0 and lease.due(self.full_interval)):
+                await self._rebuild()
+            elif self.dirty_users or self.dirty_trips:
+                await self._apply_changes()
+
+    async def _run(self):
+        while True:
+            try:
+                await self._tick()
+            except Exception:
+                logger.exception("Trip recommendations refresh failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "backend": "numpy" if np is not None else "python",
+            "interval": self.interval,
+            "full_interval": self.full_interval,
+            "top_k": self.top_k,
+            "users": len(self.snapshot.profiles) if self.snapshot else None,
+            "candidates": len(self.snapshot.candidates) if self.snapshot else None,
+            "pending_users": len(self.dirty_users),
+            "pending_trips": len(self.dirty_trips),
+            "full_runs": self.full_runs,
+            "incremental_runs": self.incremental_runs,
+            "stored": self.stored,
+            "last_run": self.last_run,
+            "last_duration": self.last_duration,
+            "lease": self.lease.stats(),
+        }
+
+
+recommendation_refresher = RecommendationRefresher(AsyncSessionLocal)
@@ -0,0 +1,187 @@
+"""Маршрутизация чтения на реплики.
+
+get_read_session - зависимость для тяжёлых читающих эндпоинтов: сессия
+открывается на одной из реплик DATABASE_REPLICA_URLS (по кругу) и только
+читает. Запись остаётся на get_async_session (основная база).
+
+- Read-your-writes: после успешного изменяющего запроса (POST/PUT/PATCH/
+  DELETE) или сообщения в WebSocket пользователь REPLICA_STICKY_SECONDS
+  читает с основной базы, чтобы видеть собственные изменения несмотря на
+  отставание реплики. Отметки хранятся в общем кэше (build_cache), поэтому
+  с Redis работают для всех воркеров.
+- Реплика, к которой не удалось подключиться, выводится из ротации на
+  REPLICA_RETRY_SECONDS; чтение при этом идёт на основную базу.
+
+Без реплик get_read_session равносилен get_async_session.
+Источник чтения и признак недавней записи сохраняются в request.state
+(read_source, sticky): кэш ответов (response_cache) хранит только ответы,
+прочитанные с основной базы, а недавно писавшие пользователи читают мимо
+кэша.
+"""
+from fastapi import Depends, Request
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Optional
+from contextlib import asynccontextmanager
+import itertools
+import logging
+import os
+import time
+
+from database import AsyncSessionLocal, get_async_session, replica_engines
+from cache import build_cache
+from auth import user_id_from_authorization
+
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 5))
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", 30))
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+logger = logging.getLogger(__name__)
+
+recent_writers = build_cache("recent-writers", maxsize=100_000, ttl=REPLICA_STICKY_SECONDS)
+
+
+class ReplicaSet:
+    """Круговой выбор среди доступных реплик"""
+
+    def __init__(self, engines: list, retry_seconds: float = REPLICA_RETRY_SECONDS):
+        self.engines = engines
+        self.retry_seconds = retry_seconds
+        self.unhealthy_until: Dict[int, float] = {}
+        self.reads = {"primary": 0, **{self.name(index): 0 for index in range(len(engines))}}
+        self.sticky = 0
+        self.fallbacks = 0
+        self._next = itertools.count()
+
+    @staticmethod
+    def name(index: int) -> str:
+        return f"replica{index + 1}"
+
+    def choose(self) -> Optional[int]:
+        """Индекс следующей доступной реплики или None"""
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            index = next(self._next) % len(self.engines)
+            if self.unhealthy_until.get(index, 0) <= now:
+                return index
+        return None
+
+    def mark_unhealthy(self, index: int, error: Exception):
+        self.unhealthy_until[index] = time.monotonic() + self.retry_seconds
+        logger.warning("Read replica %s is unavailable for %.0fs: %s", self.name(index), self.retry_seconds, error)
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        return {
+            "replicas": [
+                {
+                    "name": self.name(index),
+                    "healthy": self.unhealthy_until.get(index, 0) <= now,
+                    "retry_in": round(max(self.unhealthy_until.get(index, 0) - now, 0), 1),
+                }
+                for index in range(len(self.engines))
+            ],
+            "reads": dict(self.reads),
+            "sticky": self.sticky,
+            "fallbacks": self.fallbacks,
+            "sticky_seconds": REPLICA_STICKY_SECONDS,
+        }
+
+
+replica_set = ReplicaSet(replica_engines)
+
+
+async def mark_write(user_id: int):
+    """Следующие REPLICA_STICKY_SECONDS пользователь читает с основной базы"""
+    if replica_set.engines and REPLICA_STICKY_SECONDS > 0:
+        await recent_writers.set(user_id, True)
+
+
+async def _should_use_primary(user_id: Optional[int]) -> bool:
+    if user_id is not None and await recent_writers.get(user_id):
+        replica_set.sticky += 1
+        return True
+    return False
+
+
+@asynccontextmanager
+async def read_session(user_id: Optional[int] = None, primary: Optional[AsyncSession] = None):
+    """Сессия на доступной реплике или на основной базе.
+
+    primary - уже открытая сессия основной базы: чтение с основной базы идёт
+    через неё, и запрос не занимает второе соединение из того же пула
+    (иначе под нагрузкой запросы ждут друг друга до таймаута пула).
+    Без primary - для потоковых ответов, читающих после выхода из зависимостей.
+    """
+    index = None
+    sticky = bool(replica_set.engines) and await _should_use_primary(user_id)
+    if replica_set.engines and not sticky:
+        index = replica_set.choose()
+        if index is None:
+            replica_set.fallbacks += 1
+
+    if index is not None:
+        db = AsyncSessionLocal(bind=replica_set.engines[index])
+        try:
+            # Соединение берётся сразу: недоступная реплика заменяется основной базой до обработчика
+            await db.connection()
+        except (DBAPIError, PoolTimeoutError, OSError) as e:
+            await db.close()
+            replica_set.mark_unhealthy(index, e)
+            replica_set.fallbacks += 1
+            index = None
+
+    source = "primary" if index is None else replica_set.name(index)
+    replica_set.reads[source] += 1
+    if index is None and primary is not None:
+        primary.info.update(read_source=source, sticky=sticky)
+        yield primary
+        return
+    if index is None:
+        db = AsyncSessionLocal()
+
+    db.info.update(read_source=source, sticky=sticky)
+    async with db:
+        try:
+            yield db
+        except DBAPIError as e:
+            if index is not None and e.connection_invalidated:
+                replica_set.mark_unhealthy(index, e)
+            raise
+
+
+def request_user_id(request: Request) -> Optional[int]:
+    return user_id_from_authorization(request.headers.get("authorization", ""))
+
+
+async def get_read_session(request: Request, primary: AsyncSession = Depends(get_async_session)):
+    # Сессия основной базы общая с остальными зависимостями запроса и без
+    # обращений к ней соединение не занимает
+    async with read_session(request_user_id(request), primary) as db:
+        request.state.read_source = db.info["read_source"]
+        request.state.sticky = db.info["sticky"]
+        yield db
+
+
+class ReplicaStickinessMiddleware:
+    """Отмечает пользователей после успешных изменяющих запросов"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS or not replica_set.engines:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_and_mark(message):
+            # Отметка ставится до отправки ответа: следующий запрос клиента её уже увидит
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = dict(scope.get("headers") or [])
+                user_id = user_id_from_authorization(headers.get(b"authorization", b"").decode())
+                if user_id is not None:
+                    await mark_write(user_id)
+            await send(message)
+
+        await self.app(scope, receive, send_and_mark)
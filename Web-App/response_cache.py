@@ -0,0 +1,166 @@
+"""Кэш готовых JSON-ответов публичных GET-эндпоинтов.
+
+Тело ответа сериализуется один раз и хранится вместе с ETag и заголовками.
+Клиент, приславший If-None-Match с актуальным ETag, получает 304.
+Ключ страницы списка включает "поколение" списков: любое изменение поездки
+меняет поколение, и все закэшированные страницы перестают использоваться.
+Ключи карточки и участников поездки включают поколение этой поездки. Чтение,
+начатое до сброса, кладёт ответ под старое поколение, и его никто не читает.
+Карточка и участники показывают профили пользователей, поэтому изменение
+профиля сбрасывает поколения его поездок (invalidate_trip_details).
+
+Ответ, прочитанный с реплики (request.state.read_source из replicas.py), не
+кэшируется: отставшая реплика вернула бы в кэш состояние до записи уже под
+новым поколением, на весь TTL. Запросы недавно писавшего пользователя
+(request.state.sticky) идут мимо кэша, как и мимо реплик.
+"""
+from fastapi import Request, Response
+from typing import Awaitable, Callable, Iterable
+import hashlib
+import os
+import time
+import uuid
+
+from cache import build_cache
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 30))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 4096))
+
+response_cache = build_cache("responses", maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+TRIP_LISTS_GENERATION = "trips:list:generation"
+
+
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, elapsed: float):
+        self.count += 1
+        self.total += elapsed
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+        }
+
+
+latency = {"hit": LatencyStats(), "miss": LatencyStats(), "not_modified": LatencyStats()}
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in header.split(",")]
+    return etag in candidates or "*" in candidates
+
+
+async def _generation(key: str) -> str:
+    generation = await response_cache.get(key)
+    if generation is None:
+        generation = await _renew_generation(key)
+    return generation
+
+
+async def _renew_generation(key: str) -> str:
+    generation = uuid.uuid4().hex
+    await response_cache.set(key, generation, ttl=24 * 3600)
+    return generation
+
+
+async def trip_lists_generation() -> str:
+    return await _generation(TRIP_LISTS_GENERATION)
+
+
+def _trip_generation_key(trip_id: int) -> str:
+    return f"trip:{trip_id}:generation"
+
+
+async def trip_generation(trip_id: int) -> str:
+    return await _generation(_trip_generation_key(trip_id))
+
+
+def list_key(generation: str, **params) -> str:
+    """Ключ страницы списка: параметры без значений не учитываются, порядок не важен"""
+    normalized = "&".join(
+        f"{name}={value.isoformat() if hasattr(value, 'isoformat') else getattr(value, 'value', value)}"
+        for name, value in sorted(params.items())
+        if value is not None
+    )
+    return f"trips:list:{generation}:{normalized}"
+
+
+def trip_key(trip_id: int, generation: str) -> str:
+    return f"trip:{trip_id}:{generation}"
+
+
+def trip_participants_key(trip_id: int, generation: str) -> str:
+    return f"trip:{trip_id}:{generation}:participants"
+
+
+async def cached_json(
+    request: Request,
+    key: str,
+    render: Callable[[object], bytes],
+    produce: Callable[[Response], Awaitable[object]]
+) -> Response:
+    """Отдаёт ответ из кэша или строит его через produce(response) и кэширует.
+
+    produce может выставить заголовки в переданном response, они кэшируются
+    вместе с телом; исключения (например, 404) не кэшируются.
+    """
+    started = time.perf_counter()
+    use_cache = RESPONSE_CACHE_TTL > 0 and not getattr(request.state, "sticky", False)
+    entry = await response_cache.get(key) if use_cache else None
+    outcome = "hit"
+    if entry is None:
+        outcome = "miss"
+        draft = Response()
+        body = render(await produce(draft))
+        headers = {name: value for name, value in draft.headers.items() if name != "content-length"}
+        entry = (body, make_etag(body), headers)
+        if use_cache and getattr(request.state, "read_source", "primary") == "primary":
+            await response_cache.set(key, entry)
+
+    body, etag, headers = entry
+    response_headers = {"ETag": etag, "Cache-Control": "no-cache", **headers}
+    if _not_modified(request, etag):
+        outcome = "not_modified" if outcome == "hit" else outcome
+        response = Response(status_code=304, headers=response_headers)
+    else:
+        response = Response(content=body, media_type="application/json", headers=response_headers)
+    latency[outcome].record(time.perf_counter() - started)
+    return response
+
+
+async def invalidate_trip(trip_id: int = None):
+    """Сбрасывает страницы списков и, если указан trip_id, карточку и участников поездки"""
+    await _renew_generation(TRIP_LISTS_GENERATION)
+    if trip_id is not None:
+        await _renew_generation(_trip_generation_key(trip_id))
+
+
+async def invalidate_trip_details(trip_ids: Iterable[int]):
+    """Сбрасывает карточки и участников поездок; списки профилей не показывают"""
+    for trip_id in trip_ids:
+        await _renew_generation(_trip_generation_key(trip_id))
+
+
+def cache_metrics() -> dict:
+    # Статистика бэкенда учитывает и чтения ключа поколения, поэтому доля
+    # попаданий считается по отданным ответам
+    served = sum(stats.count for stats in latency.values())
+    cached = latency["hit"].count + latency["not_modified"].count
+    return {
+        "hit_ratio": round(cached / served, 4) if served else 0.0,
+        "backend": response_cache.stats.as_dict(),
+        "ttl": RESPONSE_CACHE_TTL,
+        "latency": {outcome: stats.as_dict() for outcome, stats in latency.items()},
+    }
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, validator
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, Optional, List, Dict
 from enum import Enum
 
 
@@ -103,6 +103,8 @@ class TripResponse(TripBase):
     status: TripStatus
     organizer_id: int
     created_at: datetime
+    participant_count: int = 0
+    pending_application_count: int = 0
 
     class Config:
         from_attributes = True
@@ -113,6 +115,10 @@ class TripWithParticipants(TripResponse):
     participants: List[UserResponse]
 
 
+class RecommendedTrip(TripResponse):
+    score: float
+
+
 # ========== MESSAGE SCHEMAS ==========
 class TripMessageBase(BaseModel):
     content: str = Field(..., min_length=1, max_length=1000)
@@ -166,4 +172,36 @@ class TripApplicationWithUser(TripApplicationResponse):
 
 
 class TripApplicationWithTrip(TripApplicationResponse):
-    trip: TripResponse
\ No newline at end of file
+    trip: TripResponse
+
+
+# ========== BATCH SCHEMAS ==========
+class BatchItemError(BaseModel):
+    index: int
+    detail: Any
+
+
+class TripBatchCreate(BaseModel):
+    # Элементы проверяются по TripCreate по отдельности, чтобы ошибки были у каждого элемента
+    trips: List[Dict[str, Any]] = Field(..., min_length=1, max_length=500)
+
+
+class TripBatchResult(BaseModel):
+    created: List[TripResponse]
+    errors: List[BatchItemError]
+
+
+class ApplicationBatchDecision(BaseModel):
+    application_ids: List[int] = Field(..., min_length=1, max_length=500)
+    status: ApplicationStatus = ApplicationStatus.APPROVED
+
+    @validator('status')
+    def validate_status(cls, status):
+        if status not in (ApplicationStatus.APPROVED, ApplicationStatus.REJECTED):
+            raise ValueError('Batch decision must approve or reject applications')
+        return status
+
+
+class ApplicationBatchResult(BaseModel):
+    updated: List[TripApplicationResponse]
+    errors: List[BatchItemError]
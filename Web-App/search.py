@@ -0,0 +1,69 @@
+"""Поиск поездок по направлению и полнотекстовый поиск.
+
+Условия строятся под диалект базы: в Postgres используются индексы
+pg_trgm и tsvector, в SQLite полнотекстовый поиск идёт по таблице FTS5
+trips_fts (см. миграцию v002_trip_search). Запрос и данные нормализуются
+одинаково (models.normalize_text), поэтому поиск не зависит от регистра и
+диакритики.
+"""
+from sqlalchemy import func, literal_column, table, column
+import re
+
+from models import Trip, normalize_text
+
+trips_fts = table("trips_fts", column("rowid"), column("rank"))
+
+_WORD = re.compile(r"\w+")
+
+
+def _words(text: str) -> list:
+    return _WORD.findall(normalize_text(text))
+
+
+def _fts5_match(column_name: str, words: list) -> str:
+    # Каждое слово - префиксный запрос, слова объединяются через AND
+    return " AND ".join(f'{column_name} : "{word}"*' for word in words)
+
+
+def _ts_vector():
+    return func.to_tsvector(literal_column("'simple'"), func.coalesce(Trip.search_text, literal_column("''")))
+
+
+def _ts_query(words: list):
+    return func.to_tsquery(literal_column("'simple'"), " & ".join(f"{word}:*" for word in words))
+
+
+def destination_filter(destination: str):
+    """Условие "направление содержит строку" (подстрока, не только начало слова)"""
+    # Postgres: LIKE '%...%' обслуживается триграммным индексом. В SQLite
+    # это просмотр короткой колонки: префиксный MATCH FTS5 не нашёл бы "ris" в "paris"
+    return Trip.destination_normalized.contains(normalize_text(destination), autoescape=True)
+
+
+def apply_text_search(query, dialect: str, text: str):
+    """Фильтрует по названию, описанию и направлению и сортирует по релевантности.
+
+    Возвращает (query, ranked): ranked=False, если в запросе нет слов.
+    """
+    words = _words(text)
+    if not words:
+        return query, False
+
+    if dialect == "sqlite":
+        match = _fts5_match("search_text", words)
+        query = (
+            query.join(trips_fts, trips_fts.c.rowid == Trip.id)
+            .where(literal_column("trips_fts").op("MATCH")(match))
+            .order_by(trips_fts.c.rank, Trip.id)
+        )
+    elif dialect == "postgresql":
+        vector, ts_query = _ts_vector(), _ts_query(words)
+        query = (
+            query.where(vector.op("@@")(ts_query))
+            .order_by(func.ts_rank(vector, ts_query).desc(), Trip.id)
+        )
+    else:
+        for word in words:
+            query = query.where(Trip.search_text.contains(word, autoescape=True))
+        query = query.order_by(Trip.id)
+    return query, True
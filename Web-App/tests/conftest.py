@@ -0,0 +1,88 @@
+"""Общие фикстуры тестов: временная SQLite-база и чистая схема на каждый тест"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Движки создаются при импорте database: окружение выставляется до импорта приложения
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="travel-tests-"), "test.db")
+)
+os.environ.setdefault("RESPONSE_CACHE_TTL", "0")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("TRIP_COUNTERS_RECONCILE_INTERVAL", "0")
+os.environ.setdefault("RECOMMENDATIONS_REFRESH_INTERVAL", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from auth import create_access_token, user_cache
+from database import Base, engine, async_engine, SessionLocal
+from membership import membership_cache
+from replicas import recent_writers
+from response_cache import response_cache
+from models import User, Trip, TripStatus, trip_participants, trip_search_fields
+import main
+
+
+def run(coro):
+    """Выполняет корутину в отдельном цикле; соединения aiosqlite привязаны к циклу и закрываются"""
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(wrapper())
+
+
+def auth_headers(user_id: int) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+
+
+def add_user(db, user_id: int, **fields) -> User:
+    user = User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com",
+                hashed_password="x", **fields)
+    db.add(user)
+    db.flush()
+    return user
+
+
+def add_trip(db, trip_id: int, organizer_id: int, start_date: datetime = None, **fields) -> Trip:
+    """Набирающая поездка; организатор - первый участник"""
+    start_date = start_date or datetime.now() + timedelta(days=30)
+    values = {
+        "title": f"Trip #{trip_id}",
+        "description": "Trip created by tests",
+        "destination": "Paris",
+        "start_date": start_date,
+        "end_date": start_date + timedelta(days=7),
+        "max_participants": 4,
+        "status": TripStatus.RECRUITING,
+        "participant_count": 1,
+        **fields,
+    }
+    values.update(trip_search_fields(values["title"], values["description"], values["destination"]))
+    trip = Trip(id=trip_id, organizer_id=organizer_id, **values)
+    db.add(trip)
+    db.flush()
+    db.execute(trip_participants.insert().values(trip_id=trip_id, user_id=organizer_id))
+    return trip
+
+
+@pytest.fixture
+def database():
+    """Пустая схема; кэши, помнящие строки прошлых тестов, сбрасываются"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    for cache in (user_cache, membership_cache, response_cache, recent_writers):
+        run(cache.clear())
+    with SessionLocal() as db:
+        yield db
+
+
+@pytest.fixture
+def client(database):
+    with TestClient(main.app) as test_client:
+        yield test_client
@@ -0,0 +1,100 @@
+"""Пакетные эндпоинты: ошибка элемента не мешает остальным, atomic - всё или ничего"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from conftest import add_trip, add_user, auth_headers
+from models import ApplicationStatus, Trip, TripApplication
+
+
+def trip_item(title: str, days: int = 30) -> dict:
+    start_date = datetime.now() + timedelta(days=days)
+    return {
+        "title": title,
+        "description": "Two weeks along the coast with tents",
+        "destination": "Crimea",
+        "start_date": start_date.isoformat(),
+        "end_date": (start_date + timedelta(days=14)).isoformat(),
+    }
+
+
+def test_trip_batch_reports_errors_per_item(database, client):
+    add_user(database, 1)
+    database.commit()
+    items = [trip_item("Coast hike"), {"title": "No dates"}, trip_item("Past trip", days=-1), trip_item("Lake hike")]
+
+    response = client.post("/api/v1/trips/batch", json={"trips": items}, headers=auth_headers(1))
+    assert response.status_code == 201
+    body = response.json()
+    assert [trip["title"] for trip in body["created"]] == ["Coast hike", "Lake hike"]
+    assert [error["index"] for error in body["errors"]] == [1, 2]
+    assert {error["loc"][0] for error in body["errors"][0]["detail"]} >= {"description", "start_date"}
+    assert body["errors"][1]["detail"] == "Start date cannot be in the past"
+
+
+def test_atomic_trip_batch_creates_nothing(database, client):
+    add_user(database, 1)
+    database.commit()
+    items = [trip_item("Coast hike"), trip_item("Past trip", days=-1)]
+
+    response = client.post("/api/v1/trips/batch?atomic=true", json={"trips": items}, headers=auth_headers(1))
+    assert response.status_code == 400
+    assert [error["index"] for error in response.json()["detail"]] == [1]
+    assert database.scalar(select(func.count()).select_from(Trip)) == 0
+
+
+def add_applications(database) -> dict:
+    """Одно свободное место; заявки 2 и 4 ждут решения, заявка 3 уже одобрена"""
+    for user_id in (1, 2, 3, 4):
+        add_user(database, user_id)
+    add_trip(database, 1, 1, max_participants=2, pending_application_count=2)
+    applications = {
+        user_id: TripApplication(trip_id=1, applicant_id=user_id, status=status)
+        for user_id, status in (
+            (2, ApplicationStatus.PENDING), (3, ApplicationStatus.APPROVED), (4, ApplicationStatus.PENDING)
+        )
+    }
+    database.add_all(applications.values())
+    database.commit()
+    return {user_id: application.id for user_id, application in applications.items()}
+
+
+def test_application_batch_reports_errors_per_item(database, client):
+    ids = add_applications(database)
+    application_ids = [ids[2], ids[2], 999, ids[3], ids[4]]
+
+    response = client.post(
+        "/api/v1/trips/1/applications/batch",
+        json={"application_ids": application_ids},
+        headers=auth_headers(1)
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert [application["id"] for application in body["updated"]] == [ids[2]]
+    assert [(error["index"], error["detail"]) for error in body["errors"]] == [
+        (1, "Duplicate application id"),
+        (2, "Application not found"),
+        (3, "Application is already approved"),
+        (4, "Trip is full"),
+    ]
+
+    database.expire_all()
+    trip = database.get(Trip, 1)
+    assert (trip.participant_count, trip.pending_application_count) == (2, 1)
+    assert database.get(TripApplication, ids[4]).status == ApplicationStatus.PENDING
+
+
+def test_atomic_application_batch_changes_nothing(database, client):
+    ids = add_applications(database)
+
+    response = client.post(
+        "/api/v1/trips/1/applications/batch?atomic=true",
+        json={"application_ids": [ids[2], ids[4]]},
+        headers=auth_headers(1)
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == [{"index": 1, "detail": "Trip is full"}]
+
+    database.expire_all()
+    assert database.get(Trip, 1).participant_count == 1
+    assert database.get(TripApplication, ids[2]).status == ApplicationStatus.PENDING
@@ -0,0 +1,143 @@
+"""Брокер чата переподключается после обрыва связи с Redis или Postgres"""
+import asyncio
+import json
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import broker
+from broker import CHANNEL, PostgresBroker, RedisBroker
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(broker, "CHAT_BROKER_RETRY_MIN", 0.01)
+    monkeypatch.setattr(broker, "CHAT_BROKER_HEALTHCHECK_INTERVAL", 0.01)
+
+
+def payload(trip_id: int) -> str:
+    return json.dumps({"trip_id": trip_id, "message": {"id": trip_id}})
+
+
+class FakePubSub:
+    def __init__(self, items):
+        self.items = items
+        self.closed = False
+
+    async def subscribe(self, channel):
+        assert channel == CHANNEL
+
+    async def listen(self):
+        for item in self.items:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        await asyncio.Event().wait()
+
+    async def unsubscribe(self, channel):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeRedis:
+    def __init__(self, *subscriptions):
+        self.subscriptions = list(subscriptions)
+        self.created = []
+
+    def pubsub(self):
+        self.created.append(FakePubSub(self.subscriptions.pop(0)))
+        return self.created[-1]
+
+    async def close(self):
+        pass
+
+
+async def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+def run_loop(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+def test_redis_listener_resubscribes_after_connection_loss(monkeypatch):
+    client = FakeRedis(
+        [{"type": "message", "data": payload(1)}, ConnectionError("connection reset")],
+        [{"type": "subscribe", "data": 1}, {"type": "message", "data": payload(2)}],
+    )
+    redis_asyncio = SimpleNamespace(from_url=lambda url: client)
+    monkeypatch.setitem(sys.modules, "redis", SimpleNamespace(asyncio=redis_asyncio))
+    monkeypatch.setitem(sys.modules, "redis.asyncio", redis_asyncio)
+    delivered = []
+
+    async def handler(trip_id, message):
+        delivered.append(trip_id)
+
+    async def scenario():
+        redis_broker = RedisBroker(handler, "redis://test")
+        await redis_broker.start()
+        await wait_for(lambda: delivered == [1, 2])
+        await redis_broker.stop()
+        return redis_broker
+
+    redis_broker = run_loop(scenario())
+    assert redis_broker.reconnects == 1
+    assert client.created[0].closed
+
+
+class FakeConnection:
+    def __init__(self, healthy: bool):
+        self.healthy = healthy
+        self.listeners = []
+        self.terminated = False
+
+    def is_closed(self):
+        return self.terminated
+
+    async def add_listener(self, channel, callback):
+        self.listeners.append(callback)
+
+    async def execute(self, statement, *args):
+        if not self.healthy:
+            raise ConnectionError("server closed the connection")
+
+    def terminate(self):
+        self.terminated = True
+
+    async def close(self):
+        self.terminated = True
+
+
+def test_postgres_listener_reconnects_without_publishing(monkeypatch):
+    connections = []
+
+    async def connect(dsn):
+        # Первое соединение рвётся, следующие живы
+        connections.append(FakeConnection(healthy=bool(connections)))
+        return connections[-1]
+
+    monkeypatch.setitem(sys.modules, "asyncpg", SimpleNamespace(connect=connect))
+    delivered = []
+
+    async def handler(trip_id, message):
+        delivered.append(trip_id)
+
+    async def scenario():
+        pg_broker = PostgresBroker(handler, "postgresql://test")
+        await pg_broker.start()
+        await wait_for(lambda: len(connections) >= 2 and connections[-1].listeners)
+        connections[-1].listeners[0](connections[-1], 1, CHANNEL, payload(3))
+        await wait_for(lambda: delivered == [3])
+        await pg_broker.stop()
+        return pg_broker
+
+    pg_broker = run_loop(scenario())
+    assert connections[0].terminated
+    assert pg_broker.reconnects == 1
@@ -0,0 +1,115 @@
+"""Счётчики участников: поездка не переполняется, опоздавшее одобрение получает 409"""
+import pytest
+from sqlalchemy import func, select, update
+
+import trips
+from capacity import CounterReconciler, TripFull, add_participants
+from conftest import add_trip, add_user, auth_headers, run
+from database import AsyncSessionLocal
+from models import ApplicationStatus, Trip, TripApplication, trip_participants
+
+
+def participants(db, trip_id: int) -> int:
+    return db.scalar(select(func.count()).select_from(trip_participants).where(trip_participants.c.trip_id == trip_id))
+
+
+def test_add_participants_refuses_overfill(database):
+    for user_id in (1, 2, 3):
+        add_user(database, user_id)
+    add_trip(database, 1, 1, max_participants=2)
+    database.commit()
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            await add_participants(db, 1, [2])
+            await db.commit()
+            with pytest.raises(TripFull):
+                await add_participants(db, 1, [3])
+            await db.rollback()
+
+    run(scenario())
+    database.expire_all()
+    assert database.get(Trip, 1).participant_count == 2
+    assert participants(database, 1) == 2
+
+
+def test_approval_after_places_were_taken_returns_409(database, client, monkeypatch):
+    for user_id in (1, 2):
+        add_user(database, user_id)
+    add_trip(database, 1, 1, max_participants=2, pending_application_count=1)
+    application = TripApplication(trip_id=1, applicant_id=2)
+    database.add(application)
+    database.commit()
+
+    approve = trips.add_participants
+
+    async def approve_after_concurrent_join(db, trip_id, user_ids):
+        # Параллельное одобрение заняло место после того, как обработчик прочитал поездку
+        await db.execute(update(Trip).where(Trip.id == trip_id).values(participant_count=Trip.max_participants))
+        await approve(db, trip_id, user_ids)
+
+    monkeypatch.setattr(trips, "add_participants", approve_after_concurrent_join)
+    response = client.post(
+        "/api/v1/trips/1/applications/batch",
+        json={"application_ids": [application.id]},
+        headers=auth_headers(1)
+    )
+    assert response.status_code == 409
+
+    # Транзакция откатана целиком: ни участника, ни смены статуса заявки
+    database.expire_all()
+    trip = database.get(Trip, 1)
+    assert (trip.participant_count, trip.pending_application_count) == (1, 1)
+    assert participants(database, 1) == 1
+    assert database.get(TripApplication, application.id).status == ApplicationStatus.PENDING
+
+
+def test_join_that_no_longer_fits_returns_409_without_partial_join(database, client, monkeypatch):
+    """Два места на двоих, одно занял параллельный участник: не принят никто"""
+    for user_id in (1, 2, 3, 4):
+        add_user(database, user_id)
+    add_trip(database, 1, 1, max_participants=3, pending_application_count=2)
+    applications = [TripApplication(trip_id=1, applicant_id=user_id) for user_id in (2, 3)]
+    database.add_all(applications)
+    database.commit()
+
+    approve = trips.add_participants
+
+    async def approve_after_concurrent_join(db, trip_id, user_ids):
+        await approve(db, trip_id, [4])
+        await approve(db, trip_id, user_ids)
+
+    monkeypatch.setattr(trips, "add_participants", approve_after_concurrent_join)
+    response = client.post(
+        "/api/v1/trips/1/applications/batch",
+        json={"application_ids": [application.id for application in applications]},
+        headers=auth_headers(1)
+    )
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Trip is full"
+
+    database.expire_all()
+    assert database.get(Trip, 1).participant_count == 1
+    assert participants(database, 1) == 1
+    assert all(database.get(TripApplication, application.id).status == ApplicationStatus.PENDING
+               for application in applications)
+
+
+def test_reconciler_repairs_drift_once_per_interval(database):
+    for user_id in (1, 2):
+        add_user(database, user_id)
+    add_trip(database, 1, 1, participant_count=3, pending_application_count=2)
+    add_trip(database, 2, 1)
+    database.commit()
+
+    async def scenario():
+        reconciler = CounterReconciler(AsyncSessionLocal, interval=600)
+        assert await reconciler.run_once() == [1]
+        # Следующий проход (этого или другого воркера) ждёт интервал
+        assert await reconciler.run_once() == []
+        assert reconciler.runs == 1
+
+    run(scenario())
+    database.expire_all()
+    trip = database.get(Trip, 1)
+    assert (trip.participant_count, trip.pending_application_count) == (1, 0)
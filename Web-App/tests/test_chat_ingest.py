@@ -0,0 +1,87 @@
+"""Пакетная запись чата: сообщения каждой поездки сохраняют порядок отправки"""
+import asyncio
+import json
+
+from sqlalchemy import select
+
+from auth import create_access_token
+from chat_ingest import ChatIngest
+from conftest import add_trip, add_user, run
+from database import AsyncSessionLocal
+from models import TripMessage
+
+
+def test_messages_keep_submission_order_per_trip(database):
+    add_user(database, 1)
+    add_trip(database, 1, 1)
+    add_trip(database, 2, 1)
+    database.commit()
+    committed = []
+
+    async def on_committed(message, author):
+        committed.append((message.trip_id, message.content, message.id))
+
+    async def scenario():
+        ingest = ChatIngest(AsyncSessionLocal, on_committed, batch_size=4, batch_delay=0.001)
+        futures = []
+        for n in range(30):
+            # Как сокет: отправка следующего сообщения не ждёт записи предыдущего
+            futures.append(await ingest.submit(1 + n % 2, 1, "user1", str(n)))
+        stored = [await future for future in futures]
+        await ingest.stop()
+        return ingest, stored
+
+    ingest, stored = run(scenario())
+    assert ingest.batches > 1
+    assert [message.content for message in stored] == [str(n) for n in range(30)]
+
+    for trip_id in (1, 2):
+        expected = [str(n) for n in range(30) if 1 + n % 2 == trip_id]
+        broadcast = [(content, message_id) for trip, content, message_id in committed if trip == trip_id]
+        assert [content for content, _ in broadcast] == expected
+        assert [message_id for _, message_id in broadcast] == sorted(message_id for _, message_id in broadcast)
+        history = database.scalars(
+            select(TripMessage.content)
+            .where(TripMessage.trip_id == trip_id)
+            .order_by(TripMessage.created_at, TripMessage.id)
+        ).all()
+        assert history == expected
+
+
+def test_invalid_row_fails_alone(database):
+    add_user(database, 1)
+    add_trip(database, 1, 1)
+    database.commit()
+
+    async def on_committed(message, author):
+        pass
+
+    async def scenario():
+        ingest = ChatIngest(AsyncSessionLocal, on_committed, batch_size=10, batch_delay=0.05)
+        futures = [await ingest.submit(1, 1, "user1", content) for content in ("a", None, "b")]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        await ingest.stop()
+        return ingest, results
+
+    ingest, (first, broken, second) = run(scenario())
+    assert (first.content, second.content) == ("a", "b")
+    assert isinstance(broken, Exception)
+    assert (ingest.split_batches, ingest.failed) == (1, 1)
+    assert database.scalars(select(TripMessage.content).order_by(TripMessage.id)).all() == ["a", "b"]
+
+
+def test_websocket_rejects_invalid_frames_without_disconnecting(database, client):
+    add_user(database, 1)
+    add_trip(database, 1, 1)
+    database.commit()
+    token = create_access_token({"sub": "1"})
+
+    with client.websocket_connect(f"/api/v1/messages/ws/trip/1?token={token}") as websocket:
+        for frame in ("not json", "{}", '{"content": null}', '{"content": ""}', json.dumps({"content": "x" * 1001})):
+            websocket.send_text(frame)
+            event = websocket.receive_json()
+            assert event["type"] == "error" and isinstance(event["detail"], list), event
+        websocket.send_json({"content": "hello"})
+        assert websocket.receive_json()["content"] == "hello"
+
+    assert database.scalars(select(TripMessage.content)).all() == ["hello"]
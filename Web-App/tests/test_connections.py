@@ -0,0 +1,96 @@
+"""Политики медленного клиента: очередь соединения не растёт, соседи не ждут"""
+import asyncio
+
+import pytest
+from fastapi import status
+
+from connections import ConnectionManager
+
+
+class StalledWebSocket:
+    """Клиент, который не принимает данные"""
+
+    def __init__(self):
+        self.closed_with = None
+
+    async def send_text(self, text):
+        await asyncio.Event().wait()
+
+    async def close(self, code):
+        self.closed_with = code
+
+
+def fill_queue(policy: str):
+    """Три события в очередь на два: писатель ещё не запущен, очередь переполняется"""
+    manager = ConnectionManager(queue_size=2, send_timeout=60, policy=policy)
+    websocket = StalledWebSocket()
+    assert manager.admit(1, 7) is None
+    connection = manager.add(1, websocket, user_id=7)
+    for text in ("first", "second", "third"):
+        connection.offer(text)
+    return manager, connection, websocket
+
+
+@pytest.mark.parametrize("policy, kept", [
+    ("drop_newest", ["first", "second"]),
+    ("drop_oldest", ["second", "third"]),
+])
+def test_full_queue_drops_events(policy, kept):
+    async def scenario():
+        manager, connection, _ = fill_queue(policy)
+        assert list(connection.queue._queue) == kept
+        assert (connection.dropped, manager.dropped, manager.evicted) == (1, 1, 0)
+        assert 1 in manager
+        await manager.remove(connection)
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_disconnects_slow_consumer():
+    async def scenario():
+        manager, connection, websocket = fill_queue("disconnect")
+        assert manager.evicted == 1
+        # Закрытие идёт фоновой задачей: offer не ждёт сокет
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert websocket.closed_with == status.WS_1013_TRY_AGAIN_LATER
+        assert connection.closed and 1 not in manager
+        assert manager.user_connections == {} and manager.trip_connections == {}
+        assert connection._writer.done()
+        queued = connection.queue.qsize()
+        connection.offer("late")
+        assert connection.queue.qsize() == queued
+
+    asyncio.run(scenario())
+
+
+def test_send_timeout_evicts_connection():
+    async def scenario():
+        manager = ConnectionManager(queue_size=2, send_timeout=0.01, policy="drop_newest")
+        websocket = StalledWebSocket()
+        assert manager.admit(1, 7) is None
+        connection = manager.add(1, websocket, user_id=7)
+        connection.offer("first")
+        await asyncio.wait_for(connection._writer, 1)
+        assert websocket.closed_with == status.WS_1011_INTERNAL_ERROR
+        assert manager.evicted == 1 and 1 not in manager
+
+    asyncio.run(scenario())
+
+
+def test_admit_reserves_slot_before_add():
+    """Второе рукопожатие, пришедшее до add() первого, упирается в лимит"""
+    async def scenario():
+        manager = ConnectionManager(max_per_trip=1, max_per_user=5)
+        assert manager.admit(1, 7) is None
+        assert manager.admit(1, 8) == "Too many connections to this trip"
+        # accept() не удался: место возвращается
+        manager.release(1, 7)
+        assert manager.admit(1, 8) is None
+        connection = manager.add(1, StalledWebSocket(), user_id=8)
+        assert manager.admit(1, 7) is not None and manager.refused == 2
+        await manager.remove(connection)
+        assert manager.trip_connections == {} and manager.user_connections == {}
+        assert manager.admit(1, 7) is None
+
+    asyncio.run(scenario())
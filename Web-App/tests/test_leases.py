@@ -0,0 +1,58 @@
+"""Аренда фоновых задач: проход выполняет один воркер, top-K не растёт после вставки совпадений"""
+from sqlalchemy import func, select
+
+import leases
+from conftest import add_trip, add_user, run
+from database import AsyncSessionLocal
+from leases import Lease
+from models import TripRecommendation
+from recommendations import store_recommendations, store_trip_matches
+
+
+def test_lease_is_exclusive_until_released_or_expired(database, monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(leases.time, "time", lambda: clock["now"])
+
+    async def scenario():
+        first = Lease("job", ttl=60)
+        assert await first.acquire()
+
+        monkeypatch.setattr(leases, "WORKER_ID", "other-worker")
+        second = Lease("job", ttl=60)
+        assert not await second.acquire()
+
+        # Аренда упавшего воркера освобождается по истечении ttl
+        clock["now"] += 61
+        assert await second.acquire()
+        assert second.finished_at is None
+        second.complete()
+        await second.release()
+
+        # Завершённый проход виден всем воркерам
+        monkeypatch.setattr(leases, "WORKER_ID", "third-worker")
+        async with Lease("job", ttl=60).hold() as third:
+            assert third is not None and not third.due(60)
+
+    run(scenario())
+
+
+def test_trip_matches_keep_top_k_per_user(database):
+    for user_id in (1, 2):
+        add_user(database, user_id)
+    for trip_id in range(1, 6):
+        add_trip(database, trip_id, 1)
+    database.commit()
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            await store_recommendations(db, {2: [(1, 0.9), (2, 0.5), (3, 0.4)]})
+            matched = await store_trip_matches(db, [4, 5], [(2, 4, 0.8), (2, 5, 0.1)], k=3, batch_size=10)
+            assert matched == [2]
+
+    run(scenario())
+    rows = database.execute(
+        select(TripRecommendation.trip_id).where(TripRecommendation.user_id == 2)
+        .order_by(TripRecommendation.score.desc())
+    ).scalars().all()
+    assert rows == [1, 4, 2]
+    assert database.scalar(select(func.count()).select_from(TripRecommendation)) == 3
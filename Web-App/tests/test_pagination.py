@@ -0,0 +1,62 @@
+"""Курсорная пагинация: обход без пропусков и повторов при равных ключах сортировки"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import add_trip, add_user, auth_headers
+from models import TripMessage
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+
+
+def walk(client, path: str, limit: int, headers: dict = None) -> list:
+    """id всех элементов, пройденных по X-Next-Cursor"""
+    ids, cursor = [], None
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(path, params=params, headers=headers)
+        assert response.status_code == 200
+        ids += [item["id"] for item in response.json()]
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            return ids
+
+
+def test_cursor_round_trip_keeps_types():
+    created = datetime(2026, 5, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(created, 42), (datetime, int)) == [created, 42]
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor(1), encode_cursor("x", 1)])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, (datetime, int))
+    assert error.value.status_code == 400
+
+
+def test_trip_pages_with_equal_start_dates(database, client):
+    add_user(database, 1)
+    start_date = datetime.now() + timedelta(days=10)
+    for trip_id in range(1, 11):
+        add_trip(database, trip_id, 1, start_date=start_date)
+    add_trip(database, 11, 1, start_date=start_date - timedelta(days=1))
+    database.commit()
+
+    assert walk(client, "/api/v1/trips/", limit=3) == [11] + list(range(1, 11))
+
+
+def test_message_pages_with_equal_timestamps(database, client):
+    add_user(database, 1)
+    add_trip(database, 1, 1)
+    created_at = datetime(2026, 1, 1, 10, 0, 0)
+    database.add_all([
+        TripMessage(trip_id=1, author_id=1, content=f"message {n}", created_at=created_at)
+        for n in range(7)
+    ])
+    database.commit()
+
+    ids = walk(client, "/api/v1/messages/trip/1", limit=2, headers=auth_headers(1))
+    assert len(ids) == 7
+    assert ids == sorted(ids)
@@ -0,0 +1,22 @@
+"""Бюджет SQL-запросов на эндпоинт (benchmarks/query_budget.py): ловит N+1"""
+import pytest
+
+from benchmarks.common import seed
+from benchmarks.query_budget import BUDGETS, count_queries
+from conftest import auth_headers
+from models import Trip
+
+
+@pytest.fixture
+def seeded_client(database, client):
+    seed(database, users=50, trips=20, participants=5, messages=100)
+    return client, auth_headers(database.get(Trip, 1).organizer_id)
+
+
+@pytest.mark.parametrize("method, path, needs_auth, budget", BUDGETS)
+def test_endpoint_stays_within_query_budget(seeded_client, method, path, needs_auth, budget):
+    client, headers = seeded_client
+    with count_queries() as counter:
+        response = client.request(method, path, headers=headers if needs_auth else None)
+    assert response.status_code == 200
+    assert counter.count <= budget, "\n".join(counter.statements)
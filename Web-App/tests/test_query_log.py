@@ -0,0 +1,51 @@
+"""Снятие плана медленного запроса не ломает транзакцию запроса"""
+from types import SimpleNamespace
+
+from query_log import QueryLog
+
+
+class FakeCursor:
+    def __init__(self, executed: list, fail: bool):
+        self.executed = executed
+        self.fail = fail
+
+    def execute(self, statement, parameters=None):
+        self.executed.append(statement.split()[0] if statement.startswith("EXPLAIN") else statement)
+        if self.fail and statement.startswith("EXPLAIN"):
+            raise RuntimeError("syntax error")
+
+    def fetchall(self):
+        return [("Seq Scan on trips",)]
+
+    def close(self):
+        pass
+
+
+def fake_connection(dialect: str, executed: list, fail: bool = False):
+    dbapi_connection = SimpleNamespace(cursor=lambda: FakeCursor(executed, fail))
+    return SimpleNamespace(
+        dialect=SimpleNamespace(name=dialect),
+        connection=SimpleNamespace(dbapi_connection=dbapi_connection)
+    )
+
+
+def test_postgres_explain_runs_inside_savepoint():
+    executed = []
+    plan = QueryLog._explain(fake_connection("postgresql", executed), "SELECT 1", ())
+    assert plan == ["Seq Scan on trips"]
+    assert executed == ["SAVEPOINT query_log_explain", "EXPLAIN", "RELEASE SAVEPOINT query_log_explain"]
+
+
+def test_failed_explain_rolls_back_to_savepoint():
+    executed = []
+    plan = QueryLog._explain(fake_connection("postgresql", executed, fail=True), "SELECT 1", ())
+    assert plan == ["EXPLAIN failed: syntax error"]
+    assert executed == ["SAVEPOINT query_log_explain", "EXPLAIN", "ROLLBACK TO SAVEPOINT query_log_explain"]
+
+
+def test_sqlite_explain_on_real_connection(database):
+    from database import engine
+
+    with engine.connect() as conn:
+        plan = QueryLog._explain(conn, "SELECT id FROM trips WHERE id = ?", (1,))
+    assert plan and not plan[0].startswith("EXPLAIN failed")
@@ -0,0 +1,92 @@
+"""Лимиты частоты: пополнение token bucket и ответ 429 с Retry-After"""
+from types import SimpleNamespace
+
+import pytest
+
+import ratelimit
+from conftest import run
+from ratelimit import Limit, MemoryBackend
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время для ratelimit"""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(monotonic=lambda: now.value, time=lambda: now.value))
+    return now
+
+
+def test_limit_parse():
+    limit = Limit.parse("chat", "30/10")
+    assert (limit.count, limit.period, limit.rate) == (30, 10.0, 3.0)
+    assert Limit.parse("chat", "0") is None
+    assert Limit.parse("chat", "") is None
+
+
+def test_token_bucket_refills(clock):
+    backend = MemoryBackend()
+    limit = Limit("test", 2, 1.0)
+    assert run(backend.hit("client", limit)) == 0
+    assert run(backend.hit("client", limit)) == 0
+    assert run(backend.hit("client", limit)) == pytest.approx(0.5)
+
+    clock.value += 0.5
+    assert run(backend.hit("client", limit)) == 0
+    assert run(backend.hit("client", limit)) > 0
+
+    # Полностью пополненный bucket не копит больше count токенов
+    clock.value += 60
+    assert [run(backend.hit("client", limit)) == 0 for _ in range(3)] == [True, True, False]
+
+
+def test_buckets_are_per_key(clock):
+    backend = MemoryBackend()
+    limit = Limit("test", 1, 60.0)
+    assert run(backend.hit("a", limit)) == 0
+    assert run(backend.hit("a", limit)) > 0
+    assert run(backend.hit("b", limit)) == 0
+
+
+def test_least_recent_keys_are_evicted(clock):
+    backend = MemoryBackend(max_keys=2)
+    limit = Limit("test", 1, 60.0)
+    for key in ("a", "b", "c"):
+        run(backend.hit(key, limit))
+    assert list(backend._buckets) == ["b", "c"]
+
+
+def test_signup_limit_returns_429_with_retry_after(client, monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit.limiter, "backend", MemoryBackend())
+    payload = {"username": "alice", "email": "alice@example.com", "password": "12345678"}
+
+    statuses = [client.post("/api/v1/users/", json=payload).status_code for _ in range(ratelimit.SIGNUP_LIMIT.count)]
+    assert statuses == [201] + [400] * (ratelimit.SIGNUP_LIMIT.count - 1)
+
+    response = client.post("/api/v1/users/", json=payload)
+    assert response.status_code == 429
+    retry_after = int(response.headers["Retry-After"])
+    assert 1 <= retry_after <= ratelimit.SIGNUP_LIMIT.period
+    assert ratelimit.limiter.rejected["signup"] >= 1
+
+
+def test_profiling_requests_are_shed_like_any_other(client, monkeypatch):
+    # Проверка роли ?profile=1 идёт после сброса нагрузки, а не до него
+    monkeypatch.setattr(ratelimit, "in_flight", ratelimit.MAX_IN_FLIGHT_REQUESTS)
+    response = client.get("/api/v1/trips/?profile=1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_forwarded_header_without_trust_warns_once(monkeypatch, caplog):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_FORWARDED", False)
+    monkeypatch.setattr(ratelimit, "_forwarded_warned", False)
+    scope = {"headers": [(b"x-forwarded-for", b"203.0.113.7, 10.0.0.1")], "client": ("10.0.0.1", 5000)}
+
+    with caplog.at_level("WARNING", logger="ratelimit"):
+        assert ratelimit.client_ip(scope) == "10.0.0.1"
+        assert ratelimit.client_ip(scope) == "10.0.0.1"
+    assert len([record for record in caplog.records if "RATE_LIMIT_TRUST_FORWARDED" in record.message]) == 1
+
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_FORWARDED", True)
+    assert ratelimit.client_ip(scope) == "203.0.113.7"
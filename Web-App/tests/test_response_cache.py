@@ -0,0 +1,82 @@
+"""Кэш ответов: 304 по ETag, сброс карточек при изменении поездки и профилей"""
+import pytest
+
+import response_cache
+from conftest import add_trip, add_user, auth_headers, run
+from models import trip_participants
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    """conftest отключает кэш ответов (RESPONSE_CACHE_TTL=0); здесь он нужен"""
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_TTL", 30)
+    monkeypatch.setattr(response_cache.response_cache, "ttl", 30)
+
+
+def test_matching_etag_returns_not_modified(database, client, cached):
+    add_user(database, 1)
+    add_trip(database, 1, organizer_id=1)
+    database.commit()
+
+    first = client.get("/api/v1/trips/1")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    hits = response_cache.latency["not_modified"].count
+
+    revalidated = client.get("/api/v1/trips/1", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["etag"] == etag
+    assert response_cache.latency["not_modified"].count == hits + 1
+
+    assert client.get("/api/v1/trips/1", headers={"If-None-Match": '"stale"'}).status_code == 200
+    assert client.get("/api/v1/trips/1", headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+
+
+def test_trip_change_replaces_etag(database, client, cached):
+    add_user(database, 1)
+    add_trip(database, 1, organizer_id=1, title="Old title")
+    database.commit()
+
+    etag = client.get("/api/v1/trips/1").headers["etag"]
+    response = client.put("/api/v1/trips/1", json={"title": "New title"}, headers=auth_headers(1))
+    assert response.status_code == 200
+
+    fresh = client.get("/api/v1/trips/1", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.json()["title"] == "New title"
+    assert fresh.headers["etag"] != etag
+
+
+def test_profile_change_invalidates_trip_details(database, client, cached):
+    add_user(database, 1, full_name="Old Name")
+    add_user(database, 2)
+    add_trip(database, 1, organizer_id=2)
+    add_trip(database, 2, organizer_id=1)
+    database.execute(trip_participants.insert().values(trip_id=1, user_id=1))
+    database.commit()
+
+    def participant_names():
+        participants = client.get("/api/v1/trips/1/participants").json()
+        return [user["full_name"] for user in participants if user["id"] == 1]
+
+    assert participant_names() == ["Old Name"]
+    assert client.get("/api/v1/trips/2").json()["organizer"]["full_name"] == "Old Name"
+
+    response = client.put("/api/v1/users/me", json={"full_name": "New Name"}, headers=auth_headers(1))
+    assert response.status_code == 200
+
+    # Анонимные запросы не закреплены за основной базой и читают кэш
+    assert participant_names() == ["New Name"]
+    assert client.get("/api/v1/trips/2").json()["organizer"]["full_name"] == "New Name"
+
+
+def test_read_racing_invalidation_is_not_served():
+    """Ответ, построенный до сброса, ложится под старое поколение"""
+    async def scenario():
+        key = response_cache.trip_key(1, await response_cache.trip_generation(1))
+        await response_cache.invalidate_trip(1)
+        await response_cache.response_cache.set(key, (b"stale", '"stale"', {}))
+        assert response_cache.trip_key(1, await response_cache.trip_generation(1)) != key
+
+    run(scenario())
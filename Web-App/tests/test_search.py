@@ -0,0 +1,22 @@
+"""Поиск по направлению: подстрока без учёта регистра и диакритики"""
+import pytest
+
+from conftest import add_trip, add_user
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("ris", [1]),
+    ("PAR", [1]),
+    ("sao", [2]),
+    ("o pau", [2]),
+    ("x", []),
+])
+def test_destination_matches_substring(database, client, query, expected):
+    add_user(database, 1)
+    add_trip(database, 1, 1, destination="Paris")
+    add_trip(database, 2, 1, destination="São Paulo")
+    database.commit()
+
+    response = client.get("/api/v1/trips/", params={"destination": query})
+    assert response.status_code == 200
+    assert [trip["id"] for trip in response.json()] == expected
@@ -0,0 +1,28 @@
+"""Кэш пользователей: изменения видны следующему запросу, а не через USER_CACHE_TTL"""
+from auth import user_cache
+from conftest import add_user, auth_headers, run
+from models import UserRole
+
+
+def test_profile_update_invalidates_cached_user(database, client):
+    add_user(database, 1, full_name="Old Name")
+    database.commit()
+
+    assert client.get("/api/v1/users/me", headers=auth_headers(1)).json()["full_name"] == "Old Name"
+    assert run(user_cache.get(1)) is not None
+
+    response = client.put("/api/v1/users/me", json={"full_name": "New Name"}, headers=auth_headers(1))
+    assert response.status_code == 200
+    assert response.json()["full_name"] == "New Name"
+    assert client.get("/api/v1/users/me", headers=auth_headers(1)).json()["full_name"] == "New Name"
+
+
+def test_verification_invalidates_cached_user(database, client):
+    add_user(database, 1, role=UserRole.ADMIN)
+    add_user(database, 2)
+    database.commit()
+
+    assert client.get("/api/v1/users/me", headers=auth_headers(2)).json()["is_verified"] is False
+    response = client.patch("/api/v1/users/2/verify", headers=auth_headers(1))
+    assert response.status_code == 200
+    assert client.get("/api/v1/users/me", headers=auth_headers(2)).json()["is_verified"] is True
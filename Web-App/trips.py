@@ -1,20 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from pydantic import TypeAdapter, ValidationError
 from typing import List, Optional
 from datetime import datetime
 
-from database import get_session
+from database import get_async_session, async_engine
+from replicas import get_read_session
 from auth import get_current_user, require_role
-from models import Trip, User, TripStatus, TripMessage, TripApplication, ApplicationStatus
+from loaders import loader_options
+from pagination import after_cursor, set_next_cursor
+from search import destination_filter, apply_text_search
+from membership import is_participant, invalidate_membership
+from capacity import TripFull, add_participants, remove_participant, application_submitted, applications_decided
+from serialization import FAST_SERIALIZATION, RowSerializer, model_renderer, select_for, schema_columns, fetch_page
+from export import EXPORT_FORMAT_PATTERN, export_response
+from ratelimit import EXPORT_LIMIT, rate_limit
+from recommendations import recommendation_refresher
+from response_cache import (
+    cached_json, invalidate_trip, trip_generation, trip_lists_generation, list_key, trip_key,
+    trip_participants_key
+)
+from models import (
+    Trip, User, UserRole, TripStatus, TripMessage, TripApplication, ApplicationStatus,
+    trip_participants, trip_search_fields, normalize_text
+)
 import schemas
 
 router = APIRouter(prefix="/trips", tags=["trips"])
 
+# Публичные GET-ответы сериализуются один раз и кэшируются (response_cache)
+if FAST_SERIALIZATION:
+    render_trip_list = RowSerializer(schemas.TripResponse).render
+else:
+    render_trip_list = model_renderer(List[schemas.TripResponse])
+render_trip_detail = model_renderer(schemas.TripWithParticipants)
+render_participants = model_renderer(List[schemas.UserResponse])
+
+trip_create_adapter = TypeAdapter(schemas.TripCreate)
+
 
 @router.post("/", response_model=schemas.TripResponse, status_code=status.HTTP_201_CREATED)
-def create_trip(
+async def create_trip(
         trip: schemas.TripCreate,
-        db: Session = Depends(get_session),
+        db: AsyncSession = Depends(get_async_session),
         current_user: User = Depends(get_current_user)
 ):
     """Создание новой поездки"""
@@ -27,17 +57,17 @@ def create_trip(
     db_trip = Trip(
         **trip.dict(),
         organizer_id=current_user.id,
-        status=TripStatus.RECRUITING
+        status=TripStatus.RECRUITING,
+        participant_count=1
     )
 
     # Организатор автоматически становится участником
     db_trip.participants.append(current_user)
 
     db.add(db_trip)
-    db.commit()
-    db.refresh(db_trip)
+    await db.flush()
 
-    # Системное сообщение о создании поездки
+    # Системное сообщение о создании поездки - в той же транзакции
     system_message = TripMessage(
         content=f"Поездка '{trip.title}' создана. Начало набора участников!",
         trip_id=db_trip.id,
@@ -45,26 +75,79 @@ def create_trip(
         is_system=True
     )
     db.add(system_message)
-    db.commit()
+    await db.commit()
+    await db.refresh(db_trip)
+    await invalidate_trip()
+    await invalidate_membership(db_trip.id, current_user.id)
+    recommendation_refresher.trip_changed(db_trip.id)
 
     return db_trip
 
 
-@router.get("/", response_model=List[schemas.TripResponse])
-def list_trips(
-        skip: int = Query(0, ge=0),
-        limit: int = Query(100, ge=1, le=100),
-        destination: Optional[str] = None,
-        status: Optional[TripStatus] = None,
-        min_date: Optional[datetime] = None,
-        max_date: Optional[datetime] = None,
-        db: Session = Depends(get_session)
+@router.post("/batch", response_model=schemas.TripBatchResult, status_code=status.HTTP_201_CREATED)
+async def create_trips_batch(
+        batch: schemas.TripBatchCreate,
+        atomic: bool = False,
+        db: AsyncSession = Depends(get_async_session),
+        current_user: User = Depends(get_current_user)
 ):
-    """Список поездок с фильтрацией"""
-    query = db.query(Trip)
+    """Пакетное создание поездок одной транзакцией (atomic - всё или ничего)"""
+    now = datetime.now()
+    rows, errors = [], []
+    for index, item in enumerate(batch.trips):
+        try:
+            trip = trip_create_adapter.validate_python(item)
+        except ValidationError as e:
+            errors.append(schemas.BatchItemError(index=index, detail=e.errors(include_url=False)))
+            continue
+        if trip.start_date < now:
+            errors.append(schemas.BatchItemError(index=index, detail="Start date cannot be in the past"))
+            continue
+        # Bulk INSERT не вызывает события маппера, поля поиска заполняются здесь
+        rows.append({
+            **trip.dict(),
+            **trip_search_fields(trip.title, trip.description, trip.destination),
+            "organizer_id": current_user.id,
+            "status": TripStatus.RECRUITING,
+            "participant_count": 1,
+        })
+
+    if errors and atomic:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=[error.dict() for error in errors]
+        )
 
+    created = []
+    if rows:
+        result = await db.scalars(insert(Trip).returning(Trip, sort_by_parameter_order=True), rows)
+        created = result.all()
+        await db.execute(trip_participants.insert(), [
+            {"trip_id": trip.id, "user_id": current_user.id} for trip in created
+        ])
+        await db.execute(insert(TripMessage), [
+            {
+                "content": f"Поездка '{trip.title}' создана. Начало набора участников!",
+                "trip_id": trip.id,
+                "author_id": current_user.id,
+                "is_system": True,
+            }
+            for trip in created
+        ])
+        await db.commit()
+        await invalidate_trip()
+        for trip in created:
+            await invalidate_membership(trip.id, current_user.id)
+        recommendation_refresher.trip_changed(*(trip.id for trip in created))
+
+    return {"created": created, "errors": errors}
+
+
+def filter_trips(query, destination: Optional[str], status: Optional[TripStatus],
+                 min_date: Optional[datetime], max_date: Optional[datetime]):
+    """Фильтры списка поездок, общие для list_trips и export_trips"""
     if destination:
-        query = query.filter(Trip.destination.ilike(f"%{destination}%"))
+        query = query.filter(destination_filter(destination))
 
     if status:
         query = query.filter(Trip.status == status)
@@ -74,31 +157,121 @@ def list_trips(
 
     if max_date:
         query = query.filter(Trip.start_date <= max_date)
+    return query
 
-    return query.order_by(Trip.start_date).offset(skip).limit(limit).all()
+
+@router.get("/", response_model=List[schemas.TripResponse])
+async def list_trips(
+        request: Request,
+        skip: int = Query(0, ge=0),
+        limit: int = Query(100, ge=1, le=100),
+        cursor: Optional[str] = None,
+        q: Optional[str] = Query(None, max_length=200),
+        destination: Optional[str] = None,
+        status: Optional[TripStatus] = None,
+        min_date: Optional[datetime] = None,
+        max_date: Optional[datetime] = None,
+        db: AsyncSession = Depends(get_read_session)
+):
+    """Список поездок с фильтрацией и поиском (q - по названию, описанию и направлению)"""
+    # Поиск не зависит от регистра и диакритики, поэтому ключ строится по нормализованным строкам
+    key = list_key(
+        await trip_lists_generation(),
+        skip=skip, limit=limit, cursor=cursor,
+        q=normalize_text(q) or None, destination=normalize_text(destination) or None,
+        status=status, min_date=min_date, max_date=max_date
+    )
+
+    async def produce(response: Response):
+        query = select_for(schemas.TripResponse, Trip)
+        query = filter_trips(query, destination, status, min_date, max_date)
+
+        # Поиск сортирует по релевантности: для него работает только offset
+        if q:
+            query, ranked = apply_text_search(query, db.bind.dialect.name, q)
+            if ranked:
+                result = await db.execute(query.offset(skip).limit(limit))
+                return fetch_page(result)
+
+        # Курсор имеет приоритет, offset остаётся для старых клиентов
+        if cursor:
+            query = query.filter(after_cursor((Trip.start_date, Trip.id), cursor, (datetime, int)))
+        else:
+            query = query.offset(skip)
+
+        result = await db.execute(query.order_by(Trip.start_date, Trip.id).limit(limit))
+        trips = fetch_page(result)
+        set_next_cursor(response, trips, limit, lambda trip: (trip.start_date, trip.id))
+        return trips
+
+    return await cached_json(request, key, render_trip_list, produce)
+
+
+@router.get("/export", dependencies=[Depends(rate_limit(EXPORT_LIMIT))])
+async def export_trips(
+        export_format: str = Query("ndjson", alias="format", pattern=EXPORT_FORMAT_PATTERN),
+        cursor: Optional[str] = None,
+        limit: Optional[int] = Query(None, ge=1),
+        q: Optional[str] = Query(None, max_length=200),
+        destination: Optional[str] = None,
+        status: Optional[TripStatus] = None,
+        min_date: Optional[datetime] = None,
+        max_date: Optional[datetime] = None,
+        current_user: User = Depends(get_current_user)
+):
+    """Потоковая выгрузка поездок (NDJSON или CSV) с фильтрами списка; cursor - продолжение после обрыва"""
+    query = select(*schema_columns(schemas.TripResponse, Trip))
+    query = filter_trips(query, destination, status, min_date, max_date)
+
+    # Поиск здесь только фильтрует: порядок (start_date, id) нужен курсору
+    if q:
+        query, _ = apply_text_search(query, async_engine.dialect.name, q)
+        query = query.order_by(None)
+
+    if cursor:
+        query = query.filter(after_cursor((Trip.start_date, Trip.id), cursor, (datetime, int)))
+    query = query.order_by(Trip.start_date, Trip.id)
+    if limit:
+        query = query.limit(limit)
+
+    return export_response(
+        query, lambda row: (row.start_date, row.id), export_format, "trips", user_id=current_user.id
+    )
 
 
 @router.get("/{trip_id}", response_model=schemas.TripWithParticipants)
-def get_trip(trip_id: int, db: Session = Depends(get_session)):
+async def get_trip(trip_id: int, request: Request, db: AsyncSession = Depends(get_read_session)):
     """Получить информацию о поездке"""
-    trip = db.query(Trip).filter(Trip.id == trip_id).first()
-    if not trip:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Trip not found"
+    # Поколение читается до запроса к БД: ответ, устаревший к записи, ляжет под старый ключ
+    key = trip_key(trip_id, await trip_generation(trip_id))
+
+    async def produce(response: Response):
+        result = await db.execute(
+            select(Trip)
+            .options(*loader_options(schemas.TripWithParticipants))
+            .filter(Trip.id == trip_id)
         )
-    return trip
+        trip = result.scalars().first()
+        if not trip:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Trip not found"
+            )
+        return trip
+
+    return await cached_json(request, key, render_trip_detail, produce)
 
 
 @router.put("/{trip_id}", response_model=schemas.TripResponse)
-def update_trip(
+async def update_trip(
         trip_id: int,
         trip_update: schemas.TripUpdate,
-        db: Session = Depends(get_session),
+        db: AsyncSession = Depends(get_async_session),
         current_user: User = Depends(get_current_user)
 ):
     """Обновить информацию о поездке (только организатор)"""
-    trip = db.query(Trip).filter(Trip.id == trip_id).first()
+    result = await db.execute(select(Trip).filter(Trip.id == trip_id))
+    trip = result.scalars().first()
     if not trip:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -114,20 +287,23 @@ def update_trip(
     for key, value in trip_update.dict(exclude_unset=True).items():
         setattr(trip, key, value)
 
-    db.commit()
-    db.refresh(trip)
+    await db.commit()
+    await db.refresh(trip)
+    await invalidate_trip(trip_id)
+    recommendation_refresher.trip_changed(trip_id)
     return trip
 
 
 @router.post("/{trip_id}/apply", response_model=schemas.TripApplicationResponse)
-def apply_for_trip(
+async def apply_for_trip(
         trip_id: int,
         application: schemas.TripApplicationCreate,
-        db: Session = Depends(get_session),
+        db: AsyncSession = Depends(get_async_session),
         current_user: User = Depends(get_current_user)
 ):
     """Подать заявку на участие в поездке"""
-    trip = db.query(Trip).filter(Trip.id == trip_id).first()
+    result = await db.execute(select(Trip).filter(Trip.id == trip_id))
+    trip = result.scalars().first()
     if not trip:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -141,6 +317,12 @@ def apply_for_trip(
             detail="Trip is not recruiting participants"
         )
 
+    if trip.participant_count >= (trip.max_participants or 0):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Trip is full"
+        )
+
     # Проверка, что пользователь не организатор
     if trip.organizer_id == current_user.id:
         raise HTTPException(
@@ -149,17 +331,18 @@ def apply_for_trip(
         )
 
     # Проверка, что пользователь уже не участвует
-    if current_user in trip.participants:
+    if await is_participant(db, trip_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You are already a participant"
         )
 
     # Проверка существующей заявки
-    existing_application = db.query(TripApplication).filter(
+    result = await db.execute(select(TripApplication).filter(
         TripApplication.trip_id == trip_id,
         TripApplication.applicant_id == current_user.id
-    ).first()
+    ))
+    existing_application = result.scalars().first()
 
     if existing_application:
         raise HTTPException(
@@ -175,10 +358,9 @@ def apply_for_trip(
     )
 
     db.add(db_application)
-    db.commit()
-    db.refresh(db_application)
+    await application_submitted(db, trip_id)
 
-    # Системное сообщение
+    # Системное сообщение - в той же транзакции, что и заявка
     system_message = TripMessage(
         content=f"Пользователь {current_user.username} подал заявку на участие",
         trip_id=trip_id,
@@ -186,31 +368,184 @@ def apply_for_trip(
         is_system=True
     )
     db.add(system_message)
-    db.commit()
+    await db.commit()
+    await db.refresh(db_application)
+    await invalidate_trip(trip_id)
+    recommendation_refresher.user_changed(current_user.id)
 
     return db_application
 
 
+@router.post("/{trip_id}/applications/batch", response_model=schemas.ApplicationBatchResult)
+async def decide_applications_batch(
+        trip_id: int,
+        decision: schemas.ApplicationBatchDecision,
+        atomic: bool = False,
+        db: AsyncSession = Depends(get_async_session),
+        current_user: User = Depends(get_current_user)
+):
+    """Пакетное одобрение или отклонение заявок одной транзакцией (только организатор)"""
+    result = await db.execute(select(Trip).filter(Trip.id == trip_id))
+    trip = result.scalars().first()
+    if not trip:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trip not found"
+        )
+
+    if trip.organizer_id != current_user.id and current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only trip organizer can review applications"
+        )
+
+    result = await db.execute(
+        select(TripApplication, User.username)
+        .join(User, TripApplication.applicant_id == User.id)
+        .filter(TripApplication.trip_id == trip_id, TripApplication.id.in_(decision.application_ids))
+    )
+    found = {application.id: (application, username) for application, username in result.all()}
+
+    approve = decision.status == schemas.ApplicationStatus.APPROVED
+    free_places = (trip.max_participants or 0) - trip.participant_count
+
+    accepted, errors, seen = [], [], set()
+    for index, application_id in enumerate(decision.application_ids):
+        pair = found.get(application_id)
+        if application_id in seen:
+            detail = "Duplicate application id"
+        elif pair is None:
+            detail = "Application not found"
+        elif pair[0].status != ApplicationStatus.PENDING:
+            detail = f"Application is already {pair[0].status.value}"
+        elif approve and free_places <= 0:
+            detail = "Trip is full"
+        else:
+            detail = None
+        if detail:
+            errors.append(schemas.BatchItemError(index=index, detail=detail))
+            continue
+        seen.add(application_id)
+        if approve:
+            free_places -= 1
+        accepted.append(pair)
+
+    if errors and atomic:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=[error.dict() for error in errors]
+        )
+
+    if accepted:
+        new_status = ApplicationStatus(decision.status.value)
+        await db.execute(
+            update(TripApplication)
+            .where(TripApplication.id.in_([application.id for application, _ in accepted]))
+            .values(status=new_status)
+        )
+        await applications_decided(db, trip_id, len(accepted))
+        if approve:
+            try:
+                await add_participants(db, trip_id, [application.applicant_id for application, _ in accepted])
+            except TripFull:
+                # Места заняли параллельным одобрением после чтения поездки
+                await db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Trip is full"
+                )
+            await db.execute(insert(TripMessage), [
+                {
+                    "content": f"Пользователь {username} принят в поездку",
+                    "trip_id": trip_id,
+                    "author_id": current_user.id,
+                    "is_system": True,
+                }
+                for _, username in accepted
+            ])
+        await db.commit()
+
+        if approve:
+            for application, _ in accepted:
+                await invalidate_membership(trip_id, application.applicant_id)
+            recommendation_refresher.user_changed(*(application.applicant_id for application, _ in accepted))
+            recommendation_refresher.trip_changed(trip_id)
+        await invalidate_trip(trip_id)
+
+    return {"updated": [application for application, _ in accepted], "errors": errors}
+
+
 @router.get("/{trip_id}/participants", response_model=List[schemas.UserResponse])
-def get_trip_participants(trip_id: int, db: Session = Depends(get_session)):
+async def get_trip_participants(trip_id: int, request: Request, db: AsyncSession = Depends(get_read_session)):
     """Получить список участников поездки"""
-    trip = db.query(Trip).filter(Trip.id == trip_id).first()
+    key = trip_participants_key(trip_id, await trip_generation(trip_id))
+
+    async def produce(response: Response):
+        result = await db.execute(
+            select(Trip).options(selectinload(Trip.participants)).filter(Trip.id == trip_id)
+        )
+        trip = result.scalars().first()
+        if not trip:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Trip not found"
+            )
+        return trip.participants
+
+    return await cached_json(request, key, render_participants, produce)
+
+
+@router.post("/{trip_id}/leave")
+async def leave_trip(
+        trip_id: int,
+        db: AsyncSession = Depends(get_async_session),
+        current_user: User = Depends(get_current_user)
+):
+    """Покинуть поездку (организатор покинуть поездку не может)"""
+    result = await db.execute(select(Trip).filter(Trip.id == trip_id))
+    trip = result.scalars().first()
     if not trip:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Trip not found"
         )
-    return trip.participants
+
+    if trip.organizer_id == current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Organizer cannot leave their own trip"
+        )
+
+    if not await remove_participant(db, trip_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You are not a participant"
+        )
+
+    db.add(TripMessage(
+        content=f"Пользователь {current_user.username} покинул поездку",
+        trip_id=trip_id,
+        author_id=current_user.id,
+        is_system=True
+    ))
+    await db.commit()
+    await invalidate_membership(trip_id, current_user.id)
+    await invalidate_trip(trip_id)
+    recommendation_refresher.user_changed(current_user.id)
+    recommendation_refresher.trip_changed(trip_id)
+
+    return {"message": "You have left the trip"}
 
 
 @router.post("/{trip_id}/start")
-def start_trip(
+async def start_trip(
         trip_id: int,
-        db: Session = Depends(get_session),
+        db: AsyncSession = Depends(get_async_session),
         current_user: User = Depends(get_current_user)
 ):
     """Начать поездку (только организатор)"""
-    trip = db.query(Trip).filter(Trip.id == trip_id).first()
+    result = await db.execute(select(Trip).filter(Trip.id == trip_id))
+    trip = result.scalars().first()
     if not trip:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -230,6 +565,7 @@ def start_trip(
         )
 
     trip.status = TripStatus.IN_PROGRESS
-    db.commit()
+    await db.commit()
+    await invalidate_trip(trip_id)
 
     return {"message": "Trip started successfully"}
\ No newline at end of file
@@ -1,34 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-
-from database import get_session
-from auth import get_current_user, get_password_hash, require_role
-from models import User, UserRole
+from datetime import datetime
+
+from database import get_async_session
+from replicas import get_read_session
+from ratelimit import SIGNUP_LIMIT, rate_limit
+from auth import get_current_user, hash_password_async, require_role, invalidate_user
+from response_cache import invalidate_trip_details
+from recommendations import RECOMMENDATIONS_TOP_K, recommendation_refresher
+from models import User, UserRole, Trip, TripStatus, TripRecommendation, trip_participants
+from pagination import after_cursor, set_next_cursor
+from serialization import FAST_SERIALIZATION, RowSerializer, select_for, schema_columns, fetch_page
 import schemas
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+user_rows = RowSerializer(schemas.UserResponse)
+recommendation_rows = RowSerializer(schemas.RecommendedTrip)
+
+
+async def invalidate_user_trips(db: AsyncSession, user_id: int):
+    """Профиль показан в карточках и участниках его поездок: сбрасываем их кэш"""
+    organized = select(Trip.id).filter(Trip.organizer_id == user_id)
+    joined = select(trip_participants.c.trip_id).filter(trip_participants.c.user_id == user_id)
+    result = await db.execute(organized.union(joined))
+    await invalidate_trip_details(result.scalars().all())
 
-@router.post("/", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_session)):
+
+# Регистрация хеширует пароль bcrypt: лимит по IP
+@router.post(
+    "/",
+    response_model=schemas.UserResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit(SIGNUP_LIMIT, per="ip"))]
+)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_session)):
     """Регистрация нового пользователя"""
 
-    db_user = db.query(User).filter(User.email == user.email).first()
+    result = await db.execute(select(User).filter(User.email == user.email))
+    db_user = result.scalars().first()
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
 
-    db_user = db.query(User).filter(User.username == user.username).first()
+    result = await db.execute(select(User).filter(User.username == user.username))
+    db_user = result.scalars().first()
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
         )
 
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password_async(user.password)
     db_user = User(
         username=user.username,
         email=user.email,
@@ -39,41 +66,73 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_session)):
     )
 
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    recommendation_refresher.user_changed(db_user.id)
     return db_user
 
 
 @router.get("/me", response_model=schemas.UserResponse)
-def read_current_user(current_user: User = Depends(get_current_user)):
+async def read_current_user(current_user: User = Depends(get_current_user)):
     """Получить информацию о текущем пользователе"""
     return current_user
 
 
+# Предвычисленный top-K (recommendations.py): чтение по индексу (user_id, score)
+@router.get("/me/recommendations", response_model=List[schemas.RecommendedTrip])
+async def read_recommendations(
+        limit: int = Query(20, ge=1, le=RECOMMENDATIONS_TOP_K),
+        db: AsyncSession = Depends(get_read_session),
+        current_user: User = Depends(get_current_user)
+):
+    """Рекомендованные поездки для текущего пользователя"""
+    query = (
+        select(*schema_columns(schemas.TripResponse, Trip), TripRecommendation.score)
+        .join(TripRecommendation, TripRecommendation.trip_id == Trip.id)
+        .filter(
+            TripRecommendation.user_id == current_user.id,
+            # Рекомендация могла устареть до пересчёта
+            Trip.status == TripStatus.RECRUITING,
+            Trip.start_date > datetime.now(),
+            Trip.participant_count < Trip.max_participants
+        )
+        .order_by(TripRecommendation.score.desc(), Trip.id)
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    trips = result.all()
+    if FAST_SERIALIZATION:
+        return recommendation_rows.response(trips)
+    return trips
+
+
 @router.put("/me", response_model=schemas.UserResponse)
-def update_current_user(
+async def update_current_user(
         user_update: schemas.UserUpdate,
-        db: Session = Depends(get_session),
+        db: AsyncSession = Depends(get_async_session),
         current_user: User = Depends(get_current_user)
 ):
     """Обновить информацию о текущем пользователе"""
     update_data = user_update.dict(exclude_unset=True)
 
     if "password" in update_data:
-        update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+        update_data["hashed_password"] = await hash_password_async(update_data.pop("password"))
 
     for key, value in update_data.items():
         setattr(current_user, key, value)
 
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await invalidate_user(current_user.id)
+    await invalidate_user_trips(db, current_user.id)
+    await db.refresh(current_user)
     return current_user
 
 
 @router.get("/{user_id}", response_model=schemas.UserResponse)
-def read_user(user_id: int, db: Session = Depends(get_session)):
+async def read_user(user_id: int, db: AsyncSession = Depends(get_read_session)):
     """Получить информацию о пользователе по ID"""
-    user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).filter(User.id == user_id))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -83,29 +142,42 @@ def read_user(user_id: int, db: Session = Depends(get_session)):
 
 
 @router.get("/", response_model=List[schemas.UserResponse])
-def list_users(
+async def list_users(
+        response: Response,
         skip: int = 0,
         limit: int = 100,
+        cursor: Optional[str] = None,
         role: Optional[UserRole] = None,
-        db: Session = Depends(get_session)
+        db: AsyncSession = Depends(get_read_session)
 ):
     """Список пользователей с фильтрацией"""
-    query = db.query(User)
+    query = select_for(schemas.UserResponse, User)
 
     if role:
         query = query.filter(User.role == role)
 
-    return query.offset(skip).limit(limit).all()
+    if cursor:
+        query = query.filter(after_cursor((User.id,), cursor, (int,)))
+    else:
+        query = query.offset(skip)
+
+    result = await db.execute(query.order_by(User.id).limit(limit))
+    users = fetch_page(result)
+    set_next_cursor(response, users, limit, lambda user: (user.id,))
+    if FAST_SERIALIZATION:
+        return user_rows.response(users, headers=response.headers)
+    return users
 
 
 @router.patch("/{user_id}/verify")
-def verify_user(
+async def verify_user(
         user_id: int,
-        db: Session = Depends(get_session),
+        db: AsyncSession = Depends(get_async_session),
         admin: User = Depends(require_role("admin"))
 ):
     """Верификация пользователя (только для админа)"""
-    user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).filter(User.id == user_id))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -113,5 +185,7 @@ def verify_user(
         )
 
     user.is_verified = True
-    db.commit()
+    await db.commit()
+    await invalidate_user(user_id)
+    await invalidate_user_trips(db, user_id)
     return {"message": "User verified successfully"}